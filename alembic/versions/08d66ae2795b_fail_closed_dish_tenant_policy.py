@@ -0,0 +1,33 @@
+"""Make the dish tenant isolation policy fail closed
+
+Revision ID: 08d66ae2795b
+Revises: ebb1702c449a
+Create Date: 2026-10-18 10:12:41.208533
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '08d66ae2795b'
+down_revision: Union[str, None] = 'ebb1702c449a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A connection pinned to no tenant no longer sees every tenant's dishes: the cast of an unset or empty
+    # app.tenant_id fails, so a code path that forgets to pin its connection errors instead of leaking
+    op.execute("DROP POLICY IF EXISTS dish_tenant_isolation ON dish")
+    op.execute("CREATE POLICY dish_tenant_isolation ON dish USING (tenant_id = current_setting('app.tenant_id')::uuid)")
+
+
+def downgrade() -> None:
+    op.execute("DROP POLICY IF EXISTS dish_tenant_isolation ON dish")
+    op.execute("""
+        CREATE POLICY dish_tenant_isolation ON dish
+        USING (NULLIF(current_setting('app.tenant_id', true), '') IS NULL
+               OR tenant_id = NULLIF(current_setting('app.tenant_id', true), '')::uuid)
+    """)
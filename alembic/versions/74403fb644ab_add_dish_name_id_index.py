@@ -0,0 +1,28 @@
+"""Add dish (name, id) index for keyset pagination
+
+Revision ID: 74403fb644ab
+Revises: a828396cb28e
+Create Date: 2026-10-17 20:52:40.118230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '74403fb644ab'
+down_revision: Union[str, None] = 'a828396cb28e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # (name, id) serves both ORDER BY name, id and the keyset predicate; it also covers lookups by name
+    op.execute("CREATE INDEX IF NOT EXISTS idx_dish_name_id ON dish (name, id)")
+    op.execute("DROP INDEX IF EXISTS idx_dish_name")
+
+
+def downgrade() -> None:
+    op.execute("CREATE INDEX IF NOT EXISTS idx_dish_name ON dish (name)")
+    op.execute("DROP INDEX IF EXISTS idx_dish_name_id")
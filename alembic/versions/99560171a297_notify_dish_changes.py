@@ -0,0 +1,43 @@
+"""Notify dish changes
+
+Revision ID: 99560171a297
+Revises: dbf2a14ebba4
+Create Date: 2026-10-17 21:15:02.730118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '99560171a297'
+down_revision: Union[str, None] = 'dbf2a14ebba4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Every write to dish, whoever makes it, is published on the dish_changes channel so that
+    # each worker can keep its in-memory search index current
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_dish_change() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('dish_changes', json_build_object(
+                'op', TG_OP,
+                'id', CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER dish_change_notify
+        AFTER INSERT OR UPDATE OR DELETE ON dish
+        FOR EACH ROW EXECUTE FUNCTION notify_dish_change()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS dish_change_notify ON dish")
+    op.execute("DROP FUNCTION IF EXISTS notify_dish_change()")
@@ -0,0 +1,54 @@
+"""Move dish images to blob store
+
+Revision ID: a828396cb28e
+Revises: 9e5b21a744c6
+Create Date: 2026-10-17 20:45:12.318407
+
+"""
+from typing import Sequence, Union
+import base64
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.blob_store import blob_store, is_digest
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a828396cb28e'
+down_revision: Union[str, None] = '9e5b21a744c6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 100
+
+
+def upgrade() -> None:
+    # Decode every inline base64 image into the blob store and keep only its SHA-256 on the row
+    conn = op.get_bind()
+    last_id = None
+    while True:
+        rows = conn.execute(sa.text("""
+            SELECT id, image FROM dish
+            WHERE image IS NOT NULL AND (CAST(:last_id AS UUID) IS NULL OR id > CAST(:last_id AS UUID))
+            ORDER BY id LIMIT :limit
+        """), {"last_id": last_id, "limit": BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        for dish_id, image in rows:
+            if is_digest(image):
+                continue
+            digest = blob_store.put_sync(base64.b64decode(image)) if image else None
+            conn.execute(sa.text("UPDATE dish SET image = :image WHERE id = :id"), {"image": digest, "id": dish_id})
+        last_id = str(rows[-1][0])
+    op.alter_column('dish', 'image', existing_type=sa.Text(), type_=sa.String(length=64), existing_nullable=True)
+
+
+def downgrade() -> None:
+    op.alter_column('dish', 'image', existing_type=sa.String(length=64), type_=sa.Text(), existing_nullable=True)
+    conn = op.get_bind()
+    rows = conn.execute(sa.text("SELECT id, image FROM dish WHERE image IS NOT NULL")).fetchall()
+    for dish_id, digest in rows:
+        if is_digest(digest) and blob_store.exists(digest):
+            image = base64.b64encode(blob_store.read_sync(digest)).decode('utf-8')
+            conn.execute(sa.text("UPDATE dish SET image = :image WHERE id = :id"), {"image": image, "id": dish_id})
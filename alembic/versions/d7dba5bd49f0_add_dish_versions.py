@@ -0,0 +1,69 @@
+"""Add dish row and table versions
+
+Revision ID: d7dba5bd49f0
+Revises: 99560171a297
+Create Date: 2026-10-17 21:32:40.184263
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7dba5bd49f0'
+down_revision: Union[str, None] = '99560171a297'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Row version and updated_at are the validators of a single dish (strong ETag / Last-Modified)
+    op.add_column('dish', sa.Column('version', sa.Integer(), server_default=sa.text('1'), nullable=False))
+    op.execute("""
+        CREATE OR REPLACE FUNCTION touch_row() RETURNS trigger AS $$
+        BEGIN
+            NEW.version := OLD.version + 1;
+            NEW.updated_at := CURRENT_TIMESTAMP;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER dish_touch
+        BEFORE UPDATE ON dish
+        FOR EACH ROW EXECUTE FUNCTION touch_row()
+    """)
+    # One version per table, bumped by every writing statement, validates list and search responses
+    # without reading them; unlike max(updated_at) it also changes on deletes
+    op.create_table(
+        'table_version',
+        sa.Column('table_name', sa.String(length=63), primary_key=True),
+        sa.Column('version', sa.BigInteger(), server_default=sa.text('1'), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    )
+    op.execute("INSERT INTO table_version (table_name) VALUES ('dish')")
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE table_name = TG_TABLE_NAME;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER dish_version_bump
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON dish
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS dish_version_bump ON dish")
+    op.execute("DROP FUNCTION IF EXISTS bump_table_version()")
+    op.drop_table('table_version')
+    op.execute("DROP TRIGGER IF EXISTS dish_touch ON dish")
+    op.execute("DROP FUNCTION IF EXISTS touch_row()")
+    op.drop_column('dish', 'version')
@@ -0,0 +1,41 @@
+"""Add dish full-text and trigram search
+
+Revision ID: dbf2a14ebba4
+Revises: 74403fb644ab
+Create Date: 2026-10-17 21:03:18.562904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'dbf2a14ebba4'
+down_revision: Union[str, None] = '74403fb644ab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Name terms rank above description terms; kept in sync by Postgres on every insert and update
+    op.execute("""
+        ALTER TABLE dish ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'B')
+        ) STORED
+    """)
+    # Built without blocking writes, which CONCURRENTLY cannot do inside the migration's transaction
+    with op.get_context().autocommit_block():
+        op.create_index("idx_dish_search_vector", "dish", ["search_vector"], postgresql_using="gin",
+                        postgresql_concurrently=True)
+        op.create_index("idx_dish_name_trgm", "dish", ["name"], postgresql_using="gin",
+                        postgresql_ops={"name": "gin_trgm_ops"}, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("idx_dish_name_trgm", table_name="dish", postgresql_concurrently=True, if_exists=True)
+        op.drop_index("idx_dish_search_vector", table_name="dish", postgresql_concurrently=True, if_exists=True)
+    op.execute("ALTER TABLE dish DROP COLUMN IF EXISTS search_vector")
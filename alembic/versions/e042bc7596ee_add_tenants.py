@@ -0,0 +1,159 @@
+"""Add tenants
+
+Revision ID: e042bc7596ee
+Revises: ebda9db8cd62
+Create Date: 2026-10-17 22:41:12.377105
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e042bc7596ee'
+down_revision: Union[str, None] = 'ebda9db8cd62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # One row per restaurant; everything that exists so far belongs to the default one
+    op.create_table(
+        'tenant',
+        sa.Column('id', sa.UUID(), server_default=sa.text('uuid_generate_v4()'), primary_key=True),
+        sa.Column('slug', sa.String(length=63), nullable=False, unique=True),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    )
+    op.execute("INSERT INTO tenant (slug, name) VALUES ('default', 'The Dancing Pony')")
+    default_tenant = sa.text("(SELECT id FROM tenant WHERE slug = 'default')")
+    for table in ('dish', 'user'):
+        op.add_column(table, sa.Column('tenant_id', sa.UUID(), sa.ForeignKey('tenant.id'), nullable=True))
+        op.execute(f'UPDATE "{table}" SET tenant_id = {default_tenant}')
+        op.alter_column(table, 'tenant_id', nullable=False)
+
+    # Emails are unique per tenant, and every lookup is scoped to one, so indexes lead with tenant_id
+    op.execute('ALTER TABLE "user" DROP CONSTRAINT IF EXISTS user_email_key')
+    op.execute('DROP INDEX IF EXISTS idx_user_email')
+    op.execute('DROP INDEX IF EXISTS ix_user_email')
+    op.create_index('idx_user_tenant_email', 'user', ['tenant_id', 'email'], unique=True)
+    op.drop_index('idx_dish_name_id', table_name='dish')
+    op.create_index('idx_dish_tenant_name_id', 'dish', ['tenant_id', 'name', 'id'])
+
+    # Table versions per tenant, so one restaurant's writes do not invalidate every other's lists
+    op.execute("DROP TRIGGER IF EXISTS dish_version_bump ON dish")
+    op.add_column('table_version', sa.Column('tenant_id', sa.UUID(), sa.ForeignKey('tenant.id', ondelete='CASCADE'), nullable=True))
+    op.execute(f"UPDATE table_version SET tenant_id = {default_tenant}")
+    op.alter_column('table_version', 'tenant_id', nullable=False)
+    op.drop_constraint('table_version_pkey', 'table_version', type_='primary')
+    op.create_primary_key('table_version_pkey', 'table_version', ['table_name', 'tenant_id'])
+    # Transition tables are limited to one event per trigger, so each event has its own
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE table_name = TG_TABLE_NAME;
+            ELSE
+                INSERT INTO table_version (table_name, tenant_id)
+                SELECT DISTINCT TG_TABLE_NAME, tenant_id FROM changed
+                ON CONFLICT (table_name, tenant_id)
+                DO UPDATE SET version = table_version.version + 1, updated_at = CURRENT_TIMESTAMP;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for event, transition in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        op.execute(f"""
+            CREATE TRIGGER dish_version_bump_{event.lower()}
+            AFTER {event} ON dish REFERENCING {transition} TABLE AS changed
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()
+        """)
+    op.execute("""
+        CREATE TRIGGER dish_version_bump_truncate
+        AFTER TRUNCATE ON dish
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION create_tenant_versions() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO table_version (table_name, tenant_id) VALUES ('dish', NEW.id);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER tenant_versions_create
+        AFTER INSERT ON tenant
+        FOR EACH ROW EXECUTE FUNCTION create_tenant_versions()
+    """)
+
+    # Change notifications say which tenant's cache and index entries to drop
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_dish_change() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('dish_changes', json_build_object(
+                'op', TG_OP,
+                'tenant_id', CASE WHEN TG_OP = 'DELETE' THEN OLD.tenant_id ELSE NEW.tenant_id END,
+                'id', CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    # Optional row-level security, enabled with ALTER TABLE dish ENABLE/FORCE ROW LEVEL SECURITY (see README)
+    op.execute("""
+        CREATE POLICY dish_tenant_isolation ON dish
+        USING (NULLIF(current_setting('app.tenant_id', true), '') IS NULL
+               OR tenant_id = NULLIF(current_setting('app.tenant_id', true), '')::uuid)
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP POLICY IF EXISTS dish_tenant_isolation ON dish")
+    op.execute("ALTER TABLE dish DISABLE ROW LEVEL SECURITY")
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_dish_change() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('dish_changes', json_build_object(
+                'op', TG_OP,
+                'id', CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS tenant_versions_create ON tenant")
+    op.execute("DROP FUNCTION IF EXISTS create_tenant_versions()")
+    for event in ('insert', 'update', 'delete', 'truncate'):
+        op.execute(f"DROP TRIGGER IF EXISTS dish_version_bump_{event} ON dish")
+    op.execute("DELETE FROM table_version WHERE tenant_id <> (SELECT id FROM tenant WHERE slug = 'default')")
+    op.drop_constraint('table_version_pkey', 'table_version', type_='primary')
+    op.drop_column('table_version', 'tenant_id')
+    op.create_primary_key('table_version_pkey', 'table_version', ['table_name'])
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE table_name = TG_TABLE_NAME;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER dish_version_bump
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON dish
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()
+    """)
+    op.drop_index('idx_dish_tenant_name_id', table_name='dish')
+    op.create_index('idx_dish_name_id', 'dish', ['name', 'id'])
+    op.drop_index('idx_user_tenant_email', table_name='user')
+    op.create_unique_constraint('user_email_key', 'user', ['email'])
+    op.create_index('idx_user_email', 'user', ['email'])
+    op.drop_column('user', 'tenant_id')
+    op.drop_column('dish', 'tenant_id')
+    op.drop_table('tenant')
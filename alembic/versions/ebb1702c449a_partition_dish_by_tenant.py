@@ -0,0 +1,81 @@
+"""Partition dish by tenant
+
+Revision ID: ebb1702c449a
+Revises: e042bc7596ee
+Create Date: 2026-10-17 23:58:04.512377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from db.partitions import (COLUMNS_SQL, DISH_PARTITIONS, NEXT_STATE_SQL, ROW_SECURITY_SQL,
+                           prepare_statements, swap_statements)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ebb1702c449a'
+down_revision: Union[str, None] = 'e042bc7596ee'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def record_rating_delta(with_tenant: bool) -> str:
+    key = "tenant_id, dish_id" if with_tenant else "dish_id"
+    new = ", ".join(f"NEW.{column}" for column in key.split(", "))
+    old = ", ".join(f"OLD.{column}" for column in key.split(", "))
+    return f"""
+        CREATE OR REPLACE FUNCTION record_rating_delta() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO rating_delta ({key}, count_delta, sum_delta) VALUES ({new}, 1, NEW.rating);
+            ELSIF TG_OP = 'UPDATE' THEN
+                INSERT INTO rating_delta ({key}, count_delta, sum_delta) VALUES ({new}, 0, NEW.rating - OLD.rating);
+            ELSE
+                INSERT INTO rating_delta ({key}, count_delta, sum_delta) VALUES ({old}, -1, -OLD.rating);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """
+
+
+def move_dish(partitions: int) -> None:
+    """
+    Replaces dish with a copy in the given layout, reusing a dish_next prepared and backfilled online with
+    db/partitions.py if there is one, and copying the rows inside this transaction otherwise.
+    """
+    bind = op.get_bind()
+    columns = bind.execute(sa.text(COLUMNS_SQL)).scalars().all()
+    exists, backfilled = bind.execute(sa.text(NEXT_STATE_SQL)).one()
+    if not exists:
+        for statement in prepare_statements(columns, partitions):
+            op.execute(statement)
+    row_security = tuple(bind.execute(sa.text(ROW_SECURITY_SQL)).one())
+    for statement in swap_statements(columns, row_security, bool(backfilled)):
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    # Ratings carry the partition key of their dish, for the composite foreign key and partition-pruned folds
+    for table in ('rating', 'rating_delta'):
+        op.add_column(table, sa.Column('tenant_id', sa.UUID(), nullable=True))
+        op.execute(f"UPDATE {table} SET tenant_id = dish.tenant_id FROM dish WHERE dish.id = {table}.dish_id")
+    # Deltas of dishes deleted since they were logged have nothing left to fold into
+    op.execute("DELETE FROM rating_delta WHERE tenant_id IS NULL")
+    for table in ('rating', 'rating_delta'):
+        op.alter_column(table, 'tenant_id', nullable=False)
+    op.execute(record_rating_delta(with_tenant=True))
+    move_dish(DISH_PARTITIONS)
+
+
+def downgrade() -> None:
+    move_dish(0)
+    op.drop_constraint('rating_dish_fkey', 'rating', type_='foreignkey')
+    op.drop_constraint('dish_pkey', 'dish', type_='primary')
+    op.create_primary_key('dish_pkey', 'dish', ['id'])
+    op.create_foreign_key('rating_dish_id_fkey', 'rating', 'dish', ['dish_id'], ['id'], ondelete='CASCADE')
+    op.execute(record_rating_delta(with_tenant=False))
+    op.drop_column('rating_delta', 'tenant_id')
+    op.drop_column('rating', 'tenant_id')
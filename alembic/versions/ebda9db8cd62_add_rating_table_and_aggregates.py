@@ -0,0 +1,71 @@
+"""Add rating table and aggregates
+
+Revision ID: ebda9db8cd62
+Revises: d7dba5bd49f0
+Create Date: 2026-10-17 21:58:06.904512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ebda9db8cd62'
+down_revision: Union[str, None] = 'd7dba5bd49f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # One rating per user and dish; rating again replaces it
+    op.create_table(
+        'rating',
+        sa.Column('dish_id', sa.UUID(), sa.ForeignKey('dish.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('user_id', sa.UUID(), sa.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('rating', sa.Numeric(precision=2, scale=1), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    )
+    # Append-only log of changes to the aggregates; writers never touch the dish row
+    op.create_table(
+        'rating_delta',
+        sa.Column('id', sa.BigInteger(), sa.Identity(), primary_key=True),
+        sa.Column('dish_id', sa.UUID(), nullable=False),
+        sa.Column('count_delta', sa.Integer(), nullable=False),
+        sa.Column('sum_delta', sa.Numeric(precision=12, scale=1), nullable=False),
+    )
+    # Running aggregates on the dish row; dish.rating becomes their mean
+    op.add_column('dish', sa.Column('rating_count', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('dish', sa.Column('rating_sum', sa.Numeric(precision=12, scale=1), server_default=sa.text('0'), nullable=False))
+    # Existing ratings have no user, so each one is kept as a single anonymous vote
+    op.execute("UPDATE dish SET rating_count = 1, rating_sum = rating WHERE rating IS NOT NULL")
+    op.execute("""
+        CREATE OR REPLACE FUNCTION record_rating_delta() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO rating_delta (dish_id, count_delta, sum_delta) VALUES (NEW.dish_id, 1, NEW.rating);
+            ELSIF TG_OP = 'UPDATE' THEN
+                INSERT INTO rating_delta (dish_id, count_delta, sum_delta) VALUES (NEW.dish_id, 0, NEW.rating - OLD.rating);
+            ELSE
+                INSERT INTO rating_delta (dish_id, count_delta, sum_delta) VALUES (OLD.dish_id, -1, -OLD.rating);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER rating_delta_record
+        AFTER INSERT OR UPDATE OR DELETE ON rating
+        FOR EACH ROW EXECUTE FUNCTION record_rating_delta()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS rating_delta_record ON rating")
+    op.execute("DROP FUNCTION IF EXISTS record_rating_delta()")
+    op.drop_column('dish', 'rating_sum')
+    op.drop_column('dish', 'rating_count')
+    op.drop_table('rating_delta')
+    op.drop_table('rating')
@@ -1,71 +1,78 @@
-from datetime import datetime
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import get_db
-from app.models import User
-from app.user_manager import get_user_by_email, verify_password
-from app.failed_attempts import failed_attempts, MAX_FAILED_ATTEMPTS, BLOCK_TIME
+from app.models import Tenant, User
+from app.tenants import get_tenant
+from app.user_manager import credential_key, get_cached_user_by_email, verify_password
+from app.failed_attempts import lockout_store, email_key, ip_key, MAX_FAILED_ATTEMPTS, MAX_FAILED_ATTEMPTS_PER_IP, BLOCK_TIME
+from app.tracing import traced
 from loguru import logger
+from prometheus_client import Histogram
 
 security = HTTPBasic()
 
-async def get_current_user(credentials: HTTPBasicCredentials = Depends(security), db: AsyncSession = Depends(get_db)) -> User:
+# Password checks dominate the cost of a request that misses the credential cache
+AUTH_LATENCY = Histogram('auth_duration_seconds', 'Authentication latency in seconds', ['method'])
+
+@traced("auth", AUTH_LATENCY)
+async def get_current_user(request: Request, tenant: Tenant = Depends(get_tenant), credentials: HTTPBasicCredentials = Depends(security)) -> User:
     """
     Get the current user based on the provided credentials.
 
+    Users are looked up within the request's tenant, so the same email may be registered with several
+    restaurants. Lockout counters are checked before anything else, so a locked out email or client address
+    never reaches the database or bcrypt. The user is read through the in-process user cache, so a database
+    session is only opened on a cache miss.
+
     Args:
+        request (Request): request, whose client address is rate limited
+        tenant (Tenant, optional): tenant the request is for. Defaults to Depends(get_tenant).
         credentials (HTTPBasicCredentials, optional): Defaults to Depends(security).
-        db (AsyncSession, optional): Defaults to Depends(get_db).
 
     Raises:
-        HTTPException: incorrect email or password
         HTTPException: account locked due to too many failed login attempts. Please try again later.
+        HTTPException: too many failed login attempts from this address. Please try again later.
         HTTPException: incorrect email or password
 
     Returns:
         User: current user
     """
-    user = await get_user_by_email(db, credentials.username)  # Repository Pattern - abstracting database access
-
-    if user is None:
-        logger.error(f"User with email {credentials.username} not found")
+    keys = (email_key(tenant.id, credentials.username), ip_key(request.client.host if request.client else "unknown"))
+    email_failures, ip_failures = await lockout_store.failures(*keys)
+    if email_failures >= MAX_FAILED_ATTEMPTS:
+        logger.error("Account locked for user {}", credentials.username)
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect email or password",
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Account locked due to too many failed login attempts. Please try again later.",
             headers={"WWW-Authenticate": "Basic"},
         )
+    if ip_failures >= MAX_FAILED_ATTEMPTS_PER_IP:
+        logger.error("Too many failed logins from {}", keys[1])
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts. Please try again later.",
+            headers={"WWW-Authenticate": "Basic", "Retry-After": str(int(BLOCK_TIME.total_seconds()))},
+        )
+
+    user = await get_cached_user_by_email(tenant.id, credentials.username)  # Repository Pattern - abstracting database access
 
-    if credentials.username in failed_attempts:
-        failed_attempt_info = failed_attempts[credentials.username]
-        if failed_attempt_info['count'] >= MAX_FAILED_ATTEMPTS:
-            logger.error(f"Account locked for user {credentials.username}")
-            if datetime.utcnow() - failed_attempt_info['last_attempt'] < BLOCK_TIME:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="Account locked due to too many failed login attempts. Please try again later.",
-                    headers={"WWW-Authenticate": "Basic"},
-                )
-            else:
-                logger.info(f"Account unlocked for user {credentials.username}")
-                del failed_attempts[credentials.username]  # State Management - handling the state of failed attempts
+    if user is None:
+        logger.error("User with email {} not found", credentials.username)
+    elif not await verify_password(credentials.password, user.hashed_password, cache_key=credential_key(tenant.id, credentials.username)):  # Strategy Pattern - different password verification strategies
+        logger.error("Incorrect password for user {}", credentials.username)
+        user = None
 
-    if not await verify_password(credentials.password, user.hashed_password):  # Strategy Pattern - different password verification strategies
-        if credentials.username not in failed_attempts:
-            logger.error(f"Incorrect password for user {credentials.username}")
-            failed_attempts[credentials.username] = {'count': 1, 'last_attempt': datetime.utcnow()}  # State Management
-        else:
-            logger.error(f"Incorrect password for user {credentials.username}")
-            failed_attempts[credentials.username]['count'] += 1  # State Management
-            failed_attempts[credentials.username]['last_attempt'] = datetime.utcnow()  # State Management
+    if user is None:
+        # Unknown emails count too, so they cannot be told apart from wrong passwords or probed for free
+        await lockout_store.record_failure(*keys)  # State Management - handling the state of failed attempts
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Basic"},
         )
 
-    if credentials.username in failed_attempts:
-        logger.info(f"Login successful for user {credentials.username}")
-        del failed_attempts[credentials.username]  # State Management
-    
+    if email_failures:
+        logger.info("Login successful for user {}", credentials.username)
+        # Only the account is cleared: logging into one account must not reset the address' guesses at others
+        await lockout_store.reset(keys[0])  # State Management
+
     return user
@@ -0,0 +1,161 @@
+from pathlib import Path
+from typing import NamedTuple, Optional
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from app.cache import TTLCache
+
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "blobs")
+# Content-Types remembered per digest; a blob never changes, so neither does its type
+BLOB_MEDIA_TYPE_CACHE_SIZE = int(os.getenv("BLOB_MEDIA_TYPE_CACHE_SIZE", 10000))
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Magic numbers of the image formats we accept, used to pick a Content-Type without storing one
+_MEDIA_TYPES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+def sniff_media_type(head: bytes) -> str:
+    """
+    Returns the Content-Type of a blob given its first 12 bytes.
+    """
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for magic, media_type in _MEDIA_TYPES:
+        if head.startswith(magic):
+            return media_type
+    return "application/octet-stream"
+
+class StagedBlob(NamedTuple):
+    """
+    A blob written to a temporary file beside its path, not yet visible under its digest.
+    """
+    digest: str
+    tmp_path: Optional[str]  # None if the blob was already stored
+
+def is_digest(value: Optional[str]) -> bool:
+    """
+    Returns True if the value looks like a blob reference (a lowercase hex SHA-256).
+    """
+    return value is not None and _DIGEST_RE.match(value) is not None
+
+class BlobStore:
+    """
+    Content-addressed store for binary blobs such as dish images.
+
+    Each blob is written once under its SHA-256 digest (fanned out as ab/cd/abcd...), so identical
+    images are stored a single time and a digest can be used as a strong ETag. Its Content-Type is
+    worked out when it is stored, or on first use for blobs stored by another process, and remembered.
+    """
+    def __init__(self, root: str = BLOB_STORE_DIR, media_type_cache_size: int = BLOB_MEDIA_TYPE_CACHE_SIZE):
+        self.root = Path(root)
+        self._media_types = TTLCache("blob_media_type", ttl=float("inf"), max_size=media_type_cache_size)
+
+    def path(self, digest: str) -> Path:
+        """
+        Returns the filesystem path of a blob.
+        """
+        if not is_digest(digest):
+            raise ValueError(f"Invalid blob digest {digest!r}")
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def exists(self, digest: str) -> bool:
+        """
+        Checks whether a blob is present in the store.
+        """
+        return self.path(digest).is_file()
+
+    def stage_sync(self, data: bytes) -> StagedBlob:
+        """
+        Writes the bytes to a temporary file beside their blob without making them visible; publish or discard it afterwards.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        self._media_types.set(digest, sniff_media_type(data[:12]))
+        target = self.path(digest)
+        if target.is_file():
+            return StagedBlob(digest, None)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return StagedBlob(digest, tmp_path)
+
+    def publish_sync(self, staged: StagedBlob) -> None:
+        """
+        Moves a staged blob into place; renaming it there means readers never observe a partial blob.
+        """
+        if staged.tmp_path is not None:
+            os.replace(staged.tmp_path, self.path(staged.digest))
+
+    def discard_sync(self, staged: StagedBlob) -> None:
+        """
+        Removes a staged blob that is not going to be published.
+        """
+        if staged.tmp_path is not None and os.path.exists(staged.tmp_path):
+            os.unlink(staged.tmp_path)
+
+    def put_sync(self, data: bytes) -> str:
+        """
+        Stores the bytes if they are not already present and returns their digest.
+        """
+        staged = self.stage_sync(data)
+        try:
+            self.publish_sync(staged)
+        except BaseException:
+            self.discard_sync(staged)
+            raise
+        return staged.digest
+
+    async def put(self, data: bytes) -> str:
+        """
+        Stores the bytes off the event loop and returns their digest.
+        """
+        return await asyncio.to_thread(self.put_sync, data)
+
+    async def stage(self, data: bytes) -> StagedBlob:
+        """
+        Stages the bytes off the event loop, for a blob only to be published once whatever references it is committed.
+        """
+        return await asyncio.to_thread(self.stage_sync, data)
+
+    async def publish(self, staged: StagedBlob) -> None:
+        """
+        Publishes a staged blob off the event loop.
+        """
+        await asyncio.to_thread(self.publish_sync, staged)
+
+    def read_sync(self, digest: str) -> bytes:
+        """
+        Reads a whole blob into memory.
+        """
+        return self.path(digest).read_bytes()
+
+    def media_type_sync(self, digest: str) -> str:
+        """
+        Sniffs the Content-Type of a blob from its first bytes.
+        """
+        with open(self.path(digest), "rb") as blob_file:
+            return sniff_media_type(blob_file.read(12))
+
+    async def media_type(self, digest: str) -> str:
+        """
+        Returns the Content-Type of a blob, only reading it off the event loop the first time it is asked for.
+        """
+        media_type = self._media_types.get(digest)
+        if media_type is None:
+            media_type = await asyncio.to_thread(self.media_type_sync, digest)
+            self._media_types.set(digest, media_type)
+        return media_type
+
+# Singleton Pattern - a single blob store shared by the application
+blob_store = BlobStore()
@@ -0,0 +1,171 @@
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple, Union
+import base64
+import binascii
+import csv
+import json
+import os
+import uuid
+from pydantic import BaseModel, Field, ValidationError
+
+# Rows validated and copied into the database per COPY
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", 1000))
+# Longest line (or CSV record) read, in bytes; a longer one is reported as a row error and skipped
+BULK_MAX_LINE_SIZE = int(os.getenv("BULK_MAX_LINE_SIZE", 16 * 1024 * 1024))
+# Row errors kept for the report; an import with more is still rejected as a whole
+MAX_REPORTED_ERRORS = 100
+
+# Supported bulk formats and their media types
+BULK_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+class RowError(NamedTuple):
+    """
+    A rejected row: its line number in the input (None for a whole batch) and why.
+    """
+    line: Optional[int]
+    error: str
+
+class BulkImportError(Exception):
+    """
+    Raised when an import is rolled back, carrying the errors that caused it.
+    """
+    def __init__(self, errors: List[RowError]):
+        super().__init__(f"{len(errors)} invalid rows")
+        self.errors = errors
+
+class DishImport(BaseModel):
+    """
+    One dish of a bulk import, in the shape GET /dishes:export produces.
+
+    Limits mirror the dish table, so a valid row never fails inside COPY.
+    """
+    id: Optional[uuid.UUID] = None
+    name: str = Field(min_length=1, max_length=100)
+    description: str
+    price: float = Field(ge=0, lt=10 ** 8)
+    image: Optional[str] = None  # blob reference from an export, or a base64 encoded image
+
+def decode_image(value: str) -> bytes:
+    """
+    Decode a base64 image, raising ValueError if it is not valid base64.
+    """
+    try:
+        return base64.b64decode(value, validate=True)
+    except binascii.Error as e:
+        raise ValueError(f"image is neither a stored blob reference nor base64: {e}")
+
+def _decode(line: bytes, max_line_size: int) -> Union[str, ValueError]:
+    if len(line) > max_line_size:
+        return ValueError(f"line longer than {max_line_size} bytes")
+    try:
+        return line.decode("utf-8", errors="strict")
+    except UnicodeDecodeError as e:
+        return ValueError(f"not valid UTF-8: {e}")
+
+async def read_lines(chunks: AsyncIterator[bytes], max_line_size: int = BULK_MAX_LINE_SIZE) -> AsyncIterator[Tuple[int, Union[str, ValueError]]]:
+    """
+    Split a byte stream into numbered text lines without reading it all into memory.
+
+    A line that is not UTF-8 or is longer than max_line_size bytes is yielded as a ValueError in its place,
+    to be reported as that row's error; at most max_line_size bytes of a line are ever buffered.
+    """
+    buffer = b""
+    line_number = 0
+    skipping = False  # dropping the rest of a line already reported as too long
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if skipping:
+                skipping = False
+                continue
+            yield line_number, _decode(line, max_line_size)
+        if len(buffer) > max_line_size:
+            if not skipping:
+                yield line_number + 1, ValueError(f"line longer than {max_line_size} bytes")
+                skipping = True
+            buffer = b""
+    if buffer and not skipping:
+        yield line_number + 1, _decode(buffer, max_line_size)
+
+async def parse_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Parse newline delimited JSON into (line number, object) pairs; a malformed line yields its ValueError.
+    """
+    async for line_number, line in read_lines(chunks):
+        if isinstance(line, ValueError):
+            yield line_number, line
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+
+async def parse_csv(chunks: AsyncIterator[bytes], max_record_size: int = BULK_MAX_LINE_SIZE) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Parse CSV with a header row into (line number, dict) pairs. Quoted values may span lines;
+    empty values are read as missing.
+    """
+    header: Optional[List[str]] = None
+    record, start = "", 0
+    async for line_number, line in read_lines(chunks, max_record_size):
+        if not record:
+            start = line_number
+        if isinstance(line, ValueError):
+            yield start, line
+            record = ""
+            continue
+        record += line + "\n"
+        if len(record) > max_record_size:
+            yield start, ValueError(f"record longer than {max_record_size} characters")
+            record = ""
+            continue
+        if record.count('"') % 2:
+            continue  # inside a quoted value that continues on the next line
+        try:
+            values = next(csv.reader([record.rstrip("\r\n")]), [])
+        except csv.Error as e:
+            yield start, ValueError(str(e))
+            record = ""
+            continue
+        record = ""
+        if not values:
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield start, ValueError(f"expected {len(header)} values, got {len(values)}")
+            continue
+        yield start, {name: value for name, value in zip(header, values) if value != ""}
+    if record:
+        yield start, ValueError("unterminated quoted value")
+
+def parse_rows(chunks: AsyncIterator[bytes], format: str) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Parse a bulk import stream in the given format.
+    """
+    if format == "csv":
+        return parse_csv(chunks)
+    return parse_ndjson(chunks)
+
+def validate_row(row: Any) -> DishImport:
+    """
+    Validate one parsed row, raising ValueError with a readable message.
+    """
+    if isinstance(row, Exception):
+        raise ValueError(f"unreadable row: {row}")
+    if not isinstance(row, dict):
+        raise ValueError("expected an object")
+    try:
+        return DishImport.model_validate(row)
+    except ValidationError as e:
+        raise ValueError("; ".join(f"{'.'.join(map(str, error['loc'])) or 'row'}: {error['msg']}" for error in e.errors()))
+
+def error_report(errors: List[RowError]) -> List[Dict[str, Any]]:
+    """
+    Serialize row errors for a response, keeping at most MAX_REPORTED_ERRORS.
+    """
+    return [error._asdict() for error in errors[:MAX_REPORTED_ERRORS]]
@@ -0,0 +1,259 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+import asyncio
+import json
+import os
+import time
+from loguru import logger
+from prometheus_client import Counter
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # memory | redis | none
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "dancingpony:")
+
+# Prometheus metrics shared by every cache, labelled by cache name. They are all counters, which add up across
+# worker processes; chart the hit ratio as rate(cache_hits_total[5m]) / (rate(cache_hits_total[5m]) + rate(cache_misses_total[5m]))
+CACHE_HITS = Counter('cache_hits_total', 'Cache hits', ['cache'])
+CACHE_MISSES = Counter('cache_misses_total', 'Cache misses', ['cache'])
+CACHE_EVICTIONS = Counter('cache_evictions_total', 'Cache evictions', ['cache'])
+
+def connect_redis(url: str = REDIS_URL):
+    """
+    Asynchronous Redis client for the given URL; the redis package is only needed when a Redis backend is used.
+    """
+    try:
+        from redis import asyncio as aioredis
+    except ImportError:
+        import aioredis
+    return aioredis.from_url(url)
+
+class CacheStats:
+    """
+    Hit, miss and eviction accounting for one named cache, exported on /metrics.
+    """
+    def __init__(self, name: str):
+        self._hits = CACHE_HITS.labels(cache=name)
+        self._misses = CACHE_MISSES.labels(cache=name)
+        self._evictions = CACHE_EVICTIONS.labels(cache=name)
+
+    def hit(self) -> None:
+        self._hits.inc()
+
+    def miss(self) -> None:
+        self._misses.inc()
+
+    def evicted(self) -> None:
+        self._evictions.inc()
+
+class TTLCache:
+    """
+    Bounded in-process cache with least-recently-used eviction and a per-entry time to live.
+
+    Hits, misses and evictions are exported on /metrics under the cache's name.
+    """
+    def __init__(self, name: str, ttl: float, max_size: int):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.stats = CacheStats(name)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Returns the cached value, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.stats.hit()
+                    return value
+                del self._entries[key]
+        self.stats.miss()
+        return None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Stores a value, evicting the least recently used entries when the cache is full.
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats.evicted()
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """
+        Drops one key, or every entry when no key is given.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class CacheBackend(ABC):
+    """
+    Asynchronous key-value cache interface used by the service layer.
+
+    Values must be JSON serializable so that every backend can store them.
+    """
+    shared = False  # True if every worker sees the same entries
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        ...
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        return [await self.get(key) for key in keys]
+
+    @abstractmethod
+    async def set(self, key: str, value: Any) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        ...
+
+    @abstractmethod
+    async def clear(self) -> None:
+        ...
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Per-process LRU/TTL backend. Entries are not shared between workers.
+    """
+    def __init__(self, name: str, ttl: float, max_size: int):
+        self.cache = TTLCache(name, ttl=ttl, max_size=max_size)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self.cache.get(key)
+
+    async def set(self, key: str, value: Any) -> None:
+        self.cache.set(key, value)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.cache.invalidate(key)
+
+    async def clear(self) -> None:
+        self.cache.invalidate()
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Redis backend shared by all workers; entries expire through Redis TTLs and eviction is left to Redis' maxmemory policy.
+
+    A Redis outage degrades to cache misses rather than failing requests.
+    """
+    shared = True
+
+    def __init__(self, name: str, ttl: float, url: str = REDIS_URL, prefix: str = REDIS_KEY_PREFIX, client=None):
+        self.ttl = ttl
+        self.prefix = f"{prefix}{name}:"
+        self.stats = CacheStats(name)
+        self.client = client if client is not None else connect_redis(url)
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            raw = await self.client.get(self.prefix + key)
+        except Exception as e:
+            logger.error("Redis cache get failed: {}", e)
+            raw = None
+        if raw is None:
+            self.stats.miss()
+            return None
+        self.stats.hit()
+        return json.loads(raw)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        if not keys:
+            return []
+        try:
+            raws = await self.client.mget([self.prefix + key for key in keys])
+        except Exception as e:
+            logger.error("Redis cache get failed: {}", e)
+            raws = [None] * len(keys)
+        values = []
+        for raw in raws:
+            if raw is None:
+                self.stats.miss()
+                values.append(None)
+            else:
+                self.stats.hit()
+                values.append(json.loads(raw))
+        return values
+
+    async def set(self, key: str, value: Any) -> None:
+        try:
+            await self.client.set(self.prefix + key, json.dumps(value), px=int(self.ttl * 1000))
+        except Exception as e:
+            logger.error("Redis cache set failed: {}", e)
+
+    async def delete(self, *keys: str) -> None:
+        if not keys:
+            return
+        try:
+            await self.client.delete(*(self.prefix + key for key in keys))
+        except Exception as e:
+            logger.error("Redis cache delete failed: {}", e)
+
+    async def clear(self) -> None:
+        try:
+            keys = [key async for key in self.client.scan_iter(match=self.prefix + "*")]
+            if keys:
+                await self.client.delete(*keys)
+        except Exception as e:
+            logger.error("Redis cache clear failed: {}", e)
+
+def create_cache_backend(name: str, ttl: float, max_size: int, backend: str = CACHE_BACKEND) -> Optional[CacheBackend]:
+    """
+    Factory Pattern - builds the cache backend selected by CACHE_BACKEND, or None when caching is off.
+    """
+    if backend == "redis":
+        return RedisCacheBackend(name, ttl=ttl)
+    if backend == "memory":
+        return MemoryCacheBackend(name, ttl=ttl, max_size=max_size)
+    return None
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key so that only one of them runs the loader.
+
+    Callers that arrive while a load is in flight wait for, and share, its result, so an expired
+    hot key causes one database query instead of a stampede.
+    """
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; mark the exception as retrieved to avoid a warning
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
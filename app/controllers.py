@@ -1,80 +1,145 @@
-from typing import List, Optional
+from typing import Any, AsyncIterator, List, Mapping, Optional, Sequence, Tuple
 import uuid
 from prometheus_client import Counter, Histogram
-from app.models import Dish
-from app.services import DishService
+from app.tracing import traced
+from app.models import Dish, TableVersion
+from app.bulk import RowError
+from app.services import DishOperation, DishService, OperationResult
 from loguru import logger
 
-# Define Prometheus metrics
+# Define Prometheus metrics; the traced decorator (Decorator Pattern) counts and times every call
 REQUEST_COUNT = Counter('dish_controller_request_count', 'Request Count', ['method'])
 REQUEST_LATENCY = Histogram('dish_controller_request_latency_seconds', 'Request latency in seconds', ['method'])
 
 class DishController:
     """
     Controller for managing dishes.
+
+    Every method acts on the menu of the tenant given as its first argument.
     """
     def __init__(self, service: DishService = DishService()):
         self.service = service  # Dependency Injection (DI) - allows for easy testing and separation of concerns
 
-    @REQUEST_LATENCY.labels(method='create_dish').time()
-    def create_dish(self, name: str, description: str, price: float, image: str) -> Dish:
+    @traced("controller", REQUEST_LATENCY, REQUEST_COUNT)
+    async def create_dish(self, tenant_id: uuid.UUID, name: str, description: str, price: float, image: Optional[bytes]) -> Dish:
         """
         Handles the creation of a new dish.
         """
-        REQUEST_COUNT.labels(method='create_dish').inc()
-        logger.info(f"Creating a new dish with name {name}...")
-        return self.service.create_dish(name=name, description=description, price=price, image=image)  # Facade - simplifies client interaction
+        logger.debug("Creating a new dish with name {}...", name)
+        return await self.service.create_dish(tenant_id, name=name, description=description, price=price, image=image)  # Facade - simplifies client interaction
 
-    @REQUEST_LATENCY.labels(method='get_dish').time()
-    def get_dish(self, dish_id: uuid.UUID) -> Optional[Dish]:
+    @traced("controller", REQUEST_LATENCY, REQUEST_COUNT)
+    async def get_dish(self, tenant_id: uuid.UUID, dish_id: uuid.UUID) -> Optional[Dish]:
         """
         Handles retrieving a dish by its ID.
         """
-        REQUEST_COUNT.labels(method='get_dish').inc()
-        logger.info(f"Retrieving dish with id {dish_id}...")
-        return self.service.get_dish(dish_id)  # Facade - simplifies client interaction
+        logger.debug("Retrieving dish with id {}...", dish_id)
+        return await self.service.get_dish(tenant_id, dish_id)  # Facade - simplifies client interaction
+
+    @traced("controller", REQUEST_LATENCY, REQUEST_COUNT)
+    async def get_dishes(self, tenant_id: uuid.UUID, dish_ids: Sequence[uuid.UUID], fields: Optional[Sequence[str]] = None) -> List[Dish]:
+        """
+        Handles retrieving several dishes by their IDs.
+        """
+        logger.debug("Retrieving {} dishes...", len(dish_ids))
+        return await self.service.get_dishes(tenant_id, dish_ids, fields=fields)  # Facade - simplifies client interaction
+
+    @traced("controller", REQUEST_LATENCY, REQUEST_COUNT)
+    async def get_dish_image(self, tenant_id: uuid.UUID, dish_id: uuid.UUID) -> Optional[str]:
+        """
+        Handles retrieving the image reference of a dish.
+        """
+        logger.debug("Retrieving image of dish with id {}...", dish_id)
+        return await self.service.get_dish_image(tenant_id, dish_id)  # Facade - simplifies client interaction
 
-    @REQUEST_LATENCY.labels(method='list_dishes').time()
-    def list_dishes(self) -> List[Dish]:
+    @traced("controller", REQUEST_LATENCY, REQUEST_COUNT)
+    async def get_dishes_version(self, tenant_id: uuid.UUID) -> TableVersion:
+        """
+        Handles retrieving the version of the dish table.
+        """
+        return await self.service.get_dishes_version(tenant_id)  # Facade - simplifies client interaction
+
+    @traced("controller", REQUEST_LATENCY, REQUEST_COUNT)
+    async def list_dishes(self, tenant_id: uuid.UUID, fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+                          after: Optional[Tuple[str, uuid.UUID]] = None) -> List[Dish]:
         """
         Handles listing all dishes.
         """
-        REQUEST_COUNT.labels(method='list_dishes').inc()
-        logger.info("Listing all dishes...")
-        return self.service.list_dishes()  # Facade - simplifies client interaction
+        logger.debug("Listing all dishes...")
+        return await self.service.list_dishes(tenant_id, fields=fields, limit=limit, after=after)  # Facade - simplifies client interaction
 
-    @REQUEST_LATENCY.labels(method='search_dishes').time()
-    def search_dishes(self, query: str) -> List[Dish]:
+    @traced("controller", REQUEST_LATENCY, REQUEST_COUNT)
+    async def search_dishes(self, tenant_id: uuid.UUID, query: str, fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+                            after: Optional[Tuple[float, uuid.UUID]] = None) -> List[Dish]:
         """
         Handles searching for dishes.
         """
-        REQUEST_COUNT.labels(method='search_dishes').inc()
-        logger.info(f"Searching for dishes with query {query}...")
-        return self.service.search_dishes(query)  # Facade - simplifies client interaction
+        logger.debug("Searching for dishes with query {}...", query)
+        return await self.service.search_dishes(tenant_id, query, fields=fields, limit=limit, after=after)  # Facade - simplifies client interaction
+
+    def stream_dishes(self, tenant_id: uuid.UUID, query: Optional[str] = None, fields: Optional[Sequence[str]] = None) -> AsyncIterator[Dish]:
+        """
+        Handles streaming all dishes, or those matching a query.
+        """
+        REQUEST_COUNT.labels(method='stream_dishes').inc()
+        logger.debug("Streaming dishes with query {}...", query)
+        return self.service.stream_dishes(tenant_id, query, fields=fields)  # Facade - simplifies client interaction
+
+    @traced("controller", REQUEST_LATENCY, REQUEST_COUNT)
+    async def import_dishes(self, tenant_id: uuid.UUID, rows: AsyncIterator[Tuple[int, Any]], skip_invalid: bool = False) -> Tuple[int, List[RowError]]:
+        """
+        Handles importing dishes in bulk.
+        """
+        logger.debug("Importing dishes...")
+        return await self.service.import_dishes(tenant_id, rows, skip_invalid=skip_invalid)  # Facade - simplifies client interaction
+
+    def export_dishes(self, tenant_id: uuid.UUID, format: str = "ndjson") -> AsyncIterator[bytes]:
+        """
+        Handles exporting every dish.
+        """
+        REQUEST_COUNT.labels(method='export_dishes').inc()
+        logger.debug("Exporting dishes as {}...", format)
+        return self.service.export_dishes(tenant_id, format)  # Facade - simplifies client interaction
+
+    @traced("controller", REQUEST_LATENCY, REQUEST_COUNT)
+    async def update_dish(self, tenant_id: uuid.UUID, dish_id: uuid.UUID, name: str, description: str, price: float, image: Optional[bytes],
+                          expected_versions: Optional[Sequence[int]] = None) -> Optional[Dish]:
+        """
+        Handles updating an existing dish, optionally only if it is still at one of the expected versions.
+        """
+        logger.debug("Updating dish with id {}...", dish_id)
+        return await self.service.update_dish(tenant_id, dish_id, name=name, description=description, price=price, image=image,
+                                              expected_versions=expected_versions)  # Facade - simplifies client interaction
+
+    @traced("controller", REQUEST_LATENCY, REQUEST_COUNT)
+    async def patch_dish(self, tenant_id: uuid.UUID, dish_id: uuid.UUID, changes: Mapping[str, Any],
+                         expected_versions: Optional[Sequence[int]] = None) -> Optional[Dish]:
+        """
+        Handles changing some fields of an existing dish.
+        """
+        logger.debug("Patching dish with id {}...", dish_id)
+        return await self.service.patch_dish(tenant_id, dish_id, changes, expected_versions=expected_versions)  # Facade - simplifies client interaction
 
-    @REQUEST_LATENCY.labels(method='update_dish').time()
-    def update_dish(self, dish_id: uuid.UUID, name: str, description: str, price: float, image: str) -> Optional[Dish]:
+    @traced("controller", REQUEST_LATENCY, REQUEST_COUNT)
+    async def apply_batch(self, tenant_id: uuid.UUID, operations: Sequence[DishOperation]) -> Tuple[bool, List[OperationResult]]:
         """
-        Handles updating an existing dish.
+        Handles applying a batch of dish writes in one transaction.
         """
-        REQUEST_COUNT.labels(method='update_dish').inc()
-        logger.info(f"Updating dish with id {dish_id}...")
-        return self.service.update_dish(dish_id, name=name, description=description, price=price, image=image)  # Facade - simplifies client interaction
+        logger.debug("Applying a batch of {} operations...", len(operations))
+        return await self.service.apply_batch(tenant_id, operations)  # Facade - simplifies client interaction
 
-    @REQUEST_LATENCY.labels(method='rate_dish').time()
-    def rate_dish(self, dish_id: uuid.UUID, rating: float) -> Optional[Dish]:
+    @traced("controller", REQUEST_LATENCY, REQUEST_COUNT)
+    async def rate_dish(self, tenant_id: uuid.UUID, dish_id: uuid.UUID, user_id: uuid.UUID, rating: float) -> Optional[Dish]:
         """
-        Handles rating a dish.
+        Handles a user rating a dish.
         """
-        REQUEST_COUNT.labels(method='rate_dish').inc()
-        logger.info(f"Rating dish with id {dish_id}...")
-        return self.service.rate_dish(dish_id, rating=rating)  # Facade - simplifies client interaction
+        logger.debug("Rating dish with id {}...", dish_id)
+        return await self.service.rate_dish(tenant_id, dish_id, user_id, rating=rating)  # Facade - simplifies client interaction
 
-    @REQUEST_LATENCY.labels(method='delete_dish').time()
-    def delete_dish(self, dish_id: uuid.UUID) -> int:
+    @traced("controller", REQUEST_LATENCY, REQUEST_COUNT)
+    async def delete_dish(self, tenant_id: uuid.UUID, dish_id: uuid.UUID) -> int:
         """
         Handles deleting a dish by its ID and returns the number of deleted items.
         """
-        REQUEST_COUNT.labels(method='delete_dish').inc()
-        logger.info(f"Deleting dish with id {dish_id}...")
-        return self.service.delete_dish(dish_id)  # Facade - simplifies client interaction
+        logger.debug("Deleting dish with id {}...", dish_id)
+        return await self.service.delete_dish(tenant_id, dish_id)  # Facade - simplifies client interaction
@@ -0,0 +1,54 @@
+from typing import Optional
+import hashlib
+import hmac
+import os
+import secrets
+from app.cache import TTLCache
+
+CREDENTIAL_CACHE_TTL = float(os.getenv("CREDENTIAL_CACHE_TTL", 60))
+CREDENTIAL_CACHE_MAX_SIZE = int(os.getenv("CREDENTIAL_CACHE_MAX_SIZE", 10000))
+
+class CredentialCache:
+    """
+    Short-lived LRU cache of successful password verifications.
+
+    HTTP Basic clients resend the same credentials on every request, so once bcrypt has accepted a
+    password we remember an HMAC of it (keyed with a per-process secret, never the plain text) together
+    with the stored hash it was checked against. An entry only matches while that stored hash is
+    unchanged, so a password change invalidates it even before the TTL runs out.
+    Eviction and expiry are TTLCache's, exported on /metrics as the "credential" cache.
+    """
+    def __init__(self, ttl: float = CREDENTIAL_CACHE_TTL, max_size: int = CREDENTIAL_CACHE_MAX_SIZE):
+        self.cache = TTLCache("credential", ttl=ttl, max_size=max_size)
+        self._secret = secrets.token_bytes(32)
+
+    def _digest(self, plain_password: str) -> bytes:
+        return hmac.new(self._secret, plain_password.encode("utf-8"), hashlib.sha256).digest()
+
+    def check(self, email: str, plain_password: str, hashed_password: str) -> bool:
+        """
+        Returns True if this exact password was verified against this stored hash within the TTL.
+        """
+        entry = self.cache.get(email)
+        if entry is None:
+            return False
+        cached_hash, digest = entry
+        if cached_hash != hashed_password:
+            self.cache.invalidate(email)
+            return False
+        return hmac.compare_digest(digest, self._digest(plain_password))
+
+    def add(self, email: str, plain_password: str, hashed_password: str) -> None:
+        """
+        Records a successful verification, evicting the least recently used entry when full.
+        """
+        self.cache.set(email, (hashed_password, self._digest(plain_password)))
+
+    def invalidate(self, email: Optional[str] = None) -> None:
+        """
+        Drops the entry for one email, or every entry when no email is given.
+        """
+        self.cache.invalidate(email)
+
+# Singleton Pattern - a single credential cache shared by every request in the process
+credential_cache = CredentialCache()
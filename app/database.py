@@ -1,18 +1,34 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+import asyncio
 import os
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 20))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 0))
+# Connections each worker opens as it starts, so its first requests do not pay for connecting
+DB_POOL_WARM_SIZE = int(os.getenv("DB_POOL_WARM_SIZE", min(DB_POOL_SIZE, 2)))
 
 # Singleton Pattern - Ensures a single instance of the database engine is created and reused
+# Statements are not echoed; set LOG_LEVELS=sqlalchemy.engine=INFO to log them through the app's log pipeline
 engine = create_async_engine(
     DATABASE_URL, 
-    echo=True, 
-    pool_size=20,  
-    max_overflow=0
+    echo=False, 
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=True
 )
 
+# Connections are only opened on first use, so each worker process opens its own. A worker forked from a
+# process that already used the engine (gunicorn's preload_app) drops the inherited pool without closing
+# its connections, which still belong to the parent.
+os.register_at_fork(after_in_child=lambda: engine.sync_engine.dispose(close=False))
+
 # Singleton Pattern - Ensures a single instance of the session factory is created and reused
 SessionLocal = sessionmaker(
     bind=engine,
@@ -32,3 +48,19 @@ async def get_db():
     """
     async with SessionLocal() as session:
         yield session
+
+async def warm_pool(connections: int = DB_POOL_WARM_SIZE) -> None:
+    """
+    Opens connections into the pool ahead of the first requests; called from the app's lifespan, in the worker process.
+
+    A database that cannot be reached is only logged: the pool connects on demand anyway, and failing the
+    lifespan would stop a recycled worker, and with it gunicorn, over a passing outage.
+    """
+    if connections <= 0:
+        return
+    opened = await asyncio.gather(*(engine.connect().start() for _ in range(connections)), return_exceptions=True)
+    for conn in opened:
+        if isinstance(conn, BaseException):
+            logger.warning("Could not open a pooled database connection at startup: {}", conn)
+        else:
+            await conn.close()
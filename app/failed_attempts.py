@@ -1,6 +1,139 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
 from datetime import timedelta
+from threading import Lock
+from typing import List, Optional, Tuple
+import os
+import time
+import uuid
+from loguru import logger
+from app.cache import CACHE_BACKEND, REDIS_URL, REDIS_KEY_PREFIX, connect_redis
 
-MAX_FAILED_ATTEMPTS = 3
-BLOCK_TIME = timedelta(minutes=15)
+MAX_FAILED_ATTEMPTS = int(os.getenv("MAX_FAILED_ATTEMPTS", 3))
+# Failed logins from one client address, whichever accounts they target
+MAX_FAILED_ATTEMPTS_PER_IP = int(os.getenv("MAX_FAILED_ATTEMPTS_PER_IP", 20))
+# Counters expire this long after the last failure, which also ends the lockout
+BLOCK_TIME = timedelta(seconds=float(os.getenv("BLOCK_TIME_SECONDS", 15 * 60)))
+LOCKOUT_BACKEND = os.getenv("LOCKOUT_BACKEND", "redis" if CACHE_BACKEND == "redis" else "memory")  # memory | redis
+LOCKOUT_MAX_SIZE = int(os.getenv("LOCKOUT_MAX_SIZE", 100000))
 
-failed_attempts = {}
+def email_key(tenant_id: uuid.UUID, email: str) -> str:
+    return f"email:{tenant_id}:{email.lower()}"
+
+def ip_key(ip: str) -> str:
+    return f"ip:{ip}"
+
+class LockoutStore(ABC):
+    """
+    Counters of recent failed logins, keyed by email and by client address.
+
+    A counter is reset by a successful login or expires BLOCK_TIME after its last failure.
+    """
+    @abstractmethod
+    async def failures(self, *keys: str) -> List[int]:
+        """
+        Returns the current failure count for each key, 0 when there is none.
+        """
+
+    @abstractmethod
+    async def record_failure(self, *keys: str) -> None:
+        """
+        Counts one failed login against each key and restarts its expiry.
+        """
+
+    @abstractmethod
+    async def reset(self, *keys: str) -> None:
+        ...
+
+class MemoryLockoutStore(LockoutStore):
+    """
+    Per-process counters. Expired entries are dropped when read and the oldest are evicted past
+    max_size, so guessing many emails cannot grow memory without bound.
+    """
+    def __init__(self, ttl: float = BLOCK_TIME.total_seconds(), max_size: int = LOCKOUT_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._lock = Lock()
+
+    def _count(self, key: str, now: float) -> int:
+        entry = self._entries.get(key)
+        if entry is None:
+            return 0
+        count, expires_at = entry
+        if expires_at < now:
+            del self._entries[key]
+            return 0
+        return count
+
+    async def failures(self, *keys: str) -> List[int]:
+        now = time.monotonic()
+        with self._lock:
+            return [self._count(key, now) for key in keys]
+
+    async def record_failure(self, *keys: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                self._entries[key] = (self._count(key, now) + 1, now + self.ttl)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    async def reset(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class RedisLockoutStore(LockoutStore):
+    """
+    Counters shared by every worker, kept with atomic INCR and PEXPIRE so concurrent failures are all counted.
+
+    While Redis is unavailable the counters fall back to this process, so the lockout weakens to
+    per-worker limits instead of disappearing.
+    """
+    def __init__(self, ttl: float = BLOCK_TIME.total_seconds(), url: str = REDIS_URL, prefix: str = REDIS_KEY_PREFIX, client=None):
+        self.ttl = ttl
+        self.prefix = f"{prefix}lockout:"
+        self.client = client if client is not None else connect_redis(url)
+        self.fallback = MemoryLockoutStore(ttl=ttl)
+
+    async def failures(self, *keys: str) -> List[int]:
+        try:
+            counts = await self.client.mget([self.prefix + key for key in keys])
+        except Exception as e:
+            logger.error("Redis lockout lookup failed: {}", e)
+            return await self.fallback.failures(*keys)
+        return [int(count) if count is not None else 0 for count in counts]
+
+    async def record_failure(self, *keys: str) -> None:
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                for key in keys:
+                    pipe.incr(self.prefix + key)
+                    pipe.pexpire(self.prefix + key, int(self.ttl * 1000))
+                await pipe.execute()
+        except Exception as e:
+            logger.error("Redis lockout update failed: {}", e)
+            await self.fallback.record_failure(*keys)
+
+    async def reset(self, *keys: str) -> None:
+        await self.fallback.reset(*keys)
+        try:
+            await self.client.delete(*(self.prefix + key for key in keys))
+        except Exception as e:
+            logger.error("Redis lockout reset failed: {}", e)
+
+def create_lockout_store(backend: str = LOCKOUT_BACKEND) -> LockoutStore:
+    """
+    Factory Pattern - builds the lockout store selected by LOCKOUT_BACKEND. Lockout cannot be turned off.
+    """
+    if backend == "redis":
+        return RedisLockoutStore()
+    return MemoryLockoutStore()
+
+# Singleton Pattern - one lockout store shared by every request in the process
+lockout_store = create_lockout_store()
@@ -0,0 +1,242 @@
+from typing import Callable, Dict, Optional, TextIO
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import traceback
+import uuid
+import orjson
+from fastapi import FastAPI
+from loguru import logger
+from prometheus_client import Counter
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Per-module levels overriding LOG_LEVEL, e.g. "app.repositories=DEBUG,sqlalchemy.engine=INFO" to also log every SQL statement
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json
+# Share of requests whose records below WARNING are kept; warnings and errors are always kept
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1.0))
+# Format and write log records in a background thread instead of the thread that logs them
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() in ("1", "true", "yes")
+# Records waiting for the writer thread; past this, new ones are dropped rather than waited for
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+REQUEST_ID_HEADER = "X-Request-ID"
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
+# Loguru format used when lines are written synchronously (LOG_ASYNC=false); text_line writes the same layout
+TEXT_FORMAT = ("<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | {extra[request_id]} | "
+               "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>")
+
+LOG_DROPPED = Counter('log_records_dropped_total', 'Log records dropped because the log queue was full')
+
+def parse_levels(levels: str) -> Dict[str, str]:
+    """
+    Parses "module=LEVEL,module=LEVEL" into a dict.
+    """
+    parsed = {}
+    for entry in filter(None, (entry.strip() for entry in levels.split(","))):
+        module, _, level = entry.partition("=")
+        parsed[module.strip()] = level.strip().upper()
+    return parsed
+
+class LogFilter:
+    """
+    Drops records below the level of their module (the longest configured prefix, else the default level)
+    and the records below WARNING of requests that were not sampled.
+    """
+    def __init__(self, level: str = LOG_LEVEL, levels: Optional[Dict[str, str]] = None):
+        self.default = logger.level(level.upper()).no
+        self.levels = {module: logger.level(name).no for module, name in (levels or {}).items()}
+        self.min_level = min([self.default, *self.levels.values()])
+        self._resolved: Dict[Optional[str], int] = {}
+        self._warning = logger.level("WARNING").no
+
+    def level_for(self, name: Optional[str]) -> int:
+        level = self._resolved.get(name)
+        if level is None:
+            level = self.default
+            matched = ""
+            for module, module_level in self.levels.items():
+                if len(module) > len(matched) and name and (name == module or name.startswith(module + ".")):
+                    matched, level = module, module_level
+            self._resolved[name] = level
+        return level
+
+    def __call__(self, record) -> bool:
+        level = record["level"].no
+        if level < self.level_for(record["name"]):
+            return False
+        return level >= self._warning or record["extra"].get("sampled", True)
+
+def text_line(record) -> str:
+    """
+    Formats a record as a line in the layout of TEXT_FORMAT, without colors.
+    """
+    time = record["time"]
+    line = (f"{time:%Y-%m-%d %H:%M:%S}.{time.microsecond // 1000:03d} | {record['level'].name: <8} | "
+            f"{record['extra'].get('request_id', '-')} | {record['name']}:{record['function']}:{record['line']} - {record['message']}\n")
+    if record["exception"] is not None:
+        line += "".join(traceback.format_exception(*record["exception"]))
+    return line
+
+def json_line(record) -> str:
+    """
+    Formats a record as one JSON object, with the request id and any other bound context as top-level keys.
+    """
+    data = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "logger": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "message": record["message"],
+        **{key: value for key, value in record["extra"].items() if key not in ("sampled", "json")},
+    }
+    if record["exception"] is not None:
+        data["exception"] = "".join(traceback.format_exception(*record["exception"]))
+    return orjson.dumps(data, default=str).decode() + "\n"
+
+def json_format(record) -> str:
+    # Loguru format function for synchronous JSON output
+    record["extra"]["json"] = json_line(record)[:-1]
+    return "{extra[json]}\n"
+
+class QueueSink:
+    """
+    Loguru sink that hands records to a writer thread, which formats and writes them, so logging never
+    blocks a request on formatting or on stderr.
+
+    The queue is bounded: when the writer falls behind, new records are dropped and counted in
+    log_records_dropped_total rather than waited for. The writer batches whatever is queued into one write.
+    """
+    def __init__(self, stream: TextIO = sys.stderr, format: Callable[[dict], str] = text_line, max_size: int = LOG_QUEUE_SIZE):
+        self.stream = stream
+        self.format = format
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(max_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def write(self, message) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(message.record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+    def _after_fork(self) -> None:
+        # Threads do not survive a fork: a child of a process that already started the writer starts its own
+        self._queue = queue.Queue(self._queue.maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> None:
+        # Started on first use rather than on import, so worker processes each get their own writer
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            records = [self._queue.get()]
+            while records[-1] is not None and len(records) < 1000:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = records[-1] is None
+            if stop:
+                records.pop()
+            if records:
+                self.stream.write("".join(map(self.format, records)))
+                self.stream.flush()
+            if stop:
+                return
+
+    def stop(self) -> None:
+        """
+        Writes out the queued records; called by loguru when the sink is removed, including at exit.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+class InterceptHandler(logging.Handler):
+    """
+    Sends records of standard library loggers (SQLAlchemy, asyncpg, ...) through loguru, under their own logger name.
+    """
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+        logger.patch(lambda r: r.update(name=record.name, function=record.funcName, line=record.lineno)) \
+              .opt(exception=record.exc_info).log(level, record.getMessage())
+
+def configure_logging(level: str = LOG_LEVEL, levels: str = LOG_LEVELS, format: str = LOG_FORMAT,
+                      stream: TextIO = sys.stderr, asynchronous: bool = LOG_ASYNC) -> None:
+    """
+    Replaces loguru's default handler with one configured from the LOG_* settings, and routes the
+    standard library's logging into it.
+    """
+    module_levels = parse_levels(levels)
+    log_filter = LogFilter(level, module_levels)
+    logger.remove()
+    logger.configure(extra={"request_id": "-"})
+    if asynchronous:
+        # The sink formats records itself, off the logging thread
+        logger.add(QueueSink(stream, json_line if format == "json" else text_line), level=log_filter.min_level,
+                   filter=log_filter, format="{message}")
+    else:
+        logger.add(stream, level=log_filter.min_level, filter=log_filter,
+                   format=json_format if format == "json" else TEXT_FORMAT, colorize=format != "json" and stream.isatty())
+    # Libraries only log warnings unless LOG_LEVELS names them
+    logging.basicConfig(handlers=[InterceptHandler()], level=max(log_filter.default, logging.WARNING), force=True)
+    for module, module_level in log_filter.levels.items():
+        if not module.startswith("app"):
+            logging.getLogger(module).setLevel(module_level)
+
+class RequestContextMiddleware:
+    """
+    Binds a request id, and whether the request's logs are sampled, to every record logged while serving it.
+
+    The id is taken from the X-Request-ID header when the client or proxy sent a valid one, and is
+    returned in the response's X-Request-ID header.
+    """
+    def __init__(self, app: ASGIApp, sample_rate: float = LOG_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")
+                break
+        if request_id is None or not _REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).setdefault(REQUEST_ID_HEADER, request_id)
+            await send(message)
+
+        with logger.contextualize(request_id=request_id, sampled=sampled):
+            await self.app(scope, receive, send_with_request_id)
+
+def init_logging(app: FastAPI):
+    app.add_middleware(RequestContextMiddleware)
+    return app
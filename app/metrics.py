@@ -1,6 +1,19 @@
-from prometheus_client import Counter, Histogram, generate_latest
-from fastapi import FastAPI, Request
+from typing import Dict
+import os
+import time
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+from fastapi import FastAPI
 from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Set (to an empty directory, wiped at every deploy) when several worker processes serve the app, so /metrics
+# aggregates the samples every worker writes there instead of reporting only the worker that answers the scrape
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Label of requests that matched no route, so scans of random paths cannot create new series
+UNMATCHED_ROUTE = "<unmatched>"
+HTTP_METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
 
 # Counters for request counts
 REQUEST_COUNT = Counter('request_count', 'Request Count', ['endpoint', 'method', 'http_status'])
@@ -8,19 +21,108 @@ REQUEST_COUNT = Counter('request_count', 'Request Count', ['endpoint', 'method',
 # Histograms for request latencies
 REQUEST_LATENCY = Histogram('request_latency_seconds', 'Request latency in seconds', ['endpoint', 'method'])
 
+REQUESTS_IN_PROGRESS = Gauge('requests_in_progress', 'Requests being served', ['method'], multiprocess_mode='livesum')
+
+RESPONSE_SIZE = Histogram('response_size_bytes', 'Response body size in bytes', ['endpoint', 'method'],
+                          buckets=(100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, float("inf")))
+
+DB_QUERY_LATENCY = Histogram('db_query_duration_seconds', 'Repository call latency in seconds, connection checkout included', ['method'],
+                             buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, float("inf")))
+
+def route_template(scope: Scope) -> str:
+    """
+    The path template of the route that served the request, e.g. "/dishes/{dish_id}".
+    """
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path_format", route.path)
+    # Plain Starlette routes (the docs pages) have fixed paths
+    return scope["path"] if "endpoint" in scope else UNMATCHED_ROUTE
+
+class MetricsMiddleware:
+    """
+    Records the count, latency and response size of every request, labelled with its route template
+    rather than its path, so the number of series stays bounded however many dishes there are.
+
+    Written as plain ASGI rather than with @app.middleware("http"), which copies every response body
+    through an extra task and stream. Labelled children are cached, so a request costs a few dict lookups
+    and the observations themselves.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._children = {}
+        # Requests in progress per method. Counted in a plain dict read at scrape time, which is cheaper than
+        # the gauge's locked inc() and dec(), except in multiprocess mode, where only written samples are collected
+        self._in_progress: Dict[str, int] = {}
+        self._gauges = {}
+
+    def _gauge(self, method: str):
+        gauge = REQUESTS_IN_PROGRESS.labels(method=method)
+        self._in_progress[method] = 0
+        if not PROMETHEUS_MULTIPROC_DIR:
+            gauge.set_function(lambda: self._in_progress[method])
+        self._gauges[method] = gauge
+        return gauge
+
+    def _series(self, endpoint: str, method: str, status_code: int):
+        key = (endpoint, method, status_code)
+        series = self._children.get(key)
+        if series is None:
+            series = self._children[key] = (REQUEST_COUNT.labels(endpoint=endpoint, method=method, http_status=status_code),
+                                            REQUEST_LATENCY.labels(endpoint=endpoint, method=method),
+                                            RESPONSE_SIZE.labels(endpoint=endpoint, method=method))
+        return series
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"] if scope["method"] in HTTP_METHODS else "OTHER"
+        gauge = self._gauges.get(method) or self._gauge(method)
+        status_code = 500
+        size = 0
+
+        async def send_with_metrics(message: Message) -> None:
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        if PROMETHEUS_MULTIPROC_DIR:
+            gauge.inc()
+        else:
+            self._in_progress[method] += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            elapsed = time.perf_counter() - start
+            if PROMETHEUS_MULTIPROC_DIR:
+                gauge.dec()
+            else:
+                self._in_progress[method] -= 1
+            count, latency, response_size = self._series(route_template(scope), method, status_code)
+            count.inc()
+            latency.observe(elapsed)
+            response_size.observe(size)
+
+def registry() -> CollectorRegistry:
+    """
+    The registry /metrics exposes: this process's, or in multiprocess mode one collecting every worker's samples.
+    """
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
 def init_metrics(app: FastAPI):
-    @app.middleware("http")
-    async def add_process_time_header(request: Request, call_next):
-        method = request.method
-        endpoint = request.url.path
-        with REQUEST_LATENCY.labels(endpoint=endpoint, method=method).time():
-            response = await call_next(request)
-            status_code = response.status_code
-            REQUEST_COUNT.labels(endpoint=endpoint, method=method, http_status=status_code).inc()
-            return response
+    app.add_middleware(MetricsMiddleware)
 
     @app.get("/metrics")
     async def metrics():
-        return Response(content=generate_latest(), media_type="text/plain; version=0.0.4; charset=utf-8")
+        return Response(content=generate_latest(registry()), media_type=CONTENT_TYPE_LATEST)
 
-    return app
\ No newline at end of file
+    return app
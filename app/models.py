@@ -1,10 +1,10 @@
-from typing import Optional
+from datetime import datetime
+from typing import Iterable, Mapping, NamedTuple, Optional
 import uuid
 from pydantic import BaseModel, Field
 from sqlalchemy import Column, String, Boolean
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
-from loguru import logger
 import os
 from dotenv import load_dotenv
 
@@ -14,6 +14,9 @@ load_dotenv()
 # Singleton Pattern: Ensures a single instance of the base class for models is created and reused
 Base = declarative_base()
 
+# Columns of the dish table exposed through the API, in response order
+DISH_FIELDS = ("id", "name", "description", "price", "image", "rating")
+
 class Dish(BaseModel):
     """
     Dish model class using Pydantic for data validation and serialization.
@@ -24,28 +27,39 @@ class Dish(BaseModel):
     name: str
     description: str
     price: float
-    image: str
+    image: Optional[str] = None  # SHA-256 reference to the image in the blob store
     rating: Optional[float] = None
+    score: Optional[float] = None  # Search relevance, only set on search results
+    version: Optional[int] = None  # Row version, bumped on every update; not part of the API body
+    tenant_id: Optional[uuid.UUID] = None  # Restaurant the dish belongs to; implied by the request, not part of the API body
+    updated_at: Optional[datetime] = None
 
     class Config:
         # Allows Pydantic model to be created from ORM objects
         from_attributes = True
 
-    def to_dict(self) -> dict:
+    def to_dict(self, fields: Optional[Iterable[str]] = None) -> dict:
         """
         Converts the dish object to a dictionary.
         
         This method implements the Serializer pattern, enabling the object to be converted into a format suitable for storage or transmission.
+        When fields are given, only those keys are emitted, which is required for dishes built from a projected row.
+        Search results also carry their relevance score. Called once per dish of every response, so it does not log.
         """
-        logger.info("Converting dish object to dictionary...")
-        return {
-            "id": str(self.id),  # Convert UUID to string for JSON serialization
-            "name": self.name,
-            "description": self.description,
-            "price": self.price,
-            "image": self.image,
-            "rating": self.rating
-        }
+        if fields is not None:
+            data = {field: str(self.id) if field == "id" else getattr(self, field) for field in fields}
+        else:
+            data = {
+                "id": str(self.id),  # Convert UUID to string for JSON serialization
+                "name": self.name,
+                "description": self.description,
+                "price": self.price,
+                "image": self.image,
+                "rating": self.rating
+            }
+        if self.score is not None:
+            data["score"] = self.score
+        return data
 
     @staticmethod
     def from_dict(data: dict) -> 'Dish':
@@ -54,16 +68,44 @@ class Dish(BaseModel):
         
         This method acts as a Factory Method, allowing the creation of Dish objects from a dictionary representation.
         """
-        logger.info("Creating dish object from dictionary...")
         return Dish(
-            id=uuid.UUID(data["id"]) if "id" in data else uuid.uuid4(),
+            id=uuid.UUID(str(data["id"])) if "id" in data else uuid.uuid4(),
             name=data["name"],
             description=data["description"],
             price=data["price"],
-            image=data["image"],
+            image=data.get("image"),
             rating=data.get("rating")
         )
 
+    @staticmethod
+    def from_row(row: Mapping) -> 'Dish':
+        """
+        Creates a dish object from a database row without re-running validation.
+
+        The row comes from typed table columns, so it is trusted; only NUMERIC values are converted to float.
+        Columns that were not selected are left unset on the returned object.
+        """
+        data = dict(row)
+        for key in ("price", "rating"):
+            if data.get(key) is not None:
+                data[key] = float(data[key])
+        return Dish.model_construct(**data)
+
+class TableVersion(NamedTuple):
+    """
+    Version of a whole table, bumped by every statement that writes to it.
+    """
+    version: int
+    updated_at: datetime
+
+class Tenant(NamedTuple):
+    """
+    A restaurant. Every dish and user belongs to exactly one, and every request is served for one.
+    """
+    id: uuid.UUID
+    slug: str
+    name: str
+
 class User(Base):
     """
     User model class using SQLAlchemy for ORM.
@@ -73,7 +115,8 @@ class User(Base):
     __tablename__ = os.getenv("USER_TABLE_NAME")  # Table name is dynamically set from environment variable
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)  # Primary key with auto-generated UUID
-    email = Column(String, unique=True, index=True, nullable=False)  # Unique and indexed email column
+    tenant_id = Column(UUID(as_uuid=True), nullable=False)  # Restaurant the user belongs to
+    email = Column(String, nullable=False)  # Unique per tenant, indexed together with tenant_id
     hashed_password = Column(String, nullable=False)  # Column for storing hashed passwords
     is_active = Column(Boolean, default=True)  # Boolean flag for active users
     is_superuser = Column(Boolean, default=False)  # Boolean flag for superuser status
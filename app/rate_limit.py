@@ -0,0 +1,201 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+import math
+import os
+import time
+from fastapi import Depends, FastAPI, HTTPException, Request, status
+from loguru import logger
+from prometheus_client import Counter
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.auth import get_current_user
+from app.cache import CACHE_BACKEND, REDIS_URL, REDIS_KEY_PREFIX, connect_redis
+from app.models import User
+
+# Sustained requests per second per user (0 turns rate limiting off) and how many may be made at once
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", 10))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", 50))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "redis" if CACHE_BACKEND == "redis" else "memory")  # memory | redis
+RATE_LIMIT_MAX_SIZE = int(os.getenv("RATE_LIMIT_MAX_SIZE", 100000))
+
+RATE_LIMITED = Counter('rate_limited_total', 'Requests rejected by the rate limiter')
+
+class RateLimiter(ABC):
+    """
+    Token bucket per key, kept as a generic cell rate algorithm (GCRA): the only state is the
+    "theoretical arrival time" at which the key's bucket would be full again.
+
+    Each request of a given cost pushes that time cost * interval into the future, and is refused
+    if it would then lie more than burst * interval ahead of now.
+    """
+    def __init__(self, rate: float = RATE_LIMIT_PER_SECOND, burst: int = RATE_LIMIT_BURST):
+        self.interval = 1 / rate
+        self.burst = burst
+        self.capacity = burst * self.interval
+        # Bound the checks compare against: rounding in tat + cost * interval must not cost a burst its last token
+        self.limit = self.capacity + self.interval / 1000
+
+    @abstractmethod
+    async def acquire(self, key: str, cost: int = 1) -> Tuple[bool, float]:
+        """
+        Takes cost tokens from the key's bucket if it holds that many.
+
+        Returns:
+            Tuple[bool, float]: whether the request is allowed, and the seconds until the bucket is full again
+        """
+
+class MemoryRateLimiter(RateLimiter):
+    """
+    Per-process buckets. A check never awaits, so it runs atomically on the event loop without a lock.
+
+    Full buckets carry no state and are swept once max_size keys are tracked.
+    """
+    def __init__(self, rate: float = RATE_LIMIT_PER_SECOND, burst: int = RATE_LIMIT_BURST, max_size: int = RATE_LIMIT_MAX_SIZE):
+        super().__init__(rate, burst)
+        self.max_size = max_size
+        self._tats: Dict[str, float] = {}
+
+    def check(self, key: str, cost: int = 1) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tat = max(self._tats.get(key, now), now)
+        new_tat = tat + cost * self.interval
+        if new_tat - now > self.limit:
+            return False, tat - now
+        self._tats[key] = new_tat
+        if len(self._tats) > self.max_size:
+            self._sweep(now)
+        return True, new_tat - now
+
+    def _sweep(self, now: float) -> None:
+        self._tats = {key: tat for key, tat in self._tats.items() if tat > now}
+        if len(self._tats) > self.max_size:
+            # Still full of active keys; forgetting them only ever gives their owners a fresh bucket
+            self._tats.clear()
+
+    async def acquire(self, key: str, cost: int = 1) -> Tuple[bool, float]:
+        return self.check(key, cost)
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+# Same algorithm as MemoryRateLimiter.check, run atomically inside Redis against the Redis clock
+GCRA_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local interval, limit, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1])) or now, now)
+local new_tat = tat + cost * interval
+if new_tat - now > limit then
+    return {0, tostring(tat - now)}
+end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {1, tostring(new_tat - now)}
+"""
+
+class RedisRateLimiter(RateLimiter):
+    """
+    Buckets shared by every worker, each check being a single EVALSHA of GCRA_SCRIPT.
+
+    While Redis is unavailable the buckets fall back to this process rather than failing requests.
+    """
+    def __init__(self, rate: float = RATE_LIMIT_PER_SECOND, burst: int = RATE_LIMIT_BURST, url: str = REDIS_URL, prefix: str = REDIS_KEY_PREFIX, client=None):
+        super().__init__(rate, burst)
+        self.prefix = f"{prefix}ratelimit:"
+        self.client = client if client is not None else connect_redis(url)
+        self.script = self.client.register_script(GCRA_SCRIPT)
+        self.fallback = MemoryRateLimiter(rate, burst)
+
+    async def acquire(self, key: str, cost: int = 1) -> Tuple[bool, float]:
+        try:
+            allowed, wait = await self.script(keys=[self.prefix + key], args=[self.interval, self.limit, cost])
+        except Exception as e:
+            logger.error("Redis rate limit check failed: {}", e)
+            return self.fallback.check(key, cost)
+        return bool(allowed), float(wait)
+
+def create_rate_limiter(backend: str = RATE_LIMIT_BACKEND) -> Optional[RateLimiter]:
+    """
+    Factory Pattern - builds the rate limiter selected by RATE_LIMIT_BACKEND, or None when RATE_LIMIT_PER_SECOND is 0.
+    """
+    if RATE_LIMIT_PER_SECOND <= 0:
+        return None
+    if backend == "redis":
+        return RedisRateLimiter()
+    return MemoryRateLimiter()
+
+# Singleton Pattern - one set of buckets shared by every route in the process
+rate_limiter = create_rate_limiter()
+
+def rate_limit_headers(limiter: RateLimiter, wait: float) -> Dict[str, str]:
+    """
+    RateLimit-* headers (IETF draft) for a bucket that will be full again in wait seconds.
+    """
+    remaining = max(int((limiter.capacity - wait) / limiter.interval + 1e-9), 0)
+    return {
+        "RateLimit-Limit": str(limiter.burst),
+        "RateLimit-Remaining": str(remaining),
+        "RateLimit-Reset": str(math.ceil(wait)),
+        "RateLimit-Policy": f"{limiter.burst};w={math.ceil(limiter.capacity)}",
+    }
+
+class RateLimit:
+    """
+    Dependency that authenticates the user and charges the route's cost to their bucket.
+
+    Use it in place of get_current_user: `user: User = Depends(RateLimit(cost=5))`. Costs above the
+    burst are capped at the burst, so every route stays reachable.
+    """
+    def __init__(self, cost: int = 1, limiter: Optional[RateLimiter] = None):
+        self.cost = cost
+        self.limiter = limiter
+
+    async def __call__(self, request: Request, user: User = Depends(get_current_user)) -> User:
+        limiter = self.limiter if self.limiter is not None else rate_limiter
+        if limiter is None:
+            return user
+        allowed, wait = await limiter.acquire(str(user.id), min(self.cost, limiter.burst))
+        headers = rate_limit_headers(limiter, wait)
+        if not allowed:
+            RATE_LIMITED.inc()
+            logger.warning("Rate limit exceeded for user {}", user.email)
+            retry_after = wait + min(self.cost, limiter.burst) * limiter.interval - limiter.capacity
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded. Please try again later.",
+                headers={**headers, "Retry-After": str(max(math.ceil(retry_after), 1))},
+            )
+        # Added to the response by RateLimitHeadersMiddleware, whatever kind of response the route returns
+        request.state.rate_limit = headers
+        return user
+
+# Default cost for routes that do one ordinary read or write
+rate_limited = RateLimit()
+
+class RateLimitHeadersMiddleware:
+    """
+    Adds the RateLimit-* headers recorded by RateLimit to the response, including streamed responses
+    and 304s that routes build themselves.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        state = scope.setdefault("state", {})
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = state.get("rate_limit")
+                if headers:
+                    response_headers = MutableHeaders(scope=message)
+                    for name, value in headers.items():
+                        response_headers.setdefault(name, value)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+def init_rate_limit(app: FastAPI):
+    app.add_middleware(RateLimitHeadersMiddleware)
+    return app
@@ -1,96 +1,473 @@
-from typing import List, Optional
-import psycopg2
-import psycopg2.extras
-from app.models import Dish
+from contextlib import asynccontextmanager
+from itertools import groupby
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Mapping, Optional, Sequence, Tuple
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from app.models import Dish, DISH_FIELDS, TableVersion
+from app.database import engine
+from app.search_index import tokenize
+from app.bulk import BulkImportError, RowError
+from app.tenants import TenantQuota
+from app.metrics import DB_QUERY_LATENCY
+from app.tracing import traced
 import uuid
 from loguru import logger
+import asyncio
+import asyncpg
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+# Rows fetched per round trip from the server-side cursor when streaming
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 500))
 
-conn = psycopg2.connect(
-    dbname=os.getenv('DB_NAME'),
-    user=os.getenv('DB_USER'),
-    password=os.getenv('DB_PASSWORD'),
-    host=os.getenv('DB_HOST'),
-    port=os.getenv('DB_PORT')
-)
+# Pending rating changes folded into the dish aggregates per statement
+RATING_FOLD_BATCH_SIZE = int(os.getenv("RATING_FOLD_BATCH_SIZE", 10000))
+
+# Columns written by a bulk import, in COPY order
+BULK_COLUMNS = ("tenant_id", "id", "name", "description", "price", "image")
+
+# Chunks of COPY output buffered ahead of a slow reader
+EXPORT_QUEUE_SIZE = 16
+
+# Text search configuration used by the dish.search_vector generated column
+SEARCH_CONFIG = "english"
+
+# Pin tenant-scoped transactions to their tenant (app.tenant_id) for the dish row-level security policy
+DB_ROW_LEVEL_SECURITY = os.getenv("DB_ROW_LEVEL_SECURITY", "false").lower() in ("1", "true", "yes")
+
+def to_prefix_tsquery(query: str) -> str:
+    """
+    Turns free text into a to_tsquery expression where every word is prefix matched,
+    so "lemb bre" finds "Lembas Bread" while the user is still typing.
+    """
+    return " & ".join(f"{word}:*" for word in tokenize(query))
 
 class DishRepository:
     """
     Repository for interacting with the dishes in the database.
-    
+
     This class implements the Repository pattern, providing an abstraction over the data layer.
+    Every method checks a connection out of the async engine's pool for the duration of a single
+    statement, so concurrent requests run their queries in parallel instead of queueing on one connection.
+    Writes can instead join a transaction opened with transaction(), to commit several of them together.
+
+    Every query is scoped to one tenant and checks its connection out under that tenant's quota.
+    Only the maintenance methods (search_documents, fold_ratings) span tenants, and they too pin the statements that read or write dishes to each tenant in turn. dish is hash partitioned on
+    tenant_id, and every tenant-scoped query filters on it, so Postgres prunes the other partitions
+    (at execution time too, for prepared statements run with a generic plan).
 
+    The duration of every call returning a result is recorded in db_query_duration_seconds under the method's name,
+    and as a span of traced requests; streams are not, as their duration is set by whoever consumes them.
     """
-    def __init__(self, db_connection = conn):
-        self.db_connection = db_connection
+    def __init__(self, db_engine: AsyncEngine = engine, quota: TenantQuota = TenantQuota()):
+        self.db_engine = db_engine
+        self.quota = quota
 
-    def add(self, dish: Dish) -> None:
+    @asynccontextmanager
+    async def _tenant_connection(self, tenant_id: uuid.UUID, write: bool = False) -> AsyncIterator[AsyncConnection]:
         """
-        Adds a new dish to the database.
+        Checks out a connection for a tenant, within its quota, and pins it to the tenant when row-level security is on.
         """
-        logger.info(f"Adding dish {dish.name} to database...")
-        with self.db_connection.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO dish (id, name, description, price, image, rating)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (str(dish.id), dish.name, dish.description, dish.price, dish.image, dish.rating))
-            self.db_connection.commit()
+        async with self.quota.slot(tenant_id):
+            async with (self.db_engine.begin() if write else self.db_engine.connect()) as conn:
+                if DB_ROW_LEVEL_SECURITY:
+                    await self._pin(conn, tenant_id)
+                yield conn
 
-    def get(self, dish_id: uuid.UUID) -> Optional[Dish]:
+    @staticmethod
+    async def _pin(conn: AsyncConnection, tenant_id: uuid.UUID) -> None:
         """
-        Retrieves a dish by its ID.
+        Pins the connection's transaction to a tenant for the row-level security policy, until it ends or is pinned again.
+        """
+        # Local to the transaction, so it never leaks to the connection's next user
+        await conn.execute(text("SELECT set_config('app.tenant_id', :tenant_id, true)"), {"tenant_id": str(tenant_id)})
+
+    @asynccontextmanager
+    async def transaction(self, tenant_id: uuid.UUID) -> AsyncIterator[AsyncConnection]:
         """
-        logger.info(f"Retrieving dish with id {dish_id} from database...")
-        with self.db_connection.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-            cursor.execute("SELECT * FROM dish WHERE id = %s", (str(dish_id),))
-            row = cursor.fetchone()
+        Opens a transaction for a tenant that several writes can share by passing it as their conn argument.
+        """
+        async with self._tenant_connection(tenant_id, write=True) as conn:
+            yield conn
+
+    @asynccontextmanager
+    async def _connect(self, tenant_id: uuid.UUID, conn: Optional[AsyncConnection], write: bool = False) -> AsyncIterator[AsyncConnection]:
+        """
+        Uses the caller's transaction if there is one, otherwise a connection of its own (committed on exit for writes).
+        """
+        if conn is not None:
+            yield conn
+        else:
+            async with self._tenant_connection(tenant_id, write=write) as own_conn:
+                yield own_conn
+
+    @asynccontextmanager
+    async def _raw_transaction(self, tenant_id: uuid.UUID) -> AsyncIterator[asyncpg.Connection]:
+        """
+        Opens a transaction on the driver connection itself, for COPY, pinned and limited like any other.
+        """
+        async with self.quota.slot(tenant_id):
+            async with self.db_engine.connect() as conn:
+                raw_connection = (await conn.get_raw_connection()).driver_connection
+                async with raw_connection.transaction():
+                    if DB_ROW_LEVEL_SECURITY:
+                        await raw_connection.execute("SELECT set_config('app.tenant_id', $1, true)", str(tenant_id))
+                    yield raw_connection
+
+    @staticmethod
+    def _columns(fields: Optional[Sequence[str]] = None) -> str:
+        """
+        Builds the select list for a projection, always including the (name, id) sort key.
+
+        Column names are checked against DISH_FIELDS, so the result is safe to interpolate into SQL.
+        """
+        if not fields:
+            return ", ".join(DISH_FIELDS)
+        unknown = set(fields) - set(DISH_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown dish fields: {', '.join(sorted(unknown))}")
+        return ", ".join(field for field in DISH_FIELDS if field in ("id", "name") or field in fields)
+
+    def _select(self, tenant_id: uuid.UUID, where: Optional[str], params: dict, fields: Optional[Sequence[str]] = None,
+                limit: Optional[int] = None, after: Optional[Tuple[str, uuid.UUID]] = None) -> Tuple[str, dict]:
+        """
+        Builds a SELECT of a tenant's dishes ordered by (name, id), continuing strictly after the given keyset position.
+
+        The keyset predicate is served by the (tenant_id, name, id) index, so a page costs the same wherever it starts.
+        """
+        conditions = ["tenant_id = :tenant_id"] + ([where] if where else [])
+        params = {**params, "tenant_id": tenant_id}
+        if after is not None:
+            conditions.append("(name, id) > (CAST(:after_name AS VARCHAR), CAST(:after_id AS UUID))")
+            params.update(after_name=after[0], after_id=after[1])
+        sql = f"SELECT {self._columns(fields)} FROM dish WHERE " + " AND ".join(f"({condition})" for condition in conditions)
+        sql += " ORDER BY name, id"
+        if limit is not None:
+            sql += " LIMIT :limit"
+            params["limit"] = limit
+        return sql, params
+
+    def _search_select(self, tenant_id: uuid.UUID, query: str, fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+                       after: Optional[Tuple[float, uuid.UUID]] = None) -> Tuple[str, dict]:
+        """
+        Builds a ranked full-text search of a tenant's dishes, ordered by (score DESC, id).
+
+        Matches come from the GIN-indexed search_vector (prefix matched, name weighted above description) and,
+        for typo tolerance, from trigram word similarity on the name. The score adds the text rank to the
+        name similarity, and paging continues strictly after the given (score, id) position.
+        """
+        params = {"tsquery": to_prefix_tsquery(query), "query": query, "tenant_id": tenant_id}
+        sql = f"""
+            SELECT * FROM (
+                SELECT {self._columns(fields)},
+                       ts_rank_cd(search_vector, tsq) + word_similarity(:query, name) AS score
+                FROM dish, to_tsquery('{SEARCH_CONFIG}', :tsquery) AS tsq
+                WHERE tenant_id = :tenant_id AND (search_vector @@ tsq OR :query <% name)
+            ) AS ranked"""
+        if after is not None:
+            sql += " WHERE score < CAST(:after_score AS REAL) OR (score = CAST(:after_score AS REAL) AND id > CAST(:after_id AS UUID))"
+            params.update(after_score=after[0], after_id=after[1])
+        sql += " ORDER BY score DESC, id"
+        if limit is not None:
+            sql += " LIMIT :limit"
+            params["limit"] = limit
+        return sql, params
+
+    async def _fetch(self, tenant_id: uuid.UUID, sql: str, params: dict) -> List[Dish]:
+        async with self._tenant_connection(tenant_id) as conn:
+            result = await conn.execute(text(sql), params)
+            return [Dish.from_row(row) for row in result.mappings().all()]
+
+    @traced("repository", DB_QUERY_LATENCY)
+    async def add(self, tenant_id: uuid.UUID, dish: Dish, conn: Optional[AsyncConnection] = None) -> None:
+        """
+        Adds a new dish to a tenant's menu.
+        """
+        logger.debug("Adding dish {} to database...", dish.name)
+        async with self._connect(tenant_id, conn, write=True) as conn:
+            result = await conn.execute(text("""
+                INSERT INTO dish (tenant_id, id, name, description, price, image, rating)
+                VALUES (:tenant_id, :id, :name, :description, :price, :image, :rating)
+                RETURNING version, updated_at
+            """), {"tenant_id": tenant_id, "id": dish.id, "name": dish.name, "description": dish.description, "price": dish.price, "image": dish.image, "rating": dish.rating})
+            dish.version, dish.updated_at = result.one()
+            dish.tenant_id = tenant_id
+
+    @traced("repository", DB_QUERY_LATENCY)
+    async def get(self, tenant_id: uuid.UUID, dish_id: uuid.UUID, fields: Optional[Sequence[str]] = None,
+                  conn: Optional[AsyncConnection] = None) -> Optional[Dish]:
+        """
+        Retrieves a tenant's dish by its ID, selecting only the given fields if provided.
+        The row version and updated_at are always selected, as they validate the dish.
+        """
+        logger.debug("Retrieving dish with id {} from database...", dish_id)
+        async with self._connect(tenant_id, conn) as conn:
+            result = await conn.execute(text(f"SELECT {self._columns(fields)}, version, updated_at FROM dish WHERE tenant_id = :tenant_id AND id = :id"),
+                                        {"tenant_id": tenant_id, "id": dish_id})
+            row = result.mappings().first()
             if row:
-                return Dish.from_dict(dict(row))
+                return Dish.from_row(row)
             return None
 
-    def list(self) -> List[Dish]:
+    @traced("repository", DB_QUERY_LATENCY)
+    async def get_many(self, tenant_id: uuid.UUID, dish_ids: Sequence[uuid.UUID], fields: Optional[Sequence[str]] = None) -> List[Dish]:
         """
-        Lists all dishes.
+        Retrieves a tenant's dishes with the given IDs in a single query, in no particular order; missing IDs are skipped.
         """
-        logger.info("Listing all dishes...")
-        with self.db_connection.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-            cursor.execute("SELECT * FROM dish")
-            rows = cursor.fetchall()
-            return [Dish.from_dict(dict(row)) for row in rows]
+        logger.debug("Retrieving {} dishes from database...", len(dish_ids))
+        sql = f"SELECT {self._columns(fields)}, version, updated_at FROM dish WHERE tenant_id = :tenant_id AND id = ANY(CAST(:ids AS UUID[]))"
+        return await self._fetch(tenant_id, sql, {"tenant_id": tenant_id, "ids": list(dish_ids)})
 
-    def search(self, query: str) -> List[Dish]:
+    @traced("repository", DB_QUERY_LATENCY)
+    async def version(self, tenant_id: uuid.UUID) -> TableVersion:
+        """
+        Retrieves a tenant's dish table version, which changes whenever any of its dishes is added, updated or deleted.
+        """
+        async with self._tenant_connection(tenant_id) as conn:
+            result = await conn.execute(text("SELECT version, updated_at FROM table_version WHERE table_name = 'dish' AND tenant_id = :tenant_id"),
+                                        {"tenant_id": tenant_id})
+            return TableVersion(*result.one())
+
+    @traced("repository", DB_QUERY_LATENCY)
+    async def list(self, tenant_id: uuid.UUID, fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+                   after: Optional[Tuple[str, uuid.UUID]] = None) -> List[Dish]:
+        """
+        Lists a tenant's dishes ordered by name, optionally one keyset page at a time.
         """
-        Searches for dishes matching the query.
+        logger.debug("Listing all dishes...")
+        return await self._fetch(tenant_id, *self._select(tenant_id, None, {}, fields, limit, after))
+
+    @staticmethod
+    def _search_document(row: Mapping) -> Tuple[Dish, str]:
+        data = dict(row)
+        search_vector = data.pop("search_vector")
+        return Dish.from_row(data), search_vector
+
+    @traced("repository", DB_QUERY_LATENCY)
+    async def search_documents(self) -> List[Tuple[Dish, str]]:
+        """
+        Lists the dishes of every tenant, each carrying its tenant_id, with their search_vector as text; for building the search index.
+
+        Tenants are read one at a time, each on a connection pinned to it, so row-level security holds here too.
+        """
+        logger.debug("Listing the search documents of every tenant...")
+        async with self.db_engine.connect() as conn:
+            tenant_ids = (await conn.execute(text("SELECT id FROM tenant ORDER BY id"))).scalars().all()
+        documents = []
+        for tenant_id in tenant_ids:
+            async with self._tenant_connection(tenant_id) as conn:
+                result = await conn.execute(text(f"SELECT tenant_id, {self._columns()}, CAST(search_vector AS TEXT) AS search_vector "
+                                                 f"FROM dish WHERE tenant_id = :tenant_id ORDER BY name, id"), {"tenant_id": tenant_id})
+                documents += [self._search_document(row) for row in result.mappings().all()]
+        return documents
+
+    @traced("repository", DB_QUERY_LATENCY)
+    async def search_documents_by_id(self, tenant_id: uuid.UUID, dish_ids: Sequence[uuid.UUID]) -> List[Tuple[Dish, str]]:
+        """
+        Retrieves those of a tenant's dishes that still exist, each with its search_vector as text, to re-index them after a change.
+        """
+        async with self._tenant_connection(tenant_id) as conn:
+            result = await conn.execute(text(f"SELECT tenant_id, {self._columns()}, CAST(search_vector AS TEXT) AS search_vector "
+                                             f"FROM dish WHERE tenant_id = :tenant_id AND id = ANY(CAST(:ids AS UUID[]))"),
+                                        {"tenant_id": tenant_id, "ids": list(dish_ids)})
+            return [self._search_document(row) for row in result.mappings().all()]
+
+    @traced("repository", DB_QUERY_LATENCY)
+    async def search_terms(self, query: str) -> str:
+        """
+        Returns the tsquery search() runs for the query, rendered as text, with Postgres' stemming and stop words applied.
+        """
+        async with self.db_engine.connect() as conn:
+            result = await conn.execute(text(f"SELECT CAST(to_tsquery('{SEARCH_CONFIG}', :tsquery) AS TEXT)"), {"tsquery": to_prefix_tsquery(query)})
+            return result.scalar()
+
+    @traced("repository", DB_QUERY_LATENCY)
+    async def search(self, tenant_id: uuid.UUID, query: str, fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+                     after: Optional[Tuple[float, uuid.UUID]] = None) -> List[Dish]:
+        """
+        Searches for dishes matching the query, best matches first, optionally one keyset page at a time.
+        Every returned dish carries its relevance score.
+        """
+        logger.debug("Searching for dishes matching query {}...", query)
+        if not to_prefix_tsquery(query):
+            return []
+        return await self._fetch(tenant_id, *self._search_select(tenant_id, query, fields, limit, after))
+
+    async def stream(self, tenant_id: uuid.UUID, query: Optional[str] = None, fields: Optional[Sequence[str]] = None,
+                     batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator[Dish]:
+        """
+        Yields every dish of a tenant (or every one matching the query) from a server-side cursor, batch_size rows at a time,
+        so memory stays flat however large the table is.
+        """
+        logger.debug("Streaming dishes matching query {}...", query)
+        if query is None:
+            sql, params = self._select(tenant_id, None, {}, fields)
+        elif to_prefix_tsquery(query):
+            sql, params = self._search_select(tenant_id, query, fields)
+        else:
+            return
+        async with self._tenant_connection(tenant_id) as conn:
+            result = await conn.stream(text(sql).execution_options(yield_per=batch_size), params)
+            async for partition in result.mappings().partitions(batch_size):
+                for row in partition:
+                    yield Dish.from_row(row)
+
+    @traced("repository", DB_QUERY_LATENCY)
+    async def update(self, tenant_id: uuid.UUID, dish_id: uuid.UUID, changes: Mapping[str, Any],
+                     expected_versions: Optional[Sequence[int]] = None, conn: Optional[AsyncConnection] = None) -> Optional[Dish]:
+        """
+        Updates only the given columns of a tenant's dish in a single statement and returns the new row.
+
+        With expected_versions, the row is only updated if its version is still one of them, so a check
+        and the write it guards cannot be interleaved with another writer. Returns None if nothing was updated.
+        """
+        logger.debug("Updating dish with id {} in database...", dish_id)
+        unknown = set(changes) - set(DISH_FIELDS[1:])
+        if unknown or not changes:
+            raise ValueError(f"Invalid dish update: {', '.join(sorted(unknown)) or 'no columns'}")
+        # Column names are checked against DISH_FIELDS, so they are safe to interpolate into SQL
+        sql = f"UPDATE dish SET {', '.join(f'{column} = :{column}' for column in changes)} WHERE tenant_id = :tenant_id AND id = :id"
+        params = {**changes, "tenant_id": tenant_id, "id": dish_id}
+        if expected_versions is not None:
+            sql += " AND version = ANY(CAST(:expected_versions AS INTEGER[]))"
+            params["expected_versions"] = list(expected_versions)
+        sql += f" RETURNING {', '.join(DISH_FIELDS)}, version, updated_at"
+        async with self._connect(tenant_id, conn, write=True) as conn:
+            row = (await conn.execute(text(sql), params)).mappings().first()
+            return Dish.from_row(row) if row else None
+
+    @asynccontextmanager
+    async def bulk_insert(self, tenant_id: uuid.UUID) -> AsyncIterator[Callable[[List[Dish]], Awaitable[None]]]:
+        """
+        Opens a transaction and yields a function that COPYs a batch of dishes into a tenant's menu.
+
+        Everything copied is committed together when the block exits, or rolled back if it raises.
+        A batch the database rejects (e.g. a duplicate id) raises BulkImportError.
+        """
+        async with self._raw_transaction(tenant_id) as raw_connection:
+
+            async def copy(dishes: List[Dish]) -> None:
+                logger.debug("Copying {} dishes into database...", len(dishes))
+                records = [(tenant_id, dish.id, dish.name, dish.description, dish.price, dish.image) for dish in dishes]
+                try:
+                    await raw_connection.copy_records_to_table("dish", records=records, columns=BULK_COLUMNS)
+                except asyncpg.PostgresError as e:
+                    raise BulkImportError([RowError(None, str(e))])
+
+            yield copy
+
+    async def export(self, tenant_id: uuid.UUID, format: str = "ndjson") -> AsyncIterator[bytes]:
+        """
+        Streams every dish of a tenant, ordered by name, with COPY TO STDOUT as NDJSON or CSV (with a header row).
+
+        Postgres renders the output, so rows are never turned into Python objects. The COPY runs in a background
+        task feeding a bounded queue, so a slow client holds back the database instead of filling memory.
+        """
+        logger.debug("Exporting dishes as {}...", format)
+        columns = ", ".join(DISH_FIELDS)
+        if format == "csv":
+            query, options = f"SELECT {columns} FROM dish WHERE tenant_id = $1 ORDER BY name, id", {"format": "csv", "header": True}
+        else:
+            # JSON never contains raw \x01 or \x02, so csv with them as quote and delimiter passes each object through untouched
+            query = f"SELECT row_to_json(d) FROM (SELECT {columns} FROM dish WHERE tenant_id = $1 ORDER BY name, id) AS d"
+            options = {"format": "csv", "quote": "\x01", "delimiter": "\x02"}
+        queue: asyncio.Queue = asyncio.Queue(maxsize=EXPORT_QUEUE_SIZE)
+
+        async def produce():
+            try:
+                async with self._raw_transaction(tenant_id) as raw_connection:
+                    await raw_connection.copy_from_query(query, tenant_id, output=queue.put, **options)
+            except Exception:
+                await queue.put(None)  # wake the reader, which re-raises from the task
+                raise
+            await queue.put(None)
+
+        task = asyncio.create_task(produce())
+        try:
+            while (chunk := await queue.get()) is not None:
+                yield bytes(chunk)
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
+
+    @traced("repository", DB_QUERY_LATENCY)
+    async def rate(self, tenant_id: uuid.UUID, dish_id: uuid.UUID, user_id: uuid.UUID, rating: float) -> bool:
+        """
+        Records a user's rating of a tenant's dish, replacing their earlier one. Returns False if the dish does not exist.
+
+        Only the rating row is written; a trigger appends the change to rating_delta for fold_ratings.
+        """
+        logger.debug("Rating dish with id {} in database...", dish_id)
+        async with self._tenant_connection(tenant_id, write=True) as conn:
+            result = await conn.execute(text("""
+                INSERT INTO rating (tenant_id, dish_id, user_id, rating)
+                SELECT CAST(:tenant_id AS UUID), CAST(:dish_id AS UUID), CAST(:user_id AS UUID), CAST(:rating AS DECIMAL(2, 1))
+                WHERE EXISTS (SELECT 1 FROM dish WHERE tenant_id = :tenant_id AND id = :dish_id)
+                ON CONFLICT (dish_id, user_id) DO UPDATE SET rating = EXCLUDED.rating, updated_at = CURRENT_TIMESTAMP
+            """), {"tenant_id": tenant_id, "dish_id": dish_id, "user_id": user_id, "rating": rating})
+            return result.rowcount > 0
+
+    @traced("repository", DB_QUERY_LATENCY)
+    async def fold_ratings(self, tenant_id: Optional[uuid.UUID] = None, dish_id: Optional[uuid.UUID] = None,
+                           batch_size: int = RATING_FOLD_BATCH_SIZE) -> List[Tuple[uuid.UUID, uuid.UUID]]:
+        """
+        Folds a batch of pending rating changes, of one tenant's dish or of every tenant, into the count, sum
+        and mean on the dish rows they belong to, and returns the (tenant_id, id) of the dishes that changed.
+
+        Each dish row is written once per batch however many ratings it received. Workers folding at the same
+        time skip each other's locked deltas rather than waiting for them. Rows are matched on the partition
+        key as well as the id, so each update only touches the partition holding the dish. With row-level
+        security on, each tenant's dishes are updated under a pin to that tenant.
         """
-        logger.info(f"Searching for dishes matching query {query}...")
-        with self.db_connection.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-            cursor.execute("SELECT * FROM dish WHERE name ILIKE %s OR description ILIKE %s", (f'%{query}%', f'%{query}%'))
-            rows = cursor.fetchall()
-            return [Dish.from_dict(dict(row)) for row in rows]
+        where = "WHERE tenant_id = :tenant_id AND dish_id = :dish_id" if dish_id is not None else ""
+        async with self.db_engine.begin() as conn:
+            result = await conn.execute(text(f"""
+                WITH folded AS (
+                    DELETE FROM rating_delta
+                    WHERE id IN (SELECT id FROM rating_delta {where} ORDER BY id LIMIT :batch_size FOR UPDATE SKIP LOCKED)
+                    RETURNING tenant_id, dish_id, count_delta, sum_delta
+                )
+                SELECT tenant_id, dish_id, SUM(count_delta) AS count_delta, SUM(sum_delta) AS sum_delta
+                FROM folded GROUP BY tenant_id, dish_id ORDER BY tenant_id
+            """), {"tenant_id": tenant_id, "dish_id": dish_id, "batch_size": batch_size})
+            totals = result.all()
+            # Nothing drained: dish is not written at all, so its statement trigger does not bump the table version
+            if not totals:
+                return []
+            groups = [list(group) for _, group in groupby(totals, key=lambda row: row[0])] if DB_ROW_LEVEL_SECURITY else [totals]
+            changed = []
+            for group in groups:
+                if DB_ROW_LEVEL_SECURITY:
+                    await self._pin(conn, group[0][0])
+                changed += await self._fold(conn, group)
+            return changed
 
-    def update(self, dish: Dish) -> None:
+    @staticmethod
+    async def _fold(conn: AsyncConnection, totals: Sequence[Tuple[uuid.UUID, uuid.UUID, int, Any]]) -> List[Tuple[uuid.UUID, uuid.UUID]]:
         """
-        Updates an existing dish in the database.
+        Adds summed (tenant_id, dish_id, count_delta, sum_delta) rating changes to their dishes.
         """
-        logger.info(f"Updating dish with id {dish.id} in database...")
-        with self.db_connection.cursor() as cursor:
-            cursor.execute("""
-                UPDATE dish
-                SET name = %s, description = %s, price = %s, image = %s, rating = %s
-                WHERE id = %s
-            """, (dish.name, dish.description, dish.price, dish.image, dish.rating, str(dish.id)))
-            self.db_connection.commit()
+        tenant_ids, dish_ids, count_deltas, sum_deltas = (list(column) for column in zip(*totals))
+        result = await conn.execute(text("""
+            UPDATE dish
+            SET rating_count = dish.rating_count + totals.count_delta,
+                rating_sum = dish.rating_sum + totals.sum_delta,
+                rating = CASE WHEN dish.rating_count + totals.count_delta > 0
+                              THEN ROUND((dish.rating_sum + totals.sum_delta) / (dish.rating_count + totals.count_delta), 1)
+                         END
+            FROM unnest(CAST(:tenant_ids AS UUID[]), CAST(:dish_ids AS UUID[]), CAST(:count_deltas AS BIGINT[]),
+                        CAST(:sum_deltas AS NUMERIC[])) AS totals (tenant_id, dish_id, count_delta, sum_delta)
+            WHERE dish.tenant_id = totals.tenant_id AND dish.id = totals.dish_id
+            RETURNING dish.tenant_id, dish.id
+        """), {"tenant_ids": tenant_ids, "dish_ids": dish_ids, "count_deltas": count_deltas, "sum_deltas": sum_deltas})
+        return [(row[0], row[1]) for row in result.all()]
 
-    def delete(self, dish_id: uuid.UUID) -> int:
+    @traced("repository", DB_QUERY_LATENCY)
+    async def delete(self, tenant_id: uuid.UUID, dish_id: uuid.UUID, conn: Optional[AsyncConnection] = None) -> int:
         """
-        Deletes a dish from the database and returns the number of deleted items.
+        Deletes a tenant's dish from the database and returns the number of deleted items.
         """
-        logger.info(f"Deleting dish with id {dish_id} from database...")
-        with self.db_connection.cursor() as cursor:
-            cursor.execute("DELETE FROM dish WHERE id = %s", (str(dish_id),))
-            deleted_count = cursor.rowcount
-            self.db_connection.commit()
-            return deleted_count
+        logger.debug("Deleting dish with id {} from database...", dish_id)
+        async with self._connect(tenant_id, conn, write=True) as conn:
+            result = await conn.execute(text("DELETE FROM dish WHERE tenant_id = :tenant_id AND id = :id"), {"tenant_id": tenant_id, "id": dish_id})
+            return result.rowcount
@@ -0,0 +1,32 @@
+from typing import Any, Optional
+import orjson
+from fastapi import Response, status
+from fastapi.responses import ORJSONResponse
+
+def dumps(content: Any) -> bytes:
+    """
+    Serializes to JSON with orjson, which encodes UUIDs and datetimes natively.
+    """
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+def json_response(content: Any, response: Optional[Response] = None, status_code: int = status.HTTP_200_OK) -> ORJSONResponse:
+    """
+    Renders a body built from trusted dishes straight to JSON.
+
+    Returning a Response skips FastAPI's response_model validation and jsonable_encoder pass, which would
+    otherwise rebuild every dish twice more before encoding it; the response_model still documents the route.
+    FastAPI only merges the headers set on the route's injected response into responses it builds itself,
+    so they are carried over here.
+
+    Args:
+        content (Any): JSON-serializable body
+        response (Response, optional): the route's injected response, holding headers such as ETag and X-Next-Cursor. Defaults to None.
+        status_code (int, optional): status code. Defaults to 200.
+
+    Returns:
+        ORJSONResponse: response
+    """
+    json = ORJSONResponse(content, status_code=status_code)
+    if response is not None:
+        json.raw_headers.extend(response.headers.raw)
+    return json
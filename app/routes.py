@@ -1,18 +1,40 @@
-from typing import List, Optional
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Annotated, Any, AsyncIterator, Dict, List, Literal, Optional, Sequence, Tuple, Union
+import base64
+import json
+import math
 import uuid
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from pydantic import BaseModel
+from pydantic import BaseModel, Base64Bytes, Field, field_validator
 from app.controllers import DishController
-from app.models import User
+from app.services import DishOperation, VersionMismatch
+from app.blob_store import blob_store
+from app.bulk import BULK_FORMATS, BulkImportError, error_report, parse_rows
+from app.models import Dish, Tenant, User, DISH_FIELDS
 from app.database import get_db
+from app.tenants import get_tenant
 from app.user_manager import create_user, get_user_by_email
-from app.auth import get_current_user
+from app.rate_limit import RateLimit, rate_limited
+from app.responses import dumps, json_response
 from loguru import logger
 
 router = APIRouter()
 controller = DishController()
 
+MAX_PAGE_SIZE = 1000
+MAX_BATCH_SIZE = 100  # ids per batchGet, operations per batch
+NDJSON_CHUNK_SIZE = 100  # dishes per chunk written to the socket when streaming
+MIN_RATING, MAX_RATING = 0, 5  # the rating scale; anything outside it is refused with a 422
+
+# Rate limit cost weights, in ordinary requests, for routes that touch many dishes at once
+BATCH_COST = 5
+BULK_COST = 25
+batch_rate_limited = RateLimit(cost=BATCH_COST)
+bulk_rate_limited = RateLimit(cost=BULK_COST)
+
 class DishCreate(BaseModel):
     """
     Dish create model class.
@@ -23,7 +45,26 @@ class DishCreate(BaseModel):
     name: str
     description: str
     price: float
-    image: str
+    image: Optional[Base64Bytes] = None  # Base64 encoded image, stored as raw bytes in the blob store
+
+class DishPatch(BaseModel):
+    """
+    Dish patch model class. Only the fields present in the request are changed.
+
+    Args:
+        BaseModel (_type_): _description_
+    """
+    name: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[float] = None
+    image: Optional[Base64Bytes] = None  # null removes the image
+
+    @field_validator("name", "description", "price")
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may not be null")
+        return value
 
 class DishResponse(BaseModel):
     """
@@ -36,12 +77,127 @@ class DishResponse(BaseModel):
     name: str
     description: str
     price: float
-    image: str
+    image: Optional[str]  # SHA-256 reference, served by GET /dishes/{dish_id}/image
     rating: Optional[float]
 
     class Config:
         from_attributes = True
 
+class DishSummary(BaseModel):
+    """
+    Dish summary model class, returned when only a subset of fields is requested.
+
+    Args:
+        BaseModel (_type_): _description_
+    """
+    id: uuid.UUID
+    name: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[float] = None
+    image: Optional[str] = None
+    rating: Optional[float] = None
+    score: Optional[float] = None  # Relevance, only on search results
+
+class DishBatchGet(BaseModel):
+    """
+    Dish batch get model class.
+
+    Args:
+        BaseModel (_type_): _description_
+    """
+    ids: List[uuid.UUID] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+class DishBatchGetResponse(BaseModel):
+    """
+    Dish batch get response model class.
+
+    Args:
+        BaseModel (_type_): _description_
+    """
+    dishes: List[DishSummary]  # in request order
+    missing: List[uuid.UUID]
+
+class DishCreateOperation(BaseModel):
+    """
+    Batch operation creating a dish.
+
+    Args:
+        BaseModel (_type_): _description_
+    """
+    op: Literal["create"]
+    dish: DishCreate
+
+class DishUpdateOperation(BaseModel):
+    """
+    Batch operation changing the given fields of a dish, optionally only at an expected version (its ETag).
+
+    Args:
+        BaseModel (_type_): _description_
+    """
+    op: Literal["update"]
+    id: uuid.UUID
+    dish: DishPatch
+    version: Optional[int] = None
+
+class DishDeleteOperation(BaseModel):
+    """
+    Batch operation deleting a dish.
+
+    Args:
+        BaseModel (_type_): _description_
+    """
+    op: Literal["delete"]
+    id: uuid.UUID
+
+class DishBatch(BaseModel):
+    """
+    Dish batch model class.
+
+    Args:
+        BaseModel (_type_): _description_
+    """
+    operations: List[Annotated[Union[DishCreateOperation, DishUpdateOperation, DishDeleteOperation], Field(discriminator="op")]] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+class OperationResultResponse(BaseModel):
+    """
+    Batch operation result model class.
+
+    Args:
+        BaseModel (_type_): _description_
+    """
+    status: str  # created, updated, deleted, not_found, version_mismatch or skipped
+    dish: Optional[DishResponse] = None
+
+class DishBatchResponse(BaseModel):
+    """
+    Dish batch response model class.
+
+    Args:
+        BaseModel (_type_): _description_
+    """
+    committed: bool
+    results: List[OperationResultResponse]  # one per operation, in request order
+
+class RowErrorResponse(BaseModel):
+    """
+    Row error response model class.
+
+    Args:
+        BaseModel (_type_): _description_
+    """
+    line: Optional[int]  # line of the row in the input, or None for a whole batch
+    error: str
+
+class BulkImportResponse(BaseModel):
+    """
+    Bulk import response model class.
+
+    Args:
+        BaseModel (_type_): _description_
+    """
+    imported: int
+    errors: List[RowErrorResponse]  # the first rejected rows, when skipping invalid rows
+
 class DishRate(BaseModel):
     """
     Dish rate model class.
@@ -49,20 +205,234 @@ class DishRate(BaseModel):
     Args:
         BaseModel (_type_): _description_
     """
-    rating: float
+    rating: float = Field(ge=MIN_RATING, le=MAX_RATING)  # stored as NUMERIC(2, 1)
 
     class Config:
         from_attributes = True
         
+def parse_fields(fields: Optional[str] = Query(None, description=f"Comma separated subset of {', '.join(DISH_FIELDS)} to return")) -> Optional[Tuple[str, ...]]:
+    """
+    Parse the fields query parameter into a projection.
+
+    Args:
+        fields (str, optional): comma separated field names. Defaults to Query(None).
+
+    Raises:
+        HTTPException: unknown field
+
+    Returns:
+        Tuple[str, ...]: requested fields in response order, always including id, or None for every field
+    """
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(DISH_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(field for field in DISH_FIELDS if field == "id" or field in requested)
+
+def encode_cursor(key: Any, dish_id: uuid.UUID) -> str:
+    """
+    Encode a keyset position as an opaque cursor.
+
+    Args:
+        key (Any): sort key of the last dish of a page (its name, or its score for search)
+        dish_id (uuid.UUID): id of the last dish of a page, the tie breaker
+
+    Returns:
+        str: URL safe cursor
+    """
+    return base64.urlsafe_b64encode(json.dumps([key, str(dish_id)]).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str], key_type: type) -> Optional[Tuple[Any, uuid.UUID]]:
+    """
+    Decode a cursor back into the keyset position it was made from.
+
+    Args:
+        cursor (str, optional): cursor returned with the previous page
+        key_type (type): expected type of the sort key
+
+    Raises:
+        HTTPException: invalid cursor
+
+    Returns:
+        Tuple[Any, uuid.UUID]: keyset position, or None for the first page
+    """
+    if not cursor:
+        return None
+    try:
+        key, dish_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if isinstance(key, bool) or not isinstance(key, (str, int, float)) or not isinstance(dish_id, str):
+            raise TypeError(key)
+        key = key_type(key)
+        if isinstance(key, float) and not math.isfinite(key):
+            raise ValueError(key)  # NaN or Infinity; no score is
+        return key, uuid.UUID(dish_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def parse_cursor(cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page")) -> Optional[Tuple[str, uuid.UUID]]:
+    """
+    Parse the (name, id) cursor of a dish listing.
+    """
+    return decode_cursor(cursor, str)
+
+def parse_search_cursor(cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page")) -> Optional[Tuple[float, uuid.UUID]]:
+    """
+    Parse the (score, id) cursor of a ranked search.
+    """
+    return decode_cursor(cursor, float)
+
+async def ndjson_lines(dishes: AsyncIterator[Dish], fields: Optional[Sequence[str]]) -> AsyncIterator[bytes]:
+    """
+    Serialize a stream of dishes as newline delimited JSON, a chunk of dishes at a time.
+
+    Args:
+        dishes (AsyncIterator[Dish]): dishes read from a server-side cursor
+        fields (Sequence[str], optional): fields to emit
+
+    Yields:
+        bytes: chunk of NDJSON lines
+    """
+    lines = []
+    async for dish in dishes:
+        lines.append(dumps(dish.to_dict(fields)))
+        if len(lines) >= NDJSON_CHUNK_SIZE:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+def paginate(dishes: List[Dish], limit: Optional[int], response: Response, sort_key: str = "name") -> List[Dish]:
+    """
+    Trim the look-ahead row fetched past the page and advertise the next cursor if there was one.
+
+    Args:
+        dishes (List[Dish]): up to limit + 1 dishes
+        limit (int, optional): page size
+        response (Response): response to set the X-Next-Cursor header on
+        sort_key (str, optional): attribute the page is ordered by before id. Defaults to "name".
+
+    Returns:
+        List[Dish]: dishes of this page
+    """
+    if limit is not None and len(dishes) > limit:
+        dishes = dishes[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(getattr(dishes[-1], sort_key), dishes[-1].id)
+    return dishes
+
+def http_date(value: datetime) -> str:
+    """
+    Format a database timestamp as an HTTP date. Timestamps are stored without a time zone, in UTC.
+    """
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+def validators(etag: str, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    """
+    Build the validator headers of a response; clients may keep it but must revalidate before reuse.
+
+    Args:
+        etag (str): entity tag of the response
+        last_modified (datetime, optional): time of the last change. Defaults to None.
+
+    Returns:
+        Dict[str, str]: ETag, Last-Modified and Cache-Control headers
+    """
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+def etag_matches(etag: str, header: Optional[str]) -> bool:
+    """
+    Check an If-None-Match header against an entity tag, using weak comparison.
+
+    Args:
+        etag (str): current entity tag
+        header (str, optional): If-None-Match header
+
+    Returns:
+        bool: True if the client already holds this entity
+    """
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+def not_modified(etag: str, last_modified: Optional[datetime], if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    """
+    Evaluate the conditional headers of a GET. If-Modified-Since only counts when If-None-Match is absent.
+
+    Args:
+        etag (str): current entity tag
+        last_modified (datetime, optional): time of the last change
+        if_none_match (str, optional): If-None-Match header
+        if_modified_since (str, optional): If-Modified-Since header
+
+    Returns:
+        bool: True if a 304 Not Modified should be returned
+    """
+    if if_none_match is not None:
+        return etag_matches(etag, if_none_match)
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+def parse_if_match(if_match: Optional[str] = Header(None)) -> Optional[List[int]]:
+    """
+    Parse an If-Match header into the dish versions a write may apply to.
+
+    Args:
+        if_match (str, optional): strong ETags the client read the dish at. Defaults to Header(None).
+
+    Returns:
+        List[int]: acceptable versions, or None when the write is unconditional (no header, or *)
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    versions = []
+    for tag in if_match.split(","):
+        tag = tag.strip()
+        # Weak tags never match under the strong comparison If-Match requires
+        if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit():
+            versions.append(int(tag[1:-1]))
+    return versions
+
+def to_operation(operation: Union[DishCreateOperation, DishUpdateOperation, DishDeleteOperation]) -> DishOperation:
+    """
+    Convert a batch operation from a request into the service's representation.
+    """
+    if operation.op == "create":
+        return DishOperation("create", changes=operation.dish.model_dump())
+    if operation.op == "update":
+        expected_versions = [operation.version] if operation.version is not None else None
+        return DishOperation("update", operation.id, operation.dish.model_dump(exclude_unset=True), expected_versions)
+    return DishOperation("delete", operation.id)
+
+def dish_etag(dish: Dish) -> str:
+    """
+    Strong ETag of a dish, its row version.
+    """
+    return f'"{dish.version}"'
+
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-async def register(email: str, password: str, name: str, db: AsyncSession = Depends(get_db)):
+async def register(email: str, password: str, name: str, tenant: Tenant = Depends(get_tenant), db: AsyncSession = Depends(get_db)):
     """
-    Register user.
+    Register user with the request's tenant.
 
     Args:
         email (str): user email
         password (str): user password
         name (str): user name
+        tenant (Tenant, optional): tenant the user joins. Defaults to Depends(get_tenant).
         db (AsyncSession, optional): database session. Defaults to Depends(get_db).
 
     Raises:
@@ -71,21 +441,21 @@ async def register(email: str, password: str, name: str, db: AsyncSession = Depe
     Returns:
         User: created user
     """
-    logger.info("Registering user...")
-    user = await get_user_by_email(db, email)
+    logger.info("Registering user with tenant {}...", tenant.slug)
+    user = await get_user_by_email(db, tenant.id, email)
     if user:
         logger.warning("Email already registered")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
     logger.success("User registered")
-    return await create_user(db, email, password, name)
+    return await create_user(db, tenant.id, email, password, name)
 
 @router.get("/me")
-async def read_current_user(current_user: User = Depends(get_current_user)):
+async def read_current_user(current_user: User = Depends(rate_limited)):
     """
     Get current user.
 
     Args:
-        current_user (User, optional): _description_. Defaults to Depends(get_current_user).
+        current_user (User, optional): _description_. Defaults to Depends(rate_limited).
 
     Returns:
         User: current user
@@ -94,29 +464,38 @@ async def read_current_user(current_user: User = Depends(get_current_user)):
     return current_user
 
 @router.post('/dishes', response_model=DishResponse, status_code=status.HTTP_201_CREATED)
-def create_dish(dish: DishCreate, user: User = Depends(get_current_user)):
+async def create_dish(dish: DishCreate, response: Response, user: User = Depends(rate_limited)):
     """
     Create dish.
 
     Args:
         dish (DishCreate): dish create model
-        user (User, optional): user. Defaults to Depends(get_current_user).
+        response (Response): response, used to return the ETag of the new dish
+        user (User, optional): user. Defaults to Depends(rate_limited).
 
     Returns:
         DishResponse: created dish
     """
-    logger.info(f"Creating dish {dish.name}...")
-    created_dish = controller.create_dish(name=dish.name, description=dish.description, price=dish.price, image=dish.image)
-    return created_dish.to_dict()
+    logger.info("Creating dish {}...", dish.name)
+    created_dish = await controller.create_dish(user.tenant_id, name=dish.name, description=dish.description, price=dish.price, image=dish.image)
+    response.headers.update(validators(dish_etag(created_dish), created_dish.updated_at))
+    return json_response(created_dish.to_dict(), response, status_code=status.HTTP_201_CREATED)
 
 @router.get('/dishes/{dish_id}', response_model=DishResponse)
-def get_dish(dish_id: uuid.UUID, user: User = Depends(get_current_user)):
+async def get_dish(dish_id: uuid.UUID, response: Response, if_none_match: Optional[str] = Header(None),
+                   if_modified_since: Optional[str] = Header(None), user: User = Depends(rate_limited)):
     """
     Get dish.
 
+    The row version is returned as a strong ETag and updated_at as Last-Modified; revalidating with
+    If-None-Match (or If-Modified-Since) returns 304 Not Modified while the dish is unchanged.
+
     Args:
         dish_id (uuid.UUID): _description_
-        user (User, optional): _description_. Defaults to Depends(get_current_user).
+        response (Response): response, used to return the validators
+        if_none_match (str, optional): ETags the client already holds. Defaults to Header(None).
+        if_modified_since (str, optional): Last-Modified the client already holds. Defaults to Header(None).
+        user (User, optional): _description_. Defaults to Depends(rate_limited).
 
     Raises:
         HTTPException: Dish not found
@@ -124,86 +503,313 @@ def get_dish(dish_id: uuid.UUID, user: User = Depends(get_current_user)):
     Returns:
         Dish: dish matching id
     """
-    logger.info(f"Getting dish {dish_id}...")
-    dish = controller.get_dish(dish_id)
+    logger.info("Getting dish {}...", dish_id)
+    dish = await controller.get_dish(user.tenant_id, dish_id)
     if dish:
-        logger.success(f"Dish {dish_id} found")
-        return dish.to_dict()
-    logger.warning(f"Dish {dish_id} not found")
+        logger.success("Dish {} found", dish_id)
+        headers = validators(dish_etag(dish), dish.updated_at)
+        if not_modified(headers["ETag"], dish.updated_at, if_none_match, if_modified_since):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        response.headers.update(headers)
+        return json_response(dish.to_dict(), response)
+    logger.warning("Dish {} not found", dish_id)
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dish not found")
 
-@router.get('/dishes', response_model=List[DishResponse])
-def list_dishes(user: User = Depends(get_current_user)):
+@router.get('/dishes/{dish_id}/image', response_class=FileResponse)
+async def get_dish_image(dish_id: uuid.UUID, if_none_match: Optional[str] = Header(None), user: User = Depends(rate_limited)):
     """
-    List dishes.
+    Get dish image.
+
+    Streams the raw image from the blob store. The content hash doubles as a strong ETag, so clients
+    revalidating with If-None-Match get a 304 without the file being read.
 
     Args:
-        user (User, optional): _description_. Defaults to Depends(get_current_user).
+        dish_id (uuid.UUID): dish id
+        if_none_match (str, optional): ETag the client already holds. Defaults to Header(None).
+        user (User, optional): user. Defaults to Depends(rate_limited).
+
+    Raises:
+        HTTPException: Image not found
+
+    Returns:
+        FileResponse: dish image
+    """
+    logger.info("Getting image of dish {}...", dish_id)
+    digest = await controller.get_dish_image(user.tenant_id, dish_id)
+    if digest is None:
+        logger.warning("Image of dish {} not found", dish_id)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    headers = validators(f'"{digest}"')
+    if etag_matches(headers["ETag"], if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    # FileResponse streams the file in chunks read off the event loop; uvicorn has no http.response.pathsend, so no zero-copy send
+    return FileResponse(blob_store.path(digest), media_type=await blob_store.media_type(digest), headers=headers)
+
+@router.get('/dishes', response_model=List[DishSummary], response_model_exclude_unset=True)
+async def list_dishes(response: Response, fields: Optional[Tuple[str, ...]] = Depends(parse_fields),
+                      limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), after: Optional[Tuple[str, uuid.UUID]] = Depends(parse_cursor),
+                      stream: bool = False, if_none_match: Optional[str] = Header(None), if_modified_since: Optional[str] = Header(None),
+                      user: User = Depends(rate_limited)):
+    """
+    List dishes ordered by name.
+
+    The dish table version is returned as a weak ETag, so a client revalidating an unchanged listing
+    gets 304 Not Modified before any dish is read.
+
+    Args:
+        response (Response): response, used to return the X-Next-Cursor header and the validators
+        fields (Tuple[str, ...], optional): fields to return, e.g. ?fields=name,price for a menu. Defaults to every field.
+        limit (int, optional): page size; the next page is requested with ?cursor=<X-Next-Cursor>. Defaults to no paging.
+        after (Tuple[str, uuid.UUID], optional): keyset position decoded from ?cursor. Defaults to the first page.
+        stream (bool, optional): stream every dish as NDJSON from a server-side cursor. Defaults to False.
+        if_none_match (str, optional): ETags the client already holds. Defaults to Header(None).
+        if_modified_since (str, optional): Last-Modified the client already holds. Defaults to Header(None).
+        user (User, optional): _description_. Defaults to Depends(rate_limited).
 
     Returns:
         List[Dish]: list of dishes
     """
     logger.info("Listing dishes...")
-    dishes = controller.list_dishes()
+    # Read before the dishes, so the ETag is never newer than the body it is sent with
+    version = await controller.get_dishes_version(user.tenant_id)
+    headers = validators(f'W/"{version.version}"', version.updated_at)
+    if not_modified(headers["ETag"], version.updated_at, if_none_match, if_modified_since):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if stream:
+        return StreamingResponse(ndjson_lines(controller.stream_dishes(user.tenant_id, fields=fields), fields), media_type="application/x-ndjson", headers=headers)
+    response.headers.update(headers)
+    dishes = paginate(await controller.list_dishes(user.tenant_id, fields=fields, limit=limit + 1 if limit else None, after=after), limit, response)
     if dishes:
-        logger.success(f"{len(dishes)} dishes found. ")
-        return [dish.to_dict() for dish in dishes]
+        logger.success("{} dishes found. ", len(dishes))
+        return json_response([dish.to_dict(fields) for dish in dishes], response)
     logger.error("No dishes found.")
-    return []
+    return json_response([], response)
 
-@router.get('/search', response_model=List[DishResponse])
-def search_dishes(query: str, user: User = Depends(get_current_user)):
+@router.get('/search', response_model=List[DishSummary], response_model_exclude_unset=True)
+async def search_dishes(query: str, response: Response, fields: Optional[Tuple[str, ...]] = Depends(parse_fields),
+                        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), after: Optional[Tuple[float, uuid.UUID]] = Depends(parse_search_cursor),
+                        stream: bool = False, if_none_match: Optional[str] = Header(None), if_modified_since: Optional[str] = Header(None),
+                        user: User = Depends(rate_limited)):
     """
-    Search dishes.
+    Search dishes, best matches first.
+
+    Every word of the query is prefix matched against the name and description, and names within a typo
+    of the query also match, so ?query=lemb&fields=name&limit=10 works as autocomplete. Each result
+    carries its relevance score. Like listings, results are validated by the dish table version.
 
     Args:
         query (str): search query
-        user (User, optional): _description_. Defaults to Depends(get_current_user).
+        response (Response): response, used to return the X-Next-Cursor header and the validators
+        fields (Tuple[str, ...], optional): fields to return. Defaults to every field.
+        limit (int, optional): page size. Defaults to no paging.
+        after (Tuple[float, uuid.UUID], optional): (score, id) position decoded from ?cursor. Defaults to the first page.
+        stream (bool, optional): stream every match as NDJSON from a server-side cursor. Defaults to False.
+        if_none_match (str, optional): ETags the client already holds. Defaults to Header(None).
+        if_modified_since (str, optional): Last-Modified the client already holds. Defaults to Header(None).
+        user (User, optional): _description_. Defaults to Depends(rate_limited).
 
     Returns:
         List[Dish]: list of dishes matching query
     """
-    logger.info(f"Searching dishes for {query}...")
-    dishes = controller.search_dishes(query)
+    logger.info("Searching dishes for {}...", query)
+    version = await controller.get_dishes_version(user.tenant_id)
+    headers = validators(f'W/"{version.version}"', version.updated_at)
+    if not_modified(headers["ETag"], version.updated_at, if_none_match, if_modified_since):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    output_fields = fields + ("score",) if fields is not None else None
+    if stream:
+        return StreamingResponse(ndjson_lines(controller.stream_dishes(user.tenant_id, query, fields=fields), output_fields), media_type="application/x-ndjson", headers=headers)
+    response.headers.update(headers)
+    dishes = paginate(await controller.search_dishes(user.tenant_id, query, fields=fields, limit=limit + 1 if limit else None, after=after), limit, response, sort_key="score")
     if dishes:
-        logger.success(f"{len(dishes)} dishes found. ")
-        return [dish.to_dict() for dish in dishes]
+        logger.success("{} dishes found. ", len(dishes))
+        return json_response([dish.to_dict(output_fields) for dish in dishes], response)
     logger.error("No dishes found.")
-    return [dish.to_dict() for dish in dishes]
+    return json_response([], response)
+
+@router.post('/dishes:bulk', response_model=BulkImportResponse, status_code=status.HTTP_201_CREATED)
+async def import_dishes(request: Request, skip_invalid: bool = False, content_type: Optional[str] = Header(None),
+                        user: User = Depends(bulk_rate_limited)):
+    """
+    Import dishes in bulk.
+
+    The body is NDJSON, or CSV with a header row when sent as text/csv, in the shape GET /dishes:export returns;
+    images are base64 or the reference of a stored image. It is read as it arrives and copied into the database
+    in batches, all in one transaction.
+
+    Args:
+        request (Request): request, whose body is streamed
+        skip_invalid (bool, optional): import the valid rows even if some are rejected. Defaults to False.
+        content_type (str, optional): text/csv for CSV, anything else for NDJSON. Defaults to Header(None).
+        user (User, optional): _description_. Defaults to Depends(bulk_rate_limited).
+
+    Raises:
+        HTTPException: invalid rows, nothing imported
+
+    Returns:
+        BulkImportResponse: number of dishes imported and rejected rows
+    """
+    format = "csv" if content_type and content_type.split(";")[0].strip().lower() == BULK_FORMATS["csv"] else "ndjson"
+    logger.info("Importing dishes from {}...", format)
+    try:
+        imported, errors = await controller.import_dishes(user.tenant_id, parse_rows(request.stream(), format), skip_invalid=skip_invalid)
+    except BulkImportError as e:
+        logger.warning("Import rejected: {} invalid rows", len(e.errors))
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail={"imported": 0, "errors": error_report(e.errors)})
+    logger.success("{} dishes imported", imported)
+    return {"imported": imported, "errors": error_report(errors)}
+
+@router.get('/dishes:export')
+async def export_dishes(format: Literal["ndjson", "csv"] = "ndjson", user: User = Depends(bulk_rate_limited)):
+    """
+    Export every dish, ordered by name, as NDJSON or CSV.
+
+    Args:
+        format (str, optional): ndjson or csv. Defaults to "ndjson".
+        user (User, optional): _description_. Defaults to Depends(bulk_rate_limited).
+
+    Returns:
+        StreamingResponse: dishes, streamed from COPY TO STDOUT
+    """
+    logger.info("Exporting dishes as {}...", format)
+    return StreamingResponse(controller.export_dishes(user.tenant_id, format), media_type=BULK_FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="dishes.{format}"'})
+
+@router.post('/dishes:batchGet', response_model=DishBatchGetResponse, response_model_exclude_unset=True)
+async def batch_get_dishes(batch: DishBatchGet, fields: Optional[Tuple[str, ...]] = Depends(parse_fields), user: User = Depends(batch_rate_limited)):
+    """
+    Get several dishes in one request, e.g. every card of a page.
+
+    Dishes are served from the cache where possible and the rest are read with a single query.
+
+    Args:
+        batch (DishBatchGet): ids of the dishes
+        fields (Tuple[str, ...], optional): fields to return. Defaults to every field.
+        user (User, optional): _description_. Defaults to Depends(batch_rate_limited).
+
+    Returns:
+        DishBatchGetResponse: dishes found, in request order, and the ids that were not
+    """
+    logger.info("Getting {} dishes...", len(batch.ids))
+    dishes = await controller.get_dishes(user.tenant_id, batch.ids, fields=fields)
+    found = {dish.id for dish in dishes}
+    return json_response({"dishes": [dish.to_dict(fields) for dish in dishes], "missing": [dish_id for dish_id in dict.fromkeys(batch.ids) if dish_id not in found]})
+
+@router.post('/dishes:batch', response_model=DishBatchResponse, response_model_exclude_none=True)
+async def batch_dishes(batch: DishBatch, user: User = Depends(batch_rate_limited)):
+    """
+    Create, update and delete dishes in one transaction.
+
+    Operations are applied in order. If one cannot be applied (a missing dish, or an update whose version
+    no longer matches) nothing is committed, the response is 409 Conflict and the results say which one failed.
+
+    Args:
+        batch (DishBatch): operations to apply
+        user (User, optional): _description_. Defaults to Depends(batch_rate_limited).
+
+    Returns:
+        DishBatchResponse: whether the batch was committed and a result per operation
+    """
+    logger.info("Applying a batch of {} operations...", len(batch.operations))
+    committed, results = await controller.apply_batch(user.tenant_id, [to_operation(operation) for operation in batch.operations])
+    if committed:
+        logger.success("Batch of {} operations committed", len(results))
+    else:
+        logger.warning("Batch rolled back")
+    # Null fields are left out, dish fields included, as response_model_exclude_none documents
+    body = {"committed": committed, "results": [
+        {"status": result.status, "dish": {key: value for key, value in result.dish.to_dict().items() if value is not None}}
+        if result.dish else {"status": result.status}
+        for result in results
+    ]}
+    return json_response(body, status_code=status.HTTP_200_OK if committed else status.HTTP_409_CONFLICT)
 
 @router.put('/dishes/{dish_id}', response_model=DishResponse)
-def update_dish(dish_id: uuid.UUID, dish: DishCreate, user: User = Depends(get_current_user)):
+async def update_dish(dish_id: uuid.UUID, dish: DishCreate, response: Response,
+                      expected_versions: Optional[List[int]] = Depends(parse_if_match), user: User = Depends(rate_limited)):
     """
     Update dish.
 
+    With If-Match, the update only applies if the dish is still at the ETag the client read, so two
+    clients editing the same dish cannot silently overwrite each other.
+
     Args:
         dish_id (uuid.UUID): dish id
         dish (DishCreate): dish create model
-        user (User, optional): _description_. Defaults to Depends(get_current_user).
+        response (Response): response, used to return the new validators
+        expected_versions (List[int], optional): versions decoded from If-Match. Defaults to an unconditional update.
+        user (User, optional): _description_. Defaults to Depends(rate_limited).
 
     Raises:
         HTTPException: Dish not found
+        HTTPException: Dish has changed (If-Match failed)
 
     Returns:
         Dish: updated dish
     """
-    logger.info(f"Updating dish {dish_id}...")
-    updated_dish = controller.update_dish(dish_id=dish_id, name=dish.name, description=dish.description, price=dish.price, image=dish.image)
+    logger.info("Updating dish {}...", dish_id)
+    try:
+        updated_dish = await controller.update_dish(user.tenant_id, dish_id=dish_id, name=dish.name, description=dish.description, price=dish.price,
+                                                    image=dish.image, expected_versions=expected_versions)
+    except VersionMismatch:
+        logger.warning("Dish {} has changed, not updated", dish_id)
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Dish has changed")
     if updated_dish:
-        logger.success(f"Dish {dish_id} updated")
-        return updated_dish.to_dict()
-    logger.warning(f"Dish {dish_id} not found")
+        logger.success("Dish {} updated", dish_id)
+        response.headers.update(validators(dish_etag(updated_dish), updated_dish.updated_at))
+        return json_response(updated_dish.to_dict(), response)
+    logger.warning("Dish {} not found", dish_id)
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dish not found")
+
+@router.patch('/dishes/{dish_id}', response_model=DishResponse)
+async def patch_dish(dish_id: uuid.UUID, dish: DishPatch, response: Response,
+                     expected_versions: Optional[List[int]] = Depends(parse_if_match), user: User = Depends(rate_limited)):
+    """
+    Patch dish.
+
+    Changes only the fields sent, in a single UPDATE that returns the new dish, e.g. {"price": 5.5}.
+    Honours If-Match like PUT.
+
+    Args:
+        dish_id (uuid.UUID): dish id
+        dish (DishPatch): fields to change
+        response (Response): response, used to return the new validators
+        expected_versions (List[int], optional): versions decoded from If-Match. Defaults to an unconditional update.
+        user (User, optional): _description_. Defaults to Depends(rate_limited).
+
+    Raises:
+        HTTPException: Dish not found
+        HTTPException: Dish has changed (If-Match failed)
+
+    Returns:
+        Dish: patched dish
+    """
+    logger.info("Patching dish {}...", dish_id)
+    try:
+        patched_dish = await controller.patch_dish(user.tenant_id, dish_id, dish.model_dump(exclude_unset=True), expected_versions=expected_versions)
+    except VersionMismatch:
+        logger.warning("Dish {} has changed, not patched", dish_id)
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Dish has changed")
+    if patched_dish:
+        logger.success("Dish {} patched", dish_id)
+        response.headers.update(validators(dish_etag(patched_dish), patched_dish.updated_at))
+        return json_response(patched_dish.to_dict(), response)
+    logger.warning("Dish {} not found", dish_id)
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dish not found")
 
 @router.put('/dishes/{dish_id}/rate', response_model=DishResponse)
-def rate_dish(dish_id: uuid.UUID, rating: DishRate, user: User = Depends(get_current_user)):
+async def rate_dish(dish_id: uuid.UUID, rating: DishRate, response: Response, user: User = Depends(rate_limited)):
     """
     Rate dish.
 
+    Each user has one rating per dish and rating again replaces it. The dish's rating is the mean of
+    every user's rating, which includes this one within RATING_REFRESH_INTERVAL seconds.
+
     Args:
         dish_id (uuid.UUID): _description_
         rating (DishRate): _description_
-        user (User, optional): _description_. Defaults to Depends(get_current_user).
+        response (Response): response, used to return the new validators
+        user (User, optional): _description_. Defaults to Depends(rate_limited).
 
     Raises:
         HTTPException: Dish not found
@@ -211,28 +817,29 @@ def rate_dish(dish_id: uuid.UUID, rating: DishRate, user: User = Depends(get_cur
     Returns:
         dict: rated dish
     """
-    logger.info(f"Rating dish {dish_id}...")
-    rated_dish = controller.rate_dish(dish_id=dish_id, rating=rating.rating)
+    logger.info("Rating dish {}...", dish_id)
+    rated_dish = await controller.rate_dish(user.tenant_id, dish_id=dish_id, user_id=user.id, rating=rating.rating)
     if rated_dish:
-        logger.success(f"Dish {dish_id} rated")
-        return rated_dish.to_dict()
-    logger.warning(f"Dish {dish_id} not found")
+        logger.success("Dish {} rated", dish_id)
+        response.headers.update(validators(dish_etag(rated_dish), rated_dish.updated_at))
+        return json_response(rated_dish.to_dict(), response)
+    logger.warning("Dish {} not found", dish_id)
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dish not found")
 
 @router.delete('/dishes/{dish_id}', status_code=status.HTTP_204_NO_CONTENT)
-def delete_dish(dish_id: uuid.UUID, user: User = Depends(get_current_user)):
+async def delete_dish(dish_id: uuid.UUID, user: User = Depends(rate_limited)):
     """
     Delete dish.
 
     Args:
         dish_id (uuid.UUID): _description_
-        user (User, optional): _description_. Defaults to Depends(get_current_user).
+        user (User, optional): _description_. Defaults to Depends(rate_limited).
 
     Returns:
         _type_: _description_
     """
-    logger.info(f"Deleting dish {dish_id}...")
-    deleted_count = controller.delete_dish(dish_id)
+    logger.info("Deleting dish {}...", dish_id)
+    deleted_count = await controller.delete_dish(user.tenant_id, dish_id)
     if deleted_count > 0:
-        logger.success(f"Dish {dish_id} deleted")
+        logger.success("Dish {} deleted", dish_id)
     return {"deleted": deleted_count}
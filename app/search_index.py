@@ -0,0 +1,476 @@
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+import asyncio
+import json
+import os
+import re
+import struct
+import uuid
+import asyncpg
+from loguru import logger
+from app.models import Dish
+
+try:
+    import snowballstemmer
+except ImportError:
+    snowballstemmer = None
+
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "false").lower() in ("1", "true", "yes")
+# A tenant with more dishes than this is left out of the index, and its searches go to Postgres
+SEARCH_INDEX_MAX_DISHES = int(os.getenv("SEARCH_INDEX_MAX_DISHES", 5000))
+
+# Channel the dish table trigger publishes {"op": ..., "tenant_id": ..., "id": ...} payloads on
+DISH_CHANNEL = "dish_changes"
+# Seconds a worker gathers a tenant's dish change notifications before re-indexing them with one query
+DISH_CHANGE_COALESCE_DELAY = float(os.getenv("DISH_CHANGE_COALESCE_DELAY", 0.05))
+
+# ts_rank_cd's default weights of D, C, B and A lexemes, as the float4 values Postgres holds them in
+RANK_WEIGHTS = (0.1, 0.2, 0.4, 1.0)
+# pg_trgm.word_similarity_threshold, which decides the <% operator; the index assumes the Postgres default
+WORD_SIMILARITY_THRESHOLD = 0.6
+
+# Stop words of Postgres' english dictionary (tsearch_data/english.stop), which to_tsquery drops
+ENGLISH_STOP_WORDS = frozenset("""
+    a about above after again against all am an and any are as at be because been before being below
+    between both but by can did do does doing don down during each few for from further had has have having
+    he her here hers herself him himself his how i if in into is it its itself just me more most my myself
+    no nor not now of off on once only or other our ours ourselves out over own s same she should so some
+    such t than that the their theirs them themselves then there these they this those through to too under
+    until up very was we were what when where which while who whom why will with you your yours yourself
+    yourselves
+""".split())
+
+_WORD_RE = re.compile(r"\w+")
+# Words Postgres parses as asciiword tokens and stems with the Snowball english stemmer; longer ones are left to it
+_STEMMED_WORD_RE = re.compile(r"[a-z]{1,100}")
+# pg_trgm splits words on anything but letters and digits
+_TRIGRAM_WORD_RE = re.compile(r"[^\W_]+")
+# A lexeme of a tsvector or tsquery as Postgres renders it, quotes doubled and backslashes escaped
+_LEXEME = r"'((?:[^'\\]|''|\\.)*)'"
+_TSVECTOR_ENTRY_RE = re.compile(_LEXEME + r"(?::([0-9A-D,]+))?")
+_TSQUERY_OPERAND_RE = re.compile(_LEXEME + r"(:\*)?$")
+
+# Lexeme positions of a tsvector: lexeme -> [(position, weight)], weight 3 for A down to 0 for D
+Document = Dict[str, List[Tuple[int, int]]]
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    Splits text into lowercase words, the unit both the SQL and in-memory search match on.
+    """
+    return _WORD_RE.findall(text.lower()) if text else []
+
+def float4(value: float) -> float:
+    """
+    Rounds to the nearest float4, the type Postgres computes search scores in.
+    """
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+_INVERSE_WEIGHTS = tuple(1.0 / float4(weight) for weight in RANK_WEIGHTS)
+
+def _unquote(lexeme: str) -> str:
+    return re.sub(r"''|\\(.)", lambda match: match.group(1) or "'", lexeme)
+
+def parse_tsvector(text: str) -> Document:
+    """
+    Parses a tsvector rendered as text, e.g. 'lembas':1A 'bread':2A,5B.
+    """
+    document: Document = {}
+    for match in _TSVECTOR_ENTRY_RE.finditer(text):
+        positions = document.setdefault(_unquote(match.group(1)), [])
+        for position in (match.group(2) or "").split(","):
+            if position:
+                weight = position[-1] if position[-1] in "ABCD" else "D"
+                positions.append((int(position.rstrip("ABCD")), "DCBA".index(weight)))
+    return document
+
+class Term(NamedTuple):
+    lexeme: str
+    prefix: bool
+
+def parse_tsquery(text: str) -> Optional[Tuple[Term, ...]]:
+    """
+    Parses a tsquery rendered as text into the lexemes all of which must match.
+
+    Returns None for anything but a conjunction of plain or prefix lexemes, such as the phrase Postgres makes
+    of a hyphenated word, which the index does not evaluate. An empty query (only stop words) has no terms.
+    """
+    if not text.strip():
+        return ()
+    terms = []
+    for operand in text.split(" & "):
+        match = _TSQUERY_OPERAND_RE.match(operand.strip())
+        if match is None:
+            return None
+        terms.append(Term(_unquote(match.group(1)), match.group(2) is not None))
+    return tuple(terms)
+
+_stemmer = snowballstemmer.stemmer("english") if snowballstemmer is not None else None
+
+def query_terms(query: str) -> Optional[Tuple[Term, ...]]:
+    """
+    The terms of the tsquery DishRepository.search runs for the query, derived without asking Postgres.
+
+    Only a query made of plain ASCII words is derived: each is dropped if it is a stop word and otherwise
+    stemmed by the same Snowball english stemmer Postgres uses, as a prefix lexeme. Returns None for any
+    other query (digits, accents, apostrophes...), or without the snowballstemmer package, in which case
+    the tsquery has to come from DishRepository.search_terms.
+    """
+    words = tokenize(query)
+    if _stemmer is None or not all(_STEMMED_WORD_RE.fullmatch(word) for word in words):
+        return None
+    return tuple(Term(_stemmer.stemWord(word), True) for word in words if word not in ENGLISH_STOP_WORDS)
+
+def trigrams(text: str) -> List[str]:
+    """
+    The trigrams of every word of the text in order, duplicates included, as pg_trgm generates them:
+    words are lowercased and padded with two spaces in front and one behind.
+    """
+    result = []
+    for word in _TRIGRAM_WORD_RE.findall(text):
+        padded = f"  {word.lower()} "
+        result.extend(padded[index:index + 3] for index in range(len(padded) - 2))
+    return result
+
+def _similarity(count: int, query_length: int, extent_length: int) -> float:
+    return float4(count / (query_length + extent_length - count))
+
+def word_similarity(query_trigrams: Set[str], text_trigrams: Sequence[str]) -> float:
+    """
+    pg_trgm's word_similarity: the greatest similarity between the query's trigrams and those of any
+    extent of the text, found with the same iterative procedure so that the float4 result is identical.
+    """
+    query_length = len(query_trigrams)
+    last_position: Dict[str, int] = {}
+    extent_length = count = 0
+    lower = -1
+    best = 0.0
+    for index, trigram in enumerate(text_trigrams):
+        found = trigram in query_trigrams
+        if lower >= 0 or found:
+            if last_position.get(trigram, -1) < 0:
+                extent_length += 1
+                if found:
+                    count += 1
+            last_position[trigram] = index
+        if not found:
+            continue
+        upper = index
+        if lower == -1:
+            lower = index
+            extent_length = 1
+        current = _similarity(count, query_length, extent_length)
+        # Try moving the lower bound up for a greater similarity
+        tmp_count, tmp_length, previous_lower = count, extent_length, lower
+        for tmp_lower in range(lower, upper + 1):
+            candidate = _similarity(tmp_count, query_length, tmp_length)
+            if candidate > current:
+                current, extent_length, lower, count = candidate, tmp_length, tmp_lower, tmp_count
+            tmp_trigram = text_trigrams[tmp_lower]
+            if last_position.get(tmp_trigram, -1) == tmp_lower:
+                tmp_length -= 1
+                if tmp_trigram in query_trigrams:
+                    tmp_count -= 1
+        best = max(best, current)
+        for tmp_lower in range(previous_lower, lower):
+            tmp_trigram = text_trigrams[tmp_lower]
+            if last_position.get(tmp_trigram, -1) == tmp_lower:
+                last_position[tmp_trigram] = -1
+    return best
+
+def _matches(term: Term, lexeme: str) -> bool:
+    return lexeme.startswith(term.lexeme) if term.prefix else lexeme == term.lexeme
+
+def _cover_bound(doc: List[Tuple[Tuple[int, int, bytes], Set[int]]], indexes: Iterable[int], term_count: int) -> Optional[int]:
+    # The first index, walking indexes, by which every term has been seen
+    seen: Set[int] = set()
+    for index in indexes:
+        seen |= doc[index][1]
+        if len(seen) == term_count:
+            return index
+    return None
+
+def rank_cd(document: Document, terms: Sequence[Term]) -> float:
+    """
+    Postgres' ts_rank_cd with the default weights and no normalization, for a conjunction of terms.
+
+    Sums over the covers (minimal stretches of the document holding every term) their weight,
+    divided by one plus the number of other words within them.
+    """
+    if not terms:
+        return 0.0
+    # Matching positions in document order; a position matched by several terms is one entry
+    entries: Dict[Tuple[int, int, bytes], Set[int]] = {}
+    for number, term in enumerate(terms):
+        for lexeme, positions in document.items():
+            if _matches(term, lexeme):
+                for position, weight in positions:
+                    entries.setdefault((position, weight, lexeme.encode()), set()).add(number)
+    doc = sorted(entries.items())
+    rank = 0.0
+    start = 0
+    while True:
+        # The first cover ending at or after start, narrowed from the right to its shortest form
+        end = _cover_bound(doc, range(start, len(doc)), len(terms))
+        if end is None:
+            break
+        begin = _cover_bound(doc, range(end, start - 1, -1), len(terms))
+        inverse_sum = 0.0
+        for (_, weight, _), _ in doc[begin:end + 1]:
+            inverse_sum += _INVERSE_WEIGHTS[weight]
+        noise = (doc[end][0][0] - doc[begin][0][0]) - (end - begin)
+        if noise < 0:
+            noise = (end - begin) // 2
+        rank += (end - begin + 1) / inverse_sum / (1 + noise)
+        start = begin + 1
+    return float4(rank)
+
+class TenantSearchIndex:
+    """
+    One tenant's indexed dishes: their tsvectors, searchable by lexeme prefix, and their name trigrams.
+    """
+    def __init__(self):
+        self.dishes: Dict[uuid.UUID, Dish] = {}
+        self.documents: Dict[uuid.UUID, Document] = {}
+        self.name_trigrams: Dict[uuid.UUID, List[str]] = {}
+        self._lexemes: Dict[str, Set[uuid.UUID]] = {}
+        self._vocabulary: List[str] = []  # sorted lexemes, for prefix lookups with bisect
+        self._trigrams: Dict[str, Set[uuid.UUID]] = {}
+
+    def __len__(self) -> int:
+        return len(self.dishes)
+
+    def add(self, dish: Dish, search_vector: str) -> None:
+        document = parse_tsvector(search_vector)
+        self.dishes[dish.id] = dish
+        self.documents[dish.id] = document
+        self.name_trigrams[dish.id] = name_trigrams = trigrams(dish.name)
+        for lexeme in document:
+            if lexeme not in self._lexemes:
+                self._lexemes[lexeme] = set()
+                insort(self._vocabulary, lexeme)
+            self._lexemes[lexeme].add(dish.id)
+        for trigram in set(name_trigrams):
+            self._trigrams.setdefault(trigram, set()).add(dish.id)
+
+    def remove(self, dish_id: uuid.UUID) -> None:
+        if self.dishes.pop(dish_id, None) is None:
+            return
+        for lexeme in self.documents.pop(dish_id):
+            dish_ids = self._lexemes[lexeme]
+            dish_ids.discard(dish_id)
+            if not dish_ids:
+                del self._lexemes[lexeme]
+                del self._vocabulary[bisect_left(self._vocabulary, lexeme)]
+        for trigram in set(self.name_trigrams.pop(dish_id)):
+            dish_ids = self._trigrams[trigram]
+            dish_ids.discard(dish_id)
+            if not dish_ids:
+                del self._trigrams[trigram]
+
+    def _term_matches(self, term: Term) -> Set[uuid.UUID]:
+        if not term.prefix:
+            return set(self._lexemes.get(term.lexeme, ()))
+        matches: Set[uuid.UUID] = set()
+        index = bisect_left(self._vocabulary, term.lexeme)
+        while index < len(self._vocabulary) and self._vocabulary[index].startswith(term.lexeme):
+            matches |= self._lexemes[self._vocabulary[index]]
+            index += 1
+        return matches
+
+    def text_matches(self, terms: Sequence[Term]) -> Set[uuid.UUID]:
+        """
+        Dishes whose tsvector matches every term, as search_vector @@ tsquery; an empty query matches nothing.
+        """
+        matches: Optional[Set[uuid.UUID]] = None
+        for term in terms:
+            matches = self._term_matches(term) if matches is None else matches & self._term_matches(term)
+            if not matches:
+                break
+        return matches or set()
+
+    def trigram_candidates(self, query_trigrams: Set[str]) -> Set[uuid.UUID]:
+        """
+        Dishes sharing enough trigrams with the query for their word similarity to reach the threshold:
+        a similarity of count / (query + extent - count) needs count to be that share of the query at least.
+        """
+        counts = Counter(dish_id for trigram in query_trigrams for dish_id in self._trigrams.get(trigram, ()))
+        needed = WORD_SIMILARITY_THRESHOLD * len(query_trigrams) * (1 - 1e-6)
+        return {dish_id for dish_id, count in counts.items() if count >= needed}
+
+class DishSearchIndex:
+    """
+    In-process search index reproducing DishRepository.search.
+
+    Every dish is indexed with the search_vector Postgres generated for it, so the same lexemes match,
+    and with its name's trigrams. A dish matches when its tsvector matches the query's tsquery or, for typo
+    tolerance, when the query's word similarity to its name reaches the <% threshold. It scores ts_rank_cd
+    plus that word similarity, computed as Postgres does in float4, and results come back in the same
+    (score DESC, id) order, so a cursor issued by either path continues on the other.
+
+    The tsquery of a plain ASCII query is derived in process (see query_terms); any other is made by Postgres
+    (see DishRepository.search_terms), and queries that do not come out as a conjunction of lexemes are left to it.
+
+    Each tenant is indexed separately, up to max_dishes dishes: a larger tenant is dropped from the index
+    until the next rebuild, and only its searches go to Postgres.
+    """
+    def __init__(self, max_dishes: int = SEARCH_INDEX_MAX_DISHES):
+        self.max_dishes = max_dishes
+        self.ready = False
+        self._tenants: Dict[uuid.UUID, TenantSearchIndex] = {}
+        self._oversized: Set[uuid.UUID] = set()
+
+    def build(self, documents: Iterable[Tuple[Dish, str]]) -> None:
+        """
+        Replaces the index contents with dishes carrying their tenant_id, each with its search_vector as text.
+        """
+        self._tenants = {}
+        self._oversized = set()
+        for dish, search_vector in documents:
+            if dish.tenant_id in self._oversized:
+                continue
+            tenant = self._tenants.setdefault(dish.tenant_id, TenantSearchIndex())
+            if len(tenant) >= self.max_dishes:
+                self._drop(dish.tenant_id)
+                continue
+            tenant.add(dish, search_vector)
+        self.ready = True
+        logger.info("In-memory search index built with {} dishes of {} tenants", sum(map(len, self._tenants.values())), len(self._tenants))
+
+    def _drop(self, tenant_id: uuid.UUID) -> None:
+        logger.warning("Tenant {} has more than {} dishes, its searches go to the database", tenant_id, self.max_dishes)
+        self._tenants.pop(tenant_id, None)
+        self._oversized.add(tenant_id)
+
+    def covers(self, tenant_id: uuid.UUID) -> bool:
+        """
+        Whether the tenant's searches can be served from the index.
+        """
+        return self.ready and tenant_id not in self._oversized
+
+    def upsert(self, tenant_id: uuid.UUID, dish: Dish, search_vector: str) -> None:
+        """
+        Adds a tenant's dish or re-indexes it after a change.
+        """
+        if not self.covers(tenant_id):
+            return
+        tenant = self._tenants.setdefault(tenant_id, TenantSearchIndex())
+        tenant.remove(dish.id)
+        if len(tenant) >= self.max_dishes:
+            self._drop(tenant_id)
+            return
+        tenant.add(dish, search_vector)
+
+    def remove(self, tenant_id: uuid.UUID, dish_id: uuid.UUID) -> None:
+        """
+        Drops a tenant's dish from the index.
+        """
+        tenant = self._tenants.get(tenant_id)
+        if tenant is not None:
+            tenant.remove(dish_id)
+
+    def search(self, tenant_id: uuid.UUID, query: str, terms: Sequence[Term], limit: Optional[int] = None,
+               after: Optional[Tuple[float, uuid.UUID]] = None) -> List[Dish]:
+        """
+        Returns a tenant's dishes matching the query, whose tsquery has the given terms, best first, each carrying its score.
+        """
+        tenant = self._tenants.get(tenant_id)
+        if tenant is None or not tokenize(query):
+            return []
+        text_matches = tenant.text_matches(terms)
+        query_trigrams = set(trigrams(query))
+        scores: Dict[uuid.UUID, float] = {}
+        for dish_id in text_matches | tenant.trigram_candidates(query_trigrams):
+            similarity = word_similarity(query_trigrams, tenant.name_trigrams[dish_id])
+            if dish_id in text_matches:
+                scores[dish_id] = float4(rank_cd(tenant.documents[dish_id], terms) + similarity)
+            elif similarity >= WORD_SIMILARITY_THRESHOLD:
+                scores[dish_id] = similarity
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        if after is not None:
+            after_score = float4(after[0])
+            ranked = [(dish_id, score) for dish_id, score in ranked if score < after_score or (score == after_score and dish_id > after[1])]
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [tenant.dishes[dish_id].model_copy(update={"score": score}) for dish_id, score in ranked]
+
+class DishChangeListener:
+    """
+    Keeps a worker's search index in sync with writes made by other workers.
+
+    Holds a dedicated connection LISTENing on DISH_CHANNEL. Notifications are coalesced per tenant for
+    coalesce_delay seconds, so a bulk write arrives at on_change as one {dish_id: op} batch rather than a
+    call per row; a dish changed more than once in that time is passed with its last op.
+    If the connection drops it reconnects and calls on_reconnect, since notifications sent while it was
+    away are lost.
+    """
+    def __init__(self, dsn: str, on_change: Callable[[uuid.UUID, Dict[uuid.UUID, str]], Awaitable[None]],
+                 on_reconnect: Callable[[], Awaitable[None]], retry_delay: float = 5.0,
+                 coalesce_delay: float = DISH_CHANGE_COALESCE_DELAY):
+        self.dsn = dsn
+        self.on_change = on_change
+        self.on_reconnect = on_reconnect
+        self.retry_delay = retry_delay
+        self.coalesce_delay = coalesce_delay
+        self._task: Optional[asyncio.Task] = None
+        self._pending = set()
+        self._changes: Dict[uuid.UUID, Dict[uuid.UUID, str]] = {}
+        self._flushes: Dict[uuid.UUID, asyncio.TimerHandle] = {}
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        for flush in self._flushes.values():
+            flush.cancel()
+        self._flushes.clear()
+        self._changes.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _notify(self, connection, pid, channel, payload) -> None:
+        try:
+            change = json.loads(payload)
+            op, tenant_id, dish_id = change["op"], uuid.UUID(change["tenant_id"]), uuid.UUID(change["id"])
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error("Ignoring malformed {} notification {!r}: {}", channel, payload, e)
+            return
+        self._changes.setdefault(tenant_id, {})[dish_id] = op
+        if tenant_id not in self._flushes:
+            self._flushes[tenant_id] = asyncio.get_running_loop().call_later(self.coalesce_delay, self._flush, tenant_id)
+
+    def _flush(self, tenant_id: uuid.UUID) -> None:
+        del self._flushes[tenant_id]
+        task = asyncio.create_task(self.on_change(tenant_id, self._changes.pop(tenant_id)))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _run(self) -> None:
+        reconnecting = False
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                closed = asyncio.get_running_loop().create_future()
+                connection.add_termination_listener(lambda _: closed.done() or closed.set_result(None))
+                await connection.add_listener(DISH_CHANNEL, self._notify)
+                logger.info("Listening for dish changes on {}", DISH_CHANNEL)
+                if reconnecting:
+                    await self.on_reconnect()
+                reconnecting = True
+                await closed
+                logger.warning("Dish change listener disconnected")
+            except asyncio.CancelledError:
+                if connection is not None:
+                    await connection.close()
+                raise
+            except Exception as e:
+                logger.error("Dish change listener failed: {}", e)
+                reconnecting = True
+            await asyncio.sleep(self.retry_delay)
@@ -1,68 +1,546 @@
-from typing import List, Optional
-from app.models import Dish
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+from app.models import Dish, TableVersion
 from app.repositories import DishRepository
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.blob_store import BlobStore, StagedBlob, blob_store, is_digest
+from app.search_index import DishSearchIndex, DishChangeListener, SEARCH_INDEX_ENABLED, Term, parse_tsquery, query_terms, tokenize
+from app.cache import CacheBackend, SingleFlight, TTLCache, create_cache_backend
+from app.bulk import BULK_BATCH_SIZE, BulkImportError, DishImport, RowError, decode_image, validate_row
+from app.tracing import traced
+from prometheus_client import Histogram
+from loguru import logger
+import asyncio
+import os
 import uuid
 
+DISH_CACHE_TTL = float(os.getenv("DISH_CACHE_TTL", 60))
+DISH_CACHE_MAX_SIZE = int(os.getenv("DISH_CACHE_MAX_SIZE", 10000))
+# Seconds between folds of new ratings into the dish aggregates; 0 folds each rating as it is made
+RATING_REFRESH_INTERVAL = float(os.getenv("RATING_REFRESH_INTERVAL", 1.0))
+# Distinct search queries whose tsquery terms are remembered, so Postgres parses each only once
+SEARCH_TERMS_CACHE_SIZE = int(os.getenv("SEARCH_TERMS_CACHE_SIZE", 10000))
+
+# Define Prometheus metrics; the traced decorator (Decorator Pattern) times every call
+SERVICE_LATENCY = Histogram('dish_service_call_duration_seconds', 'Service call latency in seconds, cache hits included', ['method'])
+
+# Every key is namespaced by tenant, so one restaurant's entries can never be served to another
+
+def dish_version_key(tenant_id: uuid.UUID) -> str:
+    # Holds the tenant's dish table version
+    return f"{tenant_id}:dishes:version"
+
+def dish_key(tenant_id: uuid.UUID, dish_id: uuid.UUID) -> str:
+    return f"{tenant_id}:dish:{dish_id}"
+
+def dish_list_key(tenant_id: uuid.UUID, version: TableVersion) -> str:
+    # Keyed by table version, so the cached list always matches the version (and ETag) it is served under
+    return f"{tenant_id}:dishes:list:{version.version}"
+
+def _encode(dish: Dish) -> dict:
+    data = dish.to_dict()
+    data["version"] = dish.version
+    data["updated_at"] = dish.updated_at.isoformat() if dish.updated_at else None
+    return data
+
+def _decode(data: dict) -> Dish:
+    # Cached dicts come from _encode, so they are already valid
+    updated_at = datetime.fromisoformat(data["updated_at"]) if data.get("updated_at") else None
+    return Dish.model_construct(**{**data, "id": uuid.UUID(data["id"]), "updated_at": updated_at})
+
+class DishOperation(NamedTuple):
+    """
+    One write of a batch: "create", "update" (only the fields in changes) or "delete". Images are raw bytes.
+    """
+    op: str
+    dish_id: Optional[uuid.UUID] = None
+    changes: Mapping[str, Any] = {}
+    expected_versions: Optional[Sequence[int]] = None
+
+class OperationResult(NamedTuple):
+    """
+    Outcome of a batch operation: created, updated, deleted, not_found, version_mismatch or skipped.
+    """
+    status: str
+    dish: Optional[Dish] = None
+
+APPLIED = ("created", "updated", "deleted")
+
+class _Rollback(Exception):
+    pass
+
+class VersionMismatch(Exception):
+    """
+    Raised when a conditional write finds the dish at a version other than the expected ones.
+    """
+
 class DishService:
     """
     Service layer for managing dishes.
+
+    Single dishes and the full dish list are served read-through from the cache. Concurrent misses for the
+    same key share one database query, and every write invalidates the keys it affects.
+
+    Every method works on the menu of one tenant, identified by its first argument.
     """
-    def __init__(self, repository: DishRepository = DishRepository()):
+    def __init__(self, repository: DishRepository = DishRepository(), images: BlobStore = blob_store,
+                 search_index: Optional[DishSearchIndex] = DishSearchIndex() if SEARCH_INDEX_ENABLED else None,
+                 cache: Optional[CacheBackend] = create_cache_backend("dish", DISH_CACHE_TTL, DISH_CACHE_MAX_SIZE),
+                 rating_refresh_interval: float = RATING_REFRESH_INTERVAL):
         self.repository = repository
+        self.images = images
+        self.search_index = search_index
+        self.cache = cache
+        self.rating_refresh_interval = rating_refresh_interval
+        self._loads = SingleFlight()
+        self._generation = 0  # bumped by every write, so loads that raced a write are not cached
+        self._listener: Optional[DishChangeListener] = None
+        self._rating_refresher: Optional[asyncio.Task] = None
+        # Stemming does not change, so the terms are kept until evicted
+        self._search_terms = TTLCache("search_terms", ttl=float("inf"), max_size=SEARCH_TERMS_CACHE_SIZE)
+
+    async def start(self) -> None:
+        """
+        Starts folding ratings into the dish aggregates, builds the in-memory search index and starts following
+        changes made by other workers, which keeps the index and a per-process cache coherent across workers.
+        """
+        if self.rating_refresh_interval > 0:
+            self._rating_refresher = asyncio.create_task(self._refresh_ratings_forever())
+        if self.search_index is not None:
+            await self.refresh_search_index()
+        if self.search_index is None and (self.cache is None or self.cache.shared):
+            return
+        dsn = self.repository.db_engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        self._listener = DishChangeListener(dsn, on_change=self._apply_changes, on_reconnect=self._resync)
+        self._listener.start()
+
+    async def stop(self) -> None:
+        """
+        Stops folding ratings and following dish changes.
+        """
+        if self._rating_refresher is not None:
+            self._rating_refresher.cancel()
+            try:
+                await self._rating_refresher
+            except asyncio.CancelledError:
+                pass
+            self._rating_refresher = None
+        if self._listener is not None:
+            await self._listener.stop()
+            self._listener = None
 
-    def create_dish(self, name: str, description: str, price: float, image: str) -> Dish:
+    async def refresh_search_index(self) -> None:
+        """
+        Rebuilds the in-memory search index from the database.
+        """
+        self.search_index.build(await self.repository.search_documents())
+
+    async def _resync(self) -> None:
+        # Changes made while the listener was disconnected were missed
+        if self.cache is not None and not self.cache.shared:
+            self._generation += 1
+            await self.cache.clear()
+        if self.search_index is not None:
+            await self.refresh_search_index()
+
+    async def _apply_changes(self, tenant_id: uuid.UUID, changes: Dict[uuid.UUID, str]) -> None:
+        """
+        Applies a batch of a tenant's change notifications from the dish table, {dish_id: op}, to the cache and the in-memory search index.
+        """
+        logger.debug("{} dishes of tenant {} changed, updating cache and search index...", len(changes), tenant_id)
+        if self.cache is not None and not self.cache.shared:
+            await self._invalidate(tenant_id, *changes)
+        for dish_id, op in changes.items():
+            if op == "DELETE":
+                self._unindex(tenant_id, dish_id)
+        await self._index(tenant_id, *(dish_id for dish_id, op in changes.items() if op != "DELETE"))
+
+    async def _invalidate(self, tenant_id: uuid.UUID, *dish_ids: uuid.UUID) -> None:
+        """
+        Drops dishes and the tenant's table version from the cache; lists cached under older versions are no longer looked up.
+        """
+        self._generation += 1
+        if self.cache is not None:
+            await self.cache.delete(*(dish_key(tenant_id, dish_id) for dish_id in dish_ids), dish_version_key(tenant_id))
+
+    async def _cached(self, key: str, loader):
+        """
+        Read-through lookup: returns the cached value or loads it once, however many requests miss at the same time.
+        Loaders return JSON-ready values; None results are not cached.
+        """
+        if self.cache is None:
+            return await loader()
+        value = await self.cache.get(key)
+        if value is not None:
+            return value
+
+        async def load():
+            generation = self._generation
+            value = await loader()
+            if value is not None and generation == self._generation:
+                await self.cache.set(key, value)
+            return value
+
+        return await self._loads.do(key, load)
+
+    async def _index(self, tenant_id: uuid.UUID, *dish_ids: uuid.UUID) -> None:
+        # Re-indexed from the rows, whose search_vector Postgres generated, with one query however many there are
+        if self.search_index is None or not self.search_index.covers(tenant_id) or not dish_ids:
+            return
+        missing = set(dish_ids)
+        for dish, search_vector in await self.repository.search_documents_by_id(tenant_id, dish_ids):
+            self.search_index.upsert(tenant_id, dish, search_vector)
+            missing.discard(dish.id)
+        for dish_id in missing:
+            self.search_index.remove(tenant_id, dish_id)
+
+    def _unindex(self, tenant_id: uuid.UUID, dish_id: uuid.UUID) -> None:
+        if self.search_index is not None:
+            self.search_index.remove(tenant_id, dish_id)
+
+    async def _store_image(self, image: Optional[bytes]) -> Optional[str]:
+        """
+        Stores raw image bytes in the blob store and returns the reference kept on the dish row.
+        """
+        if not image:
+            return None
+        return await self.images.put(image)
+
+    @traced("service", SERVICE_LATENCY)
+    async def create_dish(self, tenant_id: uuid.UUID, name: str, description: str, price: float, image: Optional[bytes]) -> Dish:
         """
         Creates a new dish.
         """
-        dish = Dish(name=name, description=description, price=price, image=image)
-        self.repository.add(dish)
+        dish = Dish(name=name, description=description, price=price, image=await self._store_image(image))
+        await self.repository.add(tenant_id, dish)
+        await self._invalidate(tenant_id)
+        await self._index(tenant_id, dish.id)
         return dish
 
-    def get_dish(self, dish_id: uuid.UUID) -> Optional[Dish]:
+    @traced("service", SERVICE_LATENCY)
+    async def get_dish(self, tenant_id: uuid.UUID, dish_id: uuid.UUID, fields: Optional[Sequence[str]] = None) -> Optional[Dish]:
         """
         Retrieves a dish by its ID.
+
+        The whole dish is cached whatever fields are asked for; callers project it with Dish.to_dict(fields).
         """
-        return self.repository.get(dish_id)
+        if self.cache is None:
+            return await self.repository.get(tenant_id, dish_id, fields=fields)
+
+        async def load():
+            dish = await self.repository.get(tenant_id, dish_id)
+            return _encode(dish) if dish else None
+
+        data = await self._cached(dish_key(tenant_id, dish_id), load)
+        return _decode(data) if data else None
 
-    def list_dishes(self) -> List[Dish]:
+    @traced("service", SERVICE_LATENCY)
+    async def get_dishes(self, tenant_id: uuid.UUID, dish_ids: Sequence[uuid.UUID], fields: Optional[Sequence[str]] = None) -> List[Dish]:
         """
-        Lists all dishes.
+        Retrieves several dishes by ID, from the cache where possible and with a single query for the rest.
+        Returns the dishes found, in the order of dish_ids.
         """
-        return self.repository.list()
+        dish_ids = list(dict.fromkeys(dish_ids))
+        if self.cache is None:
+            found = {dish.id: dish for dish in await self.repository.get_many(tenant_id, dish_ids, fields=fields)}
+        else:
+            cached = await self.cache.get_many([dish_key(tenant_id, dish_id) for dish_id in dish_ids])
+            found = {dish_id: _decode(data) for dish_id, data in zip(dish_ids, cached) if data is not None}
+            missing = [dish_id for dish_id in dish_ids if dish_id not in found]
+            if missing:
+                generation = self._generation
+                for dish in await self.repository.get_many(tenant_id, missing):
+                    found[dish.id] = dish
+                    if generation == self._generation:
+                        await self.cache.set(dish_key(tenant_id, dish.id), _encode(dish))
+        return [found[dish_id] for dish_id in dish_ids if dish_id in found]
 
-    def search_dishes(self, query: str) -> List[Dish]:
+    @traced("service", SERVICE_LATENCY)
+    async def get_dish_image(self, tenant_id: uuid.UUID, dish_id: uuid.UUID) -> Optional[str]:
         """
-        Searches for dishes matching the query.
+        Retrieves the blob reference of a dish's image, if the dish has one in the store.
         """
-        return self.repository.search(query)
+        dish = await self.get_dish(tenant_id, dish_id, fields=("image",))
+        if dish and dish.image and self.images.exists(dish.image):
+            return dish.image
+        return None
 
-    def update_dish(self, dish_id: uuid.UUID, name: str, description: str, price: float, image: str) -> Optional[Dish]:
+    @traced("service", SERVICE_LATENCY)
+    async def get_dishes_version(self, tenant_id: uuid.UUID) -> TableVersion:
         """
-        Updates an existing dish.
+        Retrieves the tenant's dish table version, which validates every list and search response.
         """
-        dish = self.repository.get(dish_id)
-        if dish:
-            dish.name = name
-            dish.description = description
-            dish.price = price
-            dish.image = image
-            self.repository.update(dish)
-            return dish
-        return None
+        if self.cache is None:
+            return await self.repository.version(tenant_id)
 
-    def rate_dish(self, dish_id: uuid.UUID, rating: float) -> Optional[Dish]:
+        async def load():
+            version = await self.repository.version(tenant_id)
+            return {"version": version.version, "updated_at": version.updated_at.isoformat()}
+
+        data = await self._cached(dish_version_key(tenant_id), load)
+        return TableVersion(data["version"], datetime.fromisoformat(data["updated_at"]))
+
+    @traced("service", SERVICE_LATENCY)
+    async def list_dishes(self, tenant_id: uuid.UUID, fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+                          after: Optional[Tuple[str, uuid.UUID]] = None) -> List[Dish]:
+        """
+        Lists dishes, optionally projected onto a subset of fields and paginated by (name, id).
+        Only the unpaginated list is cached; pages go to the database, where the keyset index makes them cheap.
+        """
+        if self.cache is None or limit is not None or after is not None:
+            return await self.repository.list(tenant_id, fields=fields, limit=limit, after=after)
+
+        async def load():
+            return [_encode(dish) for dish in await self.repository.list(tenant_id)]
+
+        key = dish_list_key(tenant_id, await self.get_dishes_version(tenant_id))
+        return [_decode(data) for data in await self._cached(key, load)]
+
+    @traced("service", SERVICE_LATENCY)
+    async def search_dishes(self, tenant_id: uuid.UUID, query: str, fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+                            after: Optional[Tuple[float, uuid.UUID]] = None) -> List[Dish]:
+        """
+        Searches for dishes matching the query, best matches first, optionally projected onto a subset of fields and paginated by (score, id).
+        Served from the in-memory index when it is enabled, built and covers the tenant, and it evaluates the query
+        exactly as Postgres would; any other search goes to the database.
+        """
+        if self.search_index is not None and self.search_index.covers(tenant_id):
+            terms = await self._query_terms(query) if tokenize(query) else ()
+            if terms is not None:
+                return self.search_index.search(tenant_id, query, terms, limit=limit, after=after)
+        return await self.repository.search(tenant_id, query, fields=fields, limit=limit, after=after)
+
+    async def _query_terms(self, query: str) -> Optional[Tuple[Term, ...]]:
+        """
+        The terms of the query's tsquery, or None if the in-memory index cannot evaluate it.
+        Derived in process where possible; only other queries cost a round trip, once each.
+        """
+        terms = query_terms(query)
+        if terms is not None:
+            return terms
+        # Held in a tuple, since a query the index cannot evaluate (None) is remembered too
+        cached = self._search_terms.get(query)
+        if cached is None:
+            cached = (parse_tsquery(await self.repository.search_terms(query)),)
+            self._search_terms.set(query, cached)
+        return cached[0]
+
+    def stream_dishes(self, tenant_id: uuid.UUID, query: Optional[str] = None, fields: Optional[Sequence[str]] = None) -> AsyncIterator[Dish]:
         """
-        Rates a dish.
+        Streams all dishes, or those matching the query, without materialising the full result.
         """
-        dish = self.repository.get(dish_id)
-        if dish:
-            dish.rating = rating
-            self.repository.update(dish)
+        return self.repository.stream(tenant_id, query, fields=fields)
+
+    async def _update(self, tenant_id: uuid.UUID, dish_id: uuid.UUID, changes: Mapping[str, Any], expected_versions: Optional[Sequence[int]] = None,
+                      conn: Optional[AsyncConnection] = None) -> Optional[Dish]:
+        """
+        Writes the changed columns with one UPDATE ... RETURNING and refreshes the cache and search index,
+        unless the write is part of the caller's transaction.
+
+        Raises:
+            VersionMismatch: the dish has been changed since the client read it
+        """
+        if not changes:
+            # Nothing to write, but the dish must exist at an expected version all the same
+            dish = await self.repository.get(tenant_id, dish_id, conn=conn)
+            if dish is not None and expected_versions is not None and dish.version not in expected_versions:
+                raise VersionMismatch(dish_id)
             return dish
-        return None
+        dish = await self.repository.update(tenant_id, dish_id, changes, expected_versions=expected_versions, conn=conn)
+        if dish is None:
+            # Only a failed conditional write pays for telling a stale version from a missing dish
+            if expected_versions is not None and await self.repository.get(tenant_id, dish_id, fields=("id",), conn=conn) is not None:
+                raise VersionMismatch(dish_id)
+            return None
+        if conn is None:
+            await self._invalidate(tenant_id, dish_id)
+            await self._index(tenant_id, dish_id)
+        return dish
+
+    async def _import_dish(self, item: DishImport) -> Dish:
+        """
+        Turns a validated import row into a dish, storing its image unless it references a stored blob.
+
+        Raises:
+            ValueError: the image is not base64, or references a blob this store does not hold
+        """
+        image = item.image
+        if is_digest(image):
+            # A reference from an export of another store; decoding the hex as base64 would store garbage
+            if not self.images.exists(image):
+                raise ValueError(f"image: unknown image digest {image}; import the image itself, base64 encoded")
+        elif image is not None:
+            image = await self._store_image(decode_image(image))
+        return Dish.model_construct(id=item.id or uuid.uuid4(), name=item.name, description=item.description,
+                                    price=item.price, image=image, rating=None)
+
+    @traced("service", SERVICE_LATENCY)
+    async def import_dishes(self, tenant_id: uuid.UUID, rows: AsyncIterator[Tuple[int, Any]], skip_invalid: bool = False) -> Tuple[int, List[RowError]]:
+        """
+        Imports dishes in a single transaction, validating and COPYing BULK_BATCH_SIZE rows at a time.
+
+        Returns the number of dishes imported and the rows rejected. Unless skip_invalid is set,
+        a single rejected row rolls the whole import back.
+
+        Raises:
+            BulkImportError: the import was rolled back
+        """
+        imported, errors = 0, []
+        async with self.repository.bulk_insert(tenant_id) as copy:
+            batch: List[Dish] = []
+            async for line, row in rows:
+                try:
+                    dish = await self._import_dish(validate_row(row))
+                except ValueError as e:
+                    errors.append(RowError(line, str(e)))
+                    continue
+                if errors and not skip_invalid:
+                    continue  # going to roll back; keep validating only to report every error
+                batch.append(dish)
+                if len(batch) >= BULK_BATCH_SIZE:
+                    await copy(batch)
+                    imported, batch = imported + len(batch), []
+            if errors and not skip_invalid:
+                raise BulkImportError(errors)
+            if batch:
+                await copy(batch)
+                imported += len(batch)
+        logger.info("Imported {} dishes, rejected {} rows", imported, len(errors))
+        await self._invalidate(tenant_id)
+        if self.search_index is not None:
+            await self.refresh_search_index()
+        return imported, errors
+
+    def export_dishes(self, tenant_id: uuid.UUID, format: str = "ndjson") -> AsyncIterator[bytes]:
+        """
+        Streams every dish as NDJSON or CSV, rendered by the database.
+        """
+        return self.repository.export(tenant_id, format)
+
+    @traced("service", SERVICE_LATENCY)
+    async def update_dish(self, tenant_id: uuid.UUID, dish_id: uuid.UUID, name: str, description: str, price: float, image: Optional[bytes],
+                          expected_versions: Optional[Sequence[int]] = None) -> Optional[Dish]:
+        """
+        Replaces the details of an existing dish, optionally only if it is still at one of the expected versions.
+        The rating is left as it is.
+
+        Raises:
+            VersionMismatch: the dish has been changed since the client read it
+        """
+        changes = {"name": name, "description": description, "price": price, "image": await self._store_image(image)}
+        return await self._update(tenant_id, dish_id, changes, expected_versions=expected_versions)
+
+    @traced("service", SERVICE_LATENCY)
+    async def patch_dish(self, tenant_id: uuid.UUID, dish_id: uuid.UUID, changes: Mapping[str, Any],
+                         expected_versions: Optional[Sequence[int]] = None) -> Optional[Dish]:
+        """
+        Changes only the given fields of an existing dish; an image is given as raw bytes.
+
+        Raises:
+            VersionMismatch: the dish has been changed since the client read it
+        """
+        changes = dict(changes)
+        if "image" in changes:
+            changes["image"] = await self._store_image(changes["image"])
+        return await self._update(tenant_id, dish_id, changes, expected_versions=expected_versions)
+
+    async def _apply(self, tenant_id: uuid.UUID, operation: DishOperation, conn: AsyncConnection, staged: List[StagedBlob]) -> OperationResult:
+        changes = dict(operation.changes)
+        if changes.get("image"):
+            blob = await self.images.stage(changes["image"])
+            staged.append(blob)
+            changes["image"] = blob.digest
+        elif "image" in changes:
+            changes["image"] = None
+        if operation.op == "create":
+            dish = Dish(**changes)
+            await self.repository.add(tenant_id, dish, conn=conn)
+            return OperationResult("created", dish)
+        if operation.op == "update":
+            try:
+                dish = await self._update(tenant_id, operation.dish_id, changes, expected_versions=operation.expected_versions, conn=conn)
+            except VersionMismatch:
+                return OperationResult("version_mismatch")
+            return OperationResult("updated", dish) if dish else OperationResult("not_found")
+        if operation.op == "delete":
+            deleted_count = await self.repository.delete(tenant_id, operation.dish_id, conn=conn)
+            return OperationResult("deleted") if deleted_count else OperationResult("not_found")
+        raise ValueError(f"Unknown batch operation {operation.op!r}")
+
+    @traced("service", SERVICE_LATENCY)
+    async def apply_batch(self, tenant_id: uuid.UUID, operations: Sequence[DishOperation]) -> Tuple[bool, List[OperationResult]]:
+        """
+        Applies creates, updates and deletes in order, in a single transaction.
+
+        Stops at the first operation that cannot be applied and rolls back the ones before it; its result says
+        why and the operations after it are skipped. Returns whether the batch was committed and one result per operation.
+        """
+        results: List[OperationResult] = []
+        # Images are only published once the batch commits, so a rolled back batch leaves none behind
+        staged: List[StagedBlob] = []
+        try:
+            async with self.repository.transaction(tenant_id) as conn:
+                for operation in operations:
+                    result = await self._apply(tenant_id, operation, conn, staged)
+                    results.append(result)
+                    if result.status not in APPLIED:
+                        raise _Rollback()
+        except BaseException as e:
+            for blob in staged:
+                self.images.discard_sync(blob)
+            if not isinstance(e, _Rollback):
+                raise
+            results.extend(OperationResult("skipped") for _ in operations[len(results):])
+            return False, results
+        for blob in staged:
+            await self.images.publish(blob)
+        changed = [result.dish.id if result.dish else operation.dish_id for operation, result in zip(operations, results)]
+        await self._invalidate(tenant_id, *changed)
+        for operation, result in zip(operations, results):
+            if result.status == "deleted":
+                self._unindex(tenant_id, operation.dish_id)
+        await self._index(tenant_id, *(result.dish.id for result in results if result.status != "deleted"))
+        return True, results
+
+    @traced("service", SERVICE_LATENCY)
+    async def rate_dish(self, tenant_id: uuid.UUID, dish_id: uuid.UUID, user_id: uuid.UUID, rating: float) -> Optional[Dish]:
+        """
+        Records a user's rating of a dish, replacing any earlier rating by the same user.
+
+        The rating lands in its own row, so concurrent raters never wait on the dish row. The dish's
+        average picks it up at the next aggregate refresh, at most rating_refresh_interval seconds later.
+        """
+        if not await self.repository.rate(tenant_id, dish_id, user_id, rating):
+            return None
+        if self.rating_refresh_interval <= 0:
+            await self.refresh_ratings(tenant_id, dish_id)
+        return await self.get_dish(tenant_id, dish_id)
+
+    async def refresh_ratings(self, tenant_id: Optional[uuid.UUID] = None, dish_id: Optional[uuid.UUID] = None) -> None:
+        """
+        Folds pending rating changes (for one tenant's dish, or those of every tenant) into the dish aggregates.
+        """
+        refreshed: Dict[uuid.UUID, List[uuid.UUID]] = {}
+        for tenant_id, refreshed_id in await self.repository.fold_ratings(tenant_id, dish_id):
+            refreshed.setdefault(tenant_id, []).append(refreshed_id)
+        for tenant_id, dish_ids in refreshed.items():
+            await self._invalidate(tenant_id, *dish_ids)
+
+    async def _refresh_ratings_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.rating_refresh_interval)
+            try:
+                await self.refresh_ratings()
+            except Exception as e:
+                logger.error("Rating refresh failed: {}", e)
 
-    def delete_dish(self, dish_id: uuid.UUID) -> int:
+    @traced("service", SERVICE_LATENCY)
+    async def delete_dish(self, tenant_id: uuid.UUID, dish_id: uuid.UUID) -> int:
         """
         Deletes a dish by its ID and returns the number of deleted items.
         """
-        return self.repository.delete(dish_id)
+        deleted_count = await self.repository.delete(tenant_id, dish_id)
+        if deleted_count:
+            await self._invalidate(tenant_id, dish_id)
+            self._unindex(tenant_id, dish_id)
+        return deleted_count
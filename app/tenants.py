@@ -0,0 +1,136 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+import asyncio
+import os
+import re
+import uuid
+from fastapi import HTTPException, Request, status
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from app.cache import TTLCache
+from app.database import engine, DB_POOL_SIZE, DB_MAX_OVERFLOW
+from app.models import Tenant
+
+# Tenant served when a request names none; set it empty to make every request name one
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "default")
+TENANT_HEADER = "X-Tenant"
+# Requests to <slug>.<TENANT_DOMAIN> are served for tenant <slug>, unless the header names another
+TENANT_DOMAIN = os.getenv("TENANT_DOMAIN", "")
+TENANT_CACHE_TTL = float(os.getenv("TENANT_CACHE_TTL", 300))
+TENANT_CACHE_MAX_SIZE = int(os.getenv("TENANT_CACHE_MAX_SIZE", 10000))
+# Unknown slugs are cached apart, in fewer entries and for less time, so probes of random subdomains
+# cannot push real tenants out, and a tenant created by another process is served within this many seconds
+UNKNOWN_TENANT_CACHE_TTL = float(os.getenv("UNKNOWN_TENANT_CACHE_TTL", 10))
+UNKNOWN_TENANT_CACHE_MAX_SIZE = int(os.getenv("UNKNOWN_TENANT_CACHE_MAX_SIZE", 1000))
+# Connections a single tenant may hold at once, so a busy restaurant cannot starve the others; 0 for no limit
+DB_TENANT_POOL_QUOTA = int(os.getenv("DB_TENANT_POOL_QUOTA", max(1, (DB_POOL_SIZE + DB_MAX_OVERFLOW) // 2)))
+
+_SLUG_RE = re.compile(r"^[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?$")
+
+class TenantRepository:
+    """
+    Repository for the tenant table.
+    """
+    def __init__(self, db_engine: AsyncEngine = engine):
+        self.db_engine = db_engine
+
+    async def get_by_slug(self, slug: str) -> Optional[Tenant]:
+        async with self.db_engine.connect() as conn:
+            result = await conn.execute(text("SELECT id, slug, name FROM tenant WHERE slug = :slug"), {"slug": slug})
+            row = result.first()
+            return Tenant(*row) if row else None
+
+    async def add(self, slug: str, name: str) -> Tenant:
+        """
+        Creates a tenant; a trigger starts its table versions.
+
+        Raises:
+            ValueError: the slug is not a valid DNS label
+        """
+        if not _SLUG_RE.match(slug):
+            raise ValueError(f"Invalid tenant slug {slug!r}: use lowercase letters, digits and hyphens")
+        logger.info("Adding tenant {} to database...", slug)
+        async with self.db_engine.begin() as conn:
+            result = await conn.execute(text("INSERT INTO tenant (slug, name) VALUES (:slug, :name) RETURNING id, slug, name"),
+                                        {"slug": slug, "name": name})
+            tenant = Tenant(*result.one())
+        # A lookup made before the tenant existed must not keep it unknown
+        unknown_tenant_cache.invalidate(slug)
+        tenant_cache.set(slug, tenant)
+        return tenant
+
+# Singleton Pattern - tenants by slug, and unknown slugs, so resolving a tenant rarely costs a query
+tenant_repository = TenantRepository()
+tenant_cache = TTLCache("tenant", ttl=TENANT_CACHE_TTL, max_size=TENANT_CACHE_MAX_SIZE)
+unknown_tenant_cache = TTLCache("unknown_tenant", ttl=UNKNOWN_TENANT_CACHE_TTL, max_size=UNKNOWN_TENANT_CACHE_MAX_SIZE)
+
+async def get_cached_tenant(slug: str) -> Optional[Tenant]:
+    """
+    Read-through lookup of a tenant by slug that only opens a connection on a cache miss.
+    """
+    tenant = tenant_cache.get(slug)
+    if tenant is None and not unknown_tenant_cache.get(slug):
+        tenant = await tenant_repository.get_by_slug(slug)
+        if tenant is None:
+            unknown_tenant_cache.set(slug, True)
+        else:
+            tenant_cache.set(slug, tenant)
+    return tenant
+
+def tenant_slug(request: Request) -> Optional[str]:
+    """
+    The tenant a request names: the X-Tenant header, else the subdomain of TENANT_DOMAIN, else DEFAULT_TENANT.
+    """
+    slug = request.headers.get(TENANT_HEADER)
+    if not slug and TENANT_DOMAIN:
+        host = request.headers.get("host", "").split(":")[0].lower()
+        if host.endswith("." + TENANT_DOMAIN):
+            slug = host[:-len(TENANT_DOMAIN) - 1]
+    return slug or DEFAULT_TENANT or None
+
+async def get_tenant(request: Request) -> Tenant:
+    """
+    Resolve the tenant a request is served for.
+
+    Args:
+        request (Request): request
+
+    Raises:
+        HTTPException: tenant required
+        HTTPException: unknown tenant
+
+    Returns:
+        Tenant: tenant
+    """
+    slug = tenant_slug(request)
+    if slug is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Tenant required, name it in the {TENANT_HEADER} header")
+    tenant = await get_cached_tenant(slug.lower()) if _SLUG_RE.match(slug.lower()) else None
+    if tenant is None:
+        logger.warning("Unknown tenant {}", slug)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown tenant")
+    return tenant
+
+class TenantQuota:
+    """
+    Bulkhead Pattern - caps the pooled connections each tenant holds at once.
+
+    The pool is shared, so without a cap one restaurant's burst of slow queries could check out every
+    connection and make the others queue. Requests over their tenant's quota wait for one of its own
+    connections instead.
+    """
+    def __init__(self, limit: int = DB_TENANT_POOL_QUOTA):
+        self.limit = limit
+        self._slots: Dict[uuid.UUID, asyncio.Semaphore] = {}
+
+    @asynccontextmanager
+    async def slot(self, tenant_id: uuid.UUID) -> AsyncIterator[None]:
+        if self.limit <= 0:
+            yield
+            return
+        semaphore = self._slots.get(tenant_id)
+        if semaphore is None:
+            semaphore = self._slots[tenant_id] = asyncio.Semaphore(self.limit)
+        async with semaphore:
+            yield
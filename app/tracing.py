@@ -0,0 +1,352 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
+import functools
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from fastapi import FastAPI
+from loguru import logger
+from prometheus_client import Counter, Histogram
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.database import engine
+from app.metrics import route_template
+
+# Where finished spans go: "" (tracing off), "file" (JSON lines in TRACING_FILE) or "otlp" (OTLP/HTTP JSON to TRACING_OTLP_ENDPOINT)
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "")
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_OTLP_ENDPOINT = os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+# Share of requests traced, unless the caller's traceparent header already decided
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", 1.0))
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "dancing-pony")
+# Finished spans waiting for the exporter thread; past this, new ones are dropped rather than waited for
+TRACING_QUEUE_SIZE = int(os.getenv("TRACING_QUEUE_SIZE", 10000))
+
+TRACEPARENT_HEADER = "traceparent"
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# Longest SQL statement text kept on a span
+MAX_STATEMENT_LENGTH = 2000
+SQL_STATEMENTS = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"))
+
+SQL_LATENCY = Histogram('db_statement_duration_seconds', 'SQL statement execution time in seconds', ['statement'],
+                        buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, float("inf")))
+
+SPANS_DROPPED = Counter('trace_spans_dropped_total', 'Spans dropped because the export queue was full or the export failed')
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+class Span:
+    """
+    A timed operation within a trace, in the shape of an OpenTelemetry span.
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "kind", "start", "end", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, kind: int = INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start = time.time_ns()
+        self.end = 0
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [{"key": key, "value": otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error is not None else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class SpanExporter(ABC):
+    """
+    Hands finished spans to a background thread, which exports them in batches, so tracing never blocks
+    a request on disk or network I/O. Subclasses implement export().
+    """
+    def __init__(self, max_size: int = TRACING_QUEUE_SIZE, batch_size: int = 512, interval: float = 1.0):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(max_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    @abstractmethod
+    def export(self, spans: List[Span]) -> None:
+        ...
+
+    def submit(self, span: Span) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            SPANS_DROPPED.inc()
+
+    def _after_fork(self) -> None:
+        # Threads do not survive a fork: a child of a process that already started the exporter starts its own
+        self._queue = queue.Queue(self._queue.maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> None:
+        # Started on first use rather than on import, so worker processes each get their own exporter
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            spans: List[Span] = []
+            deadline = time.monotonic() + self.interval
+            while len(spans) < self.batch_size:
+                try:
+                    span = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if span is None:
+                    stop = True
+                    break
+                spans.append(span)
+            if spans:
+                try:
+                    self.export(spans)
+                except Exception as e:
+                    SPANS_DROPPED.inc(len(spans))
+                    logger.warning("Failed to export {} spans: {}", len(spans), e)
+
+    def shutdown(self) -> None:
+        """
+        Exports the queued spans and stops the exporter thread.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+class FileSpanExporter(SpanExporter):
+    """
+    Appends spans to a file, one OTLP JSON span per line.
+    """
+    def __init__(self, path: str = TRACING_FILE, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, "a") as file:
+            file.write("".join(json.dumps(span.to_otlp()) + "\n" for span in spans))
+
+class OTLPSpanExporter(SpanExporter):
+    """
+    Posts spans to an OpenTelemetry collector's OTLP/HTTP endpoint, JSON encoded.
+    """
+    def __init__(self, endpoint: str = TRACING_OTLP_ENDPOINT, service_name: str = TRACING_SERVICE_NAME, timeout: float = 5.0, **kwargs):
+        super().__init__(**kwargs)
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+
+    def export(self, spans: List[Span]) -> None:
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in spans]}],
+        }]}
+        request = urllib.request.Request(self.endpoint, data=json.dumps(body).encode(), method="POST",
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+def create_exporter(name: str = TRACING_EXPORTER) -> Optional[SpanExporter]:
+    """
+    Factory Pattern - creates the span exporter selected by TRACING_EXPORTER, or None when tracing is off.
+    """
+    if not name:
+        return None
+    if name == "file":
+        return FileSpanExporter()
+    if name == "otlp":
+        return OTLPSpanExporter()
+    raise ValueError(f"Unknown TRACING_EXPORTER: {name}")
+
+# Singleton Pattern - the exporter every span of this process goes to
+exporter = create_exporter()
+
+# The span the current task is in; None outside of a traced request
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+@contextmanager
+def span(name: str, kind: int = INTERNAL, **attributes) -> Iterator[Optional[Span]]:
+    """
+    Records a child span of the current span, if the current request is traced; otherwise does nothing.
+    """
+    parent = _current_span.get()
+    if parent is None or exporter is None:
+        yield None
+        return
+    current = Span(name, parent.trace_id, parent.span_id, kind, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end = time.time_ns()
+        exporter.submit(current)
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+def traced(layer: str, histogram: Histogram, counter: Optional[Counter] = None) -> Callable[[F], F]:
+    """
+    Decorator timing every call of a coroutine method into histogram (and counting it in counter), labelled
+    with the method's name, and recording it as a "<layer> <method>" span when the request is traced.
+    """
+    def decorator(method: F) -> F:
+        name = method.__name__
+        latency = histogram.labels(method=name)
+        calls = counter.labels(method=name) if counter is not None else None
+        span_name = f"{layer} {name}"
+
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            if calls is not None:
+                calls.inc()
+            start = time.perf_counter()
+            try:
+                if _current_span.get() is None:
+                    return await method(*args, **kwargs)
+                with span(span_name):
+                    return await method(*args, **kwargs)
+            finally:
+                latency.observe(time.perf_counter() - start)
+        return wrapper  # type: ignore[return-value]
+    return decorator
+
+def statement_type(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    verb = words[0].upper() if words else ""
+    return verb if verb in SQL_STATEMENTS else "OTHER"
+
+def instrument_engine(db_engine: AsyncEngine = engine) -> None:
+    """
+    Times every SQL statement the engine runs into db_statement_duration_seconds, by statement type,
+    and records it as a span when the request is traced.
+    """
+    sync_engine = db_engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        parent = _current_span.get()
+        current = None
+        if parent is not None and exporter is not None:
+            current = Span(f"SQL {statement_type(statement)}", parent.trace_id, parent.span_id, CLIENT,
+                           {"db.system": "postgresql", "db.statement": statement[:MAX_STATEMENT_LENGTH]})
+        context._trace_start = (time.perf_counter(), current)
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start, current = context._trace_start
+        SQL_LATENCY.labels(statement=statement_type(statement)).observe(time.perf_counter() - start)
+        if current is not None:
+            current.end = time.time_ns()
+            exporter.submit(current)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        context = exception_context.execution_context
+        start, current = getattr(context, "_trace_start", (None, None)) if context is not None else (None, None)
+        if current is not None:
+            current.end = time.time_ns()
+            current.error = f"{type(exception_context.original_exception).__name__}: {exception_context.original_exception}"
+            exporter.submit(current)
+
+class TracingMiddleware:
+    """
+    Opens the root span of every traced request, named after its route template.
+
+    A request continues the trace of a valid W3C traceparent header, following the caller's sampling decision;
+    otherwise it starts a new trace, sampled at TRACING_SAMPLE_RATE.
+    """
+    def __init__(self, app: ASGIApp, sample_rate: float = TRACING_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or exporter is None:
+            await self.app(scope, receive, send)
+            return
+        trace_id, parent_id, sampled = None, None, None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                match = _TRACEPARENT_RE.match(value.decode("latin-1"))
+                if match:
+                    trace_id, parent_id, sampled = match[1], match[2], int(match[3], 16) & 1 == 1
+                break
+        if sampled is None:
+            sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+        root = Span(scope["method"], trace_id or f"{random.getrandbits(128):032x}", parent_id, SERVER,
+                    {"http.method": scope["method"], "http.target": scope["path"]})
+
+        async def send_with_status(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                if message["status"] >= 500:
+                    root.error = f"HTTP {message['status']}"
+            await send(message)
+
+        token = _current_span.set(root)
+        try:
+            await self.app(scope, receive, send_with_status)
+        except BaseException as e:
+            root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            root.name = f"{scope['method']} {route_template(scope)}"
+            root.attributes["http.route"] = route_template(scope)
+            root.end = time.time_ns()
+            exporter.submit(root)
+
+def shutdown_tracing() -> None:
+    if exporter is not None:
+        exporter.shutdown()
+
+def init_tracing(app: FastAPI):
+    instrument_engine()
+    app.add_middleware(TracingMiddleware)
+    return app
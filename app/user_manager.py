@@ -1,23 +1,92 @@
+import asyncio
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.models import User
+from app.models import User, UserUpdate
+from app.database import SessionLocal
+from app.cache import TTLCache
+from app.credential_cache import credential_cache
 
 # Singleton Pattern: Ensures a single instance of the password context is created and reused
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-async def get_user_by_email(db: AsyncSession, email: str):
-    stmt = select(User).where(User.email == email)
+# bcrypt releases the GIL, so a small dedicated pool hashes in parallel without blocking the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+# Singleton Pattern: authenticated principals keyed by (tenant, email), so get_current_user can skip the user SELECT
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 30))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", 10000))
+user_cache = TTLCache("user", ttl=USER_CACHE_TTL, max_size=USER_CACHE_MAX_SIZE)
+
+def credential_key(tenant_id: uuid.UUID, email: str) -> str:
+    """
+    Key of a user's verified credentials; the same email may be registered with several tenants.
+    """
+    return f"{tenant_id}/{email}"
+
+async def get_user_by_email(db: AsyncSession, tenant_id: uuid.UUID, email: str):
+    stmt = select(User).where(User.tenant_id == tenant_id, User.email == email)
     result = await db.execute(stmt)
     return result.scalars().first()
 
-async def create_user(db: AsyncSession, email: str, password: str, name: str):
-    hashed_password = pwd_context.hash(password)
-    user = User(email=email, hashed_password=hashed_password, name=name)
+async def get_cached_user_by_email(tenant_id: uuid.UUID, email: str) -> Optional[User]:
+    """
+    Read-through lookup of a tenant's user by email that only opens a database session on a cache miss.
+    """
+    user = user_cache.get((tenant_id, email))
+    if user is None:
+        async with SessionLocal() as db:
+            user = await get_user_by_email(db, tenant_id, email)
+        if user is not None:
+            user_cache.set((tenant_id, email), user)
+    return user
+
+def invalidate_user(tenant_id: uuid.UUID, email: str) -> None:
+    """
+    Forgets everything cached for a user; call after any change to their row.
+    """
+    user_cache.invalidate((tenant_id, email))
+    credential_cache.invalidate(credential_key(tenant_id, email))
+
+async def hash_password(plain_password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.hash, plain_password)
+
+async def create_user(db: AsyncSession, tenant_id: uuid.UUID, email: str, password: str, name: str):
+    hashed_password = await hash_password(password)
+    user = User(tenant_id=tenant_id, email=email, hashed_password=hashed_password, name=name)
     db.add(user)
     await db.commit()
     await db.refresh(user)
+    invalidate_user(tenant_id, email)
+    return user
+
+async def update_user(db: AsyncSession, user: User, user_update: UserUpdate) -> User:
+    user = await db.merge(user)
+    old_email = user.email
+    if user_update.email is not None:
+        user.email = user_update.email
+    if user_update.name is not None:
+        user.name = user_update.name
+    if user_update.password is not None:
+        user.hashed_password = await hash_password(user_update.password)
+    await db.commit()
+    await db.refresh(user)
+    invalidate_user(user.tenant_id, old_email)
+    invalidate_user(user.tenant_id, user.email)
     return user
 
-async def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+async def verify_password(plain_password, hashed_password, cache_key: Optional[str] = None):
+    # cache_key (see credential_key) enables the credential cache for this user
+    if cache_key is not None and credential_cache.check(cache_key, plain_password, hashed_password):
+        return True
+    loop = asyncio.get_running_loop()
+    verified = await loop.run_in_executor(password_executor, pwd_context.verify, plain_password, hashed_password)
+    if verified and cache_key is not None:
+        credential_cache.add(cache_key, plain_password, hashed_password)
+    return verified
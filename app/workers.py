@@ -0,0 +1,21 @@
+import os
+from uvicorn.workers import UvicornWorker as BaseUvicornWorker
+
+# Seconds left to the lifespan shutdown (closing pools, flushing spans) between cancelling the requests still
+# running at the end of a graceful drain and gunicorn killing the worker
+SHUTDOWN_MARGIN = float(os.getenv("SHUTDOWN_MARGIN", 5))
+
+class UvicornWorker(BaseUvicornWorker):
+    """
+    Gunicorn worker serving the app with uvicorn on uvloop and httptools.
+
+    Lifespan is required rather than auto, so a worker whose startup fails exits instead of serving
+    without its pools and search index. On SIGTERM the worker stops accepting connections and lets the
+    requests in flight finish until shortly before gunicorn's graceful timeout, then cancels the rest,
+    so the lifespan shutdown still runs before the worker is killed.
+    """
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config.timeout_graceful_shutdown = max(self.cfg.graceful_timeout - SHUTDOWN_MARGIN, 1)
@@ -0,0 +1,76 @@
+"""
+Per-dish cost of turning dishes into a JSON list response, before and after the orjson response path.
+
+before: Dish.to_dict() logging a line per dish, FastAPI validating the dicts against response_model
+        (List[DishSummary]) and dumping them back to jsonable data, then stdlib json.dumps.
+after:  Dish.to_dict() without logging, encoded by orjson (app.responses.json_response).
+
+    python benchmarks/bench_serialization.py --dishes 1000 --repeat 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+from pydantic import TypeAdapter
+from app.models import Dish
+from app.responses import dumps
+from app.routes import DishSummary
+
+def make_dishes(count: int) -> List[Dish]:
+    return [
+        Dish.from_row({"id": uuid.uuid4(), "name": f"Dish {index}", "description": "Slow-cooked with herbs from the Shire",
+                       "price": 9.5 + index % 7, "image": None, "rating": 4.5})
+        for index in range(count)
+    ]
+
+def before(dishes: List[Dish], adapter: TypeAdapter) -> bytes:
+    items = []
+    for dish in dishes:
+        logger.info("Converting dish object to dictionary...")
+        items.append(dish.to_dict())
+    validated = adapter.validate_python(items)
+    return json.dumps(adapter.dump_python(validated, mode="json", exclude_unset=True), ensure_ascii=False,
+                      allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def after(dishes: List[Dish], adapter: TypeAdapter) -> bytes:
+    return dumps([dish.to_dict() for dish in dishes])
+
+def measure(pipeline: Callable, dishes: List[Dish], adapter: TypeAdapter, repeat: int) -> float:
+    """
+    Best of repeat runs, in microseconds per dish.
+    """
+    pipeline(dishes, adapter)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pipeline(dishes, adapter)
+        best = min(best, time.perf_counter() - start)
+    return best / len(dishes) * 1e6
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dishes", type=int, default=1000, help="dishes per response (default 1000)")
+    parser.add_argument("--repeat", type=int, default=20, help="runs of each pipeline, the best is reported (default 20)")
+    parser.add_argument("--log-file", default=os.devnull, help="where the per-dish log lines of the old path go (default /dev/null)")
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(args.log_file, level="INFO")
+    dishes = make_dishes(args.dishes)
+    adapter = TypeAdapter(List[DishSummary])
+    assert json.loads(before(dishes, adapter)) == json.loads(after(dishes, adapter))
+    old = measure(before, dishes, adapter, args.repeat)
+    new = measure(after, dishes, adapter, args.repeat)
+    print(f"{args.dishes} dishes per response, best of {args.repeat}")
+    print(f"  before  {old:8.2f} us/dish")
+    print(f"  after   {new:8.2f} us/dish  ({old / new:.1f}x faster)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Compares two load test results (benchmarks/loadtest.py), operation by operation.
+
+    python benchmarks/compare.py benchmarks/results/before.json benchmarks/results/after.json --fail-above 10
+
+With --fail-above, exits with status 1 when the overall or any operation's p95 latency grew by more than
+that percentage, or its error rate by more than a point, so it can gate a change in CI.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List, Optional
+
+# Settings that must match for two results to be comparable
+COMPARED_CONFIG = ("profile", "concurrency", "duration", "warmup", "users", "seed", "dish_ids_sampled")
+
+# Operations with fewer measured requests than this are listed but never fail the comparison
+MIN_REQUESTS = 20
+
+def change(old: float, new: float) -> Optional[float]:
+    return (new - old) / old * 100 if old else None
+
+def format_change(value: Optional[float]) -> str:
+    return "n/a" if value is None else f"{value:+.1f}%"
+
+def compare(old: Dict, new: Dict, fail_above: Optional[float]) -> List[str]:
+    """
+    Prints the comparison and returns the regressions beyond fail_above.
+    """
+    for key in COMPARED_CONFIG:
+        if old["config"].get(key) != new["config"].get(key):
+            print(f"warning: {key} differs ({old['config'].get(key)} vs {new['config'].get(key)}), the results may not be comparable")
+    print(f"old: {old['meta'].get('commit')} ({old['meta'].get('started_at')})")
+    print(f"new: {new['meta'].get('commit')} ({new['meta'].get('started_at')})")
+    # New values, with their change from the old ones
+    print(f"{'operation':<14} {'rps':>18} {'p50 ms':>20} {'p95 ms':>20} {'p99 ms':>20} {'errors':>14}")
+    regressions = []
+    rows = [(name, summary, new["operations"].get(name)) for name, summary in old["operations"].items()]
+    for name, before, after in [*rows, ("total", old["summary"], new["summary"])]:
+        if after is None or "latency_ms" not in before or "latency_ms" not in after:
+            print(f"{name:<14} not measured in both")
+            continue
+        columns = [f"{after['throughput_rps']:8.1f} {format_change(change(before['throughput_rps'], after['throughput_rps'])):>9}"]
+        for key in ("p50", "p95", "p99"):
+            old_latency, new_latency = before["latency_ms"][key], after["latency_ms"][key]
+            columns.append(f"{new_latency:10.2f} {format_change(change(old_latency, new_latency)):>9}")
+        columns.append(f"{after['error_rate']:7.1%} {(after['error_rate'] - before['error_rate']) * 100:+5.1f}")
+        print(f"{name:<14} {' '.join(columns)}")
+        if fail_above is None or min(before["requests"], after["requests"]) < MIN_REQUESTS:
+            continue
+        p95_change = change(before["latency_ms"]["p95"], after["latency_ms"]["p95"])
+        if p95_change is not None and p95_change > fail_above:
+            regressions.append(f"{name}: p95 {before['latency_ms']['p95']:.2f} -> {after['latency_ms']['p95']:.2f} ms ({p95_change:+.1f}%)")
+        if after["error_rate"] - before["error_rate"] > 0.01:
+            regressions.append(f"{name}: error rate {before['error_rate']:.1%} -> {after['error_rate']:.1%}")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("old", help="baseline result file")
+    parser.add_argument("new", help="result file to compare with it")
+    parser.add_argument("--fail-above", type=float, help="fail when a p95 latency grew by more than this percentage")
+    args = parser.parse_args()
+    with open(args.old) as old, open(args.new) as new:
+        regressions = compare(json.load(old), json.load(new), args.fail_above)
+    for regression in regressions:
+        print(f"regression: {regression}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
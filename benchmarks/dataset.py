@@ -0,0 +1,17 @@
+"""
+The benchmark data set, shared by the seeding script and the load test.
+"""
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLES = os.path.join(ROOT, "examples", "dishes.json")
+IMAGES = os.path.join(ROOT, "examples", "img")
+
+BENCH_TENANT = "bench"
+BENCH_PASSWORD = "bench-password"
+
+def user_email(index: int) -> str:
+    """
+    Email of the index-th benchmark user.
+    """
+    return f"bench-user-{index}@example.com"
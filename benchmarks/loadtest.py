@@ -0,0 +1,309 @@
+"""
+Drives every API route with a weighted mix of requests and reports latency, throughput and errors as JSON.
+
+Each of --concurrency virtual users sends a request as soon as its previous one completes, authenticated
+as one of the users created by benchmarks/seed.py. Operations are drawn from the --profile mix with
+random generators derived from --seed, so runs against the same seeded data send the same requests.
+The results record the commit and settings they were measured with; compare two with benchmarks/compare.py.
+
+Start the server with rate limiting off (RATE_LIMIT_PER_SECOND=0), or refused requests count as errors:
+
+    python benchmarks/seed.py --dishes 100000 --users 50 --reset
+    RATE_LIMIT_PER_SECOND=0 python -m uvicorn main:app --port 8000
+    python benchmarks/loadtest.py --profile mixed --concurrency 32 --duration 60
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Sequence
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.dataset import BENCH_PASSWORD, BENCH_TENANT, EXAMPLES, user_email
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Relative weights of the operations in each profile; every route is exercised by "mixed"
+PROFILES: Dict[str, Dict[str, float]] = {
+    "read": {"get": 35, "list": 20, "search": 15, "batch_get": 10, "image": 8, "me": 5, "list_stream": 3, "search_stream": 2,
+             "export": 0.5},
+    "mixed": {"get": 25, "list": 12, "search": 10, "batch_get": 6, "image": 5, "me": 3, "list_stream": 1, "search_stream": 1,
+              "export": 0.25, "create": 8, "update": 5, "patch": 5, "rate": 8, "delete": 3, "batch": 3, "bulk": 1, "register": 0.25},
+    "write": {"create": 25, "update": 15, "patch": 15, "rate": 20, "delete": 10, "batch": 8, "bulk": 3, "get": 4},
+}
+
+# Ids of dishes read from the menu at the start, for reads and ratings
+ID_SAMPLE_SIZE = 10000
+PAGE_SIZE = 50
+BATCH_SIZE = 20
+BULK_SIZE = 100
+IMAGE = base64.b64encode(b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4).decode()
+
+class VirtualUser:
+    """
+    One client session: a user's credentials, its own random generator, and the dishes it created,
+    which are the ones it updates, patches and deletes so the seeded menu stays the same for reads.
+    """
+    def __init__(self, client: httpx.AsyncClient, index: int, users: int, password: str, seed: int,
+                 dish_ids: Sequence[str], words: Sequence[str], run_id: str):
+        self.client = client
+        self.auth = (user_email(index % users), password)
+        self.rng = random.Random(seed * 1000003 + index)
+        self.dish_ids = dish_ids
+        self.words = words
+        self.run_id = run_id
+        self.index = index
+        self.created: List[str] = []
+        self.sequence = 0
+
+    def dish_id(self) -> str:
+        return self.rng.choice(self.dish_ids)
+
+    def new_dish(self) -> Dict:
+        self.sequence += 1
+        return {"name": f"Load test {self.run_id} {self.index}-{self.sequence}", "description": "Created by the load test",
+                "price": round(self.rng.uniform(1, 30), 2)}
+
+    async def own_dish(self) -> str:
+        # A dish this user created, creating one first if it has none left
+        if not self.created:
+            response = await self.client.post("/dishes", json=self.new_dish(), auth=self.auth)
+            response.raise_for_status()
+            self.created.append(response.json()["id"])
+        return self.rng.choice(self.created)
+
+    async def get(self) -> httpx.Response:
+        return await self.client.get(f"/dishes/{self.dish_id()}", auth=self.auth)
+
+    async def image(self) -> httpx.Response:
+        return await self.client.get(f"/dishes/{self.dish_id()}/image", auth=self.auth)
+
+    async def list(self) -> httpx.Response:
+        return await self.client.get("/dishes", params={"limit": PAGE_SIZE}, auth=self.auth)
+
+    async def list_stream(self) -> httpx.Response:
+        return await self.client.get("/dishes", params={"stream": "true", "limit": PAGE_SIZE * 20}, auth=self.auth)
+
+    async def search(self) -> httpx.Response:
+        return await self.client.get("/search", params={"query": self.rng.choice(self.words), "limit": PAGE_SIZE}, auth=self.auth)
+
+    async def search_stream(self) -> httpx.Response:
+        return await self.client.get("/search", params={"query": self.rng.choice(self.words), "stream": "true"}, auth=self.auth)
+
+    async def batch_get(self) -> httpx.Response:
+        ids = [self.dish_id() for _ in range(BATCH_SIZE)]
+        return await self.client.post("/dishes:batchGet", json={"ids": list(dict.fromkeys(ids))}, auth=self.auth)
+
+    async def export(self) -> httpx.Response:
+        return await self.client.get("/dishes:export", auth=self.auth)
+
+    async def me(self) -> httpx.Response:
+        return await self.client.get("/me", auth=self.auth)
+
+    async def create(self) -> httpx.Response:
+        dish = self.new_dish()
+        if self.rng.random() < 0.2:
+            dish["image"] = IMAGE
+        response = await self.client.post("/dishes", json=dish, auth=self.auth)
+        if response.status_code == 201:
+            self.created.append(response.json()["id"])
+        return response
+
+    async def update(self) -> httpx.Response:
+        return await self.client.put(f"/dishes/{await self.own_dish()}", json=self.new_dish(), auth=self.auth)
+
+    async def patch(self) -> httpx.Response:
+        return await self.client.patch(f"/dishes/{await self.own_dish()}", json={"price": round(self.rng.uniform(1, 30), 2)}, auth=self.auth)
+
+    async def rate(self) -> httpx.Response:
+        return await self.client.put(f"/dishes/{self.dish_id()}/rate", json={"rating": self.rng.randint(1, 10) / 2}, auth=self.auth)
+
+    async def delete(self) -> httpx.Response:
+        dish_id = await self.own_dish()
+        self.created.remove(dish_id)
+        return await self.client.delete(f"/dishes/{dish_id}", auth=self.auth)
+
+    async def batch(self) -> httpx.Response:
+        operations = [{"op": "create", "dish": self.new_dish()} for _ in range(3)]
+        operations.append({"op": "update", "id": await self.own_dish(), "dish": {"price": round(self.rng.uniform(1, 30), 2)}})
+        return await self.client.post("/dishes:batch", json={"operations": operations}, auth=self.auth)
+
+    async def bulk(self) -> httpx.Response:
+        body = "".join(json.dumps(self.new_dish()) + "\n" for _ in range(BULK_SIZE))
+        return await self.client.post("/dishes:bulk", content=body, headers={"Content-Type": "application/x-ndjson"}, auth=self.auth)
+
+    async def register(self) -> httpx.Response:
+        self.sequence += 1
+        email = f"load-{self.run_id}-{self.index}-{self.sequence}@example.com"
+        return await self.client.post("/register", params={"email": email, "password": BENCH_PASSWORD, "name": "Load test"})
+
+class Recorder:
+    """
+    Latencies and statuses per operation, kept only once the warm-up is over.
+    """
+    def __init__(self):
+        self.recording = False
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.started = 0.0
+        self.stopped = 0.0
+
+    def start(self) -> None:
+        self.recording = True
+        self.started = time.perf_counter()
+
+    def stop(self) -> None:
+        self.recording = False
+        self.stopped = time.perf_counter()
+
+    def record(self, operation: str, status: str, latency: float) -> None:
+        if self.recording:
+            self.latencies[operation].append(latency)
+            self.statuses[operation][status] += 1
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of an ascending list.
+    """
+    return ordered[max(math.ceil(fraction * len(ordered)), 1) - 1]
+
+def is_error(status: str) -> bool:
+    return not status.isdigit() or int(status) >= 400
+
+def summarize(latencies: List[float], statuses: Dict[str, int], elapsed: float) -> Dict:
+    ordered = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if is_error(status))
+    summary = {
+        "requests": len(ordered),
+        "errors": errors,
+        "error_rate": errors / len(ordered) if ordered else 0.0,
+        "throughput_rps": len(ordered) / elapsed if elapsed else 0.0,
+        "statuses": dict(sorted(statuses.items())),
+    }
+    if ordered:
+        summary["latency_ms"] = {
+            "p50": percentile(ordered, 0.50) * 1000, "p95": percentile(ordered, 0.95) * 1000, "p99": percentile(ordered, 0.99) * 1000,
+            "max": ordered[-1] * 1000, "mean": sum(ordered) / len(ordered) * 1000,
+        }
+    return summary
+
+async def run_user(user: VirtualUser, operations: List[str], weights: List[float], recorder: Recorder, deadline: float) -> None:
+    while time.perf_counter() < deadline:
+        operation = user.rng.choices(operations, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = await getattr(user, operation)()
+            status = str(response.status_code)
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            status = type(e).__name__
+        recorder.record(operation, status, time.perf_counter() - start)
+
+async def sample_dish_ids(client: httpx.AsyncClient, auth, limit: int) -> List[str]:
+    """
+    Ids of up to limit dishes of the menu, read from the start of an export.
+    """
+    ids = []
+    async with client.stream("GET", "/dishes:export", auth=auth) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line:
+                ids.append(json.loads(line)["id"])
+                if len(ids) >= limit:
+                    break
+    return ids
+
+def search_words() -> List[str]:
+    with open(EXAMPLES) as file:
+        return sorted({word.lower() for dish in json.load(file) for word in dish["name"].split() if len(word) > 2})
+
+def git_revision() -> Dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+async def load_test(args: argparse.Namespace) -> Dict:
+    weights = PROFILES[args.profile]
+    operations = list(weights)
+    run_id = uuid.uuid4().hex[:8]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, headers={"X-Tenant": args.tenant}, limits=limits, timeout=args.timeout) as client:
+        dish_ids = await sample_dish_ids(client, (user_email(0), args.password), ID_SAMPLE_SIZE)
+        if not dish_ids:
+            raise SystemExit(f"Tenant {args.tenant} has no dishes; seed it with benchmarks/seed.py")
+        users = [VirtualUser(client, index, args.users, args.password, args.seed, dish_ids, search_words(), run_id)
+                 for index in range(args.concurrency)]
+        recorder = Recorder()
+        start = time.perf_counter()
+        deadline = start + args.warmup + args.duration
+        tasks = [asyncio.create_task(run_user(user, operations, [weights[operation] for operation in operations], recorder, deadline))
+                 for user in users]
+        await asyncio.sleep(args.warmup)
+        recorder.start()
+        await asyncio.gather(*tasks)
+        recorder.stop()
+    elapsed = recorder.stopped - recorder.started
+    every_latency = [latency for latencies in recorder.latencies.values() for latency in latencies]
+    every_status: Dict[str, int] = defaultdict(int)
+    for statuses in recorder.statuses.values():
+        for status, count in statuses.items():
+            every_status[status] += count
+    return {
+        "meta": {**git_revision(), "started_at": datetime.now(timezone.utc).isoformat(), "python": platform.python_version(),
+                 "host": platform.node(), "cpus": os.cpu_count()},
+        "config": {"url": args.url, "tenant": args.tenant, "profile": args.profile, "concurrency": args.concurrency,
+                   "duration": args.duration, "warmup": args.warmup, "users": args.users, "seed": args.seed,
+                   "dish_ids_sampled": len(dish_ids)},
+        "summary": summarize(every_latency, every_status, elapsed),
+        "operations": {operation: summarize(recorder.latencies[operation], recorder.statuses[operation], elapsed)
+                       for operation in operations if operation in recorder.latencies},
+    }
+
+def print_report(result: Dict) -> None:
+    print(f"{'operation':<14} {'requests':>9} {'rps':>8} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, summary in [*result["operations"].items(), ("total", result["summary"])]:
+        latency = summary.get("latency_ms", {})
+        print(f"{name:<14} {summary['requests']:>9} {summary['throughput_rps']:>8.1f} {summary['error_rate']:>7.1%} "
+              f"{latency.get('p50', 0):>8.2f} {latency.get('p95', 0):>8.2f} {latency.get('p99', 0):>8.2f}")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000", help="base URL of the API (default http://localhost:8000)")
+    parser.add_argument("--tenant", default=BENCH_TENANT, help=f"tenant seeded by benchmarks/seed.py (default {BENCH_TENANT})")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="mixed", help="operation mix (default mixed)")
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users sending requests at once (default 16)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds measured (default 30)")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of load before measuring starts (default 5)")
+    parser.add_argument("--users", type=int, default=20, help="seeded users the virtual users log in as (default 20)")
+    parser.add_argument("--password", default=BENCH_PASSWORD, help="password of the seeded users")
+    parser.add_argument("--seed", type=int, default=42, help="random seed of the operation mix (default 42)")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before a request counts as failed (default 30)")
+    parser.add_argument("--output", help="result file (default benchmarks/results/<time>-<commit>-<profile>.json, - for stdout only)")
+    args = parser.parse_args()
+    result = asyncio.run(load_test(args))
+    print_report(result)
+    if args.output != "-":
+        output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{(result['meta']['commit'] or 'unknown')[:8]}-{args.profile}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as file:
+            json.dump(result, file, indent=2)
+        print(f"Results written to {output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""
+Micro-benchmarks of the hot paths behind every request: authentication, dish serialization and validation,
+the dish repository and the request metrics middleware.
+
+Each benchmark is timed over rounds of enough calls to last --min-time, and the median per-call time is
+reported. --save stores the results as a baseline, and --compare checks them against one: with --fail-above,
+the run exits with status 1 when any benchmark got more than that percentage slower, so it can gate a change.
+
+The repository and get_current_user benchmarks run against the tenant seeded by benchmarks/seed.py in the
+database in DATABASE_URL, and are skipped when it has not been seeded.
+
+    python benchmarks/micro.py --save benchmarks/results/micro-baseline.json
+    python benchmarks/micro.py --compare benchmarks/results/micro-baseline.json --fail-above 10
+"""
+import argparse
+import asyncio
+import fnmatch
+import gc
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.security import HTTPBasicCredentials
+from loguru import logger
+from pydantic import TypeAdapter
+from starlette.requests import Request
+from app.auth import get_current_user
+from app.database import engine
+from app.metrics import MetricsMiddleware
+from app.models import Dish
+from app.repositories import DishRepository
+from app.responses import dumps
+from app.routes import DishResponse, DishSummary
+from app.tenants import tenant_repository
+from app.user_manager import credential_key, pwd_context, verify_password
+from benchmarks.bench_metrics import endpoint
+from benchmarks.dataset import BENCH_PASSWORD, BENCH_TENANT, ROOT, user_email
+
+# Dishes per list, search and batch benchmark, as in a typical page
+PAGE_SIZE = 50
+
+Operation = Callable[[], Any]
+
+class Skip(Exception):
+    """
+    Raised by a benchmark's setup when what it measures is unavailable, such as an unseeded database.
+    """
+
+class Benchmark(NamedTuple):
+    name: str
+    setup: Callable[["Context"], Awaitable[Operation]]
+
+# Registry of every benchmark, in the order they run
+BENCHMARKS: List[Benchmark] = []
+
+def benchmark(name: str):
+    """
+    Registers a benchmark. The decorated coroutine prepares whatever the benchmark needs and returns the
+    operation to time, a plain function or a coroutine function taking no arguments.
+    """
+    def register(setup: Callable[["Context"], Awaitable[Operation]]):
+        BENCHMARKS.append(Benchmark(name, setup))
+        return setup
+    return register
+
+class Context:
+    """
+    State shared by the benchmarks: sample dishes, and the seeded tenant once a benchmark needs it.
+    """
+    def __init__(self, tenant_slug: str):
+        self.tenant_slug = tenant_slug
+        self._tenant = None
+        self._dishes: Optional[List[Dish]] = None
+        self.repository = DishRepository()
+
+    async def tenant(self):
+        if self._tenant is None:
+            try:
+                self._tenant = await tenant_repository.get_by_slug(self.tenant_slug)
+            except Exception as e:
+                raise Skip(f"database unavailable ({type(e).__name__})") from e
+            if self._tenant is None:
+                raise Skip(f"tenant {self.tenant_slug} not seeded, run benchmarks/seed.py")
+        return self._tenant
+
+    async def dishes(self) -> List[Dish]:
+        """
+        A page of the seeded tenant's dishes, as the repository returns them.
+        """
+        if self._dishes is None:
+            tenant = await self.tenant()
+            self._dishes = await self.repository.list(tenant.id, limit=PAGE_SIZE)
+            if len(self._dishes) < PAGE_SIZE:
+                raise Skip(f"tenant {self.tenant_slug} has fewer than {PAGE_SIZE} dishes, run benchmarks/seed.py")
+        return self._dishes
+
+def sample_dish(index: int = 0) -> Dish:
+    # Serialization benchmarks use fixed dishes, so they need no database
+    return Dish.from_dict({"id": f"00000000-0000-4000-8000-{index:012d}", "name": f"Lembas #{index}",
+                           "description": "Elvish waybread, one small bite is enough to fill the stomach of a grown man.",
+                           "price": 12.5, "image": "0" * 64, "rating": 4.5})
+
+# Authentication
+
+@benchmark("auth.verify_password.bcrypt")
+async def bench_verify_password(context: Context) -> Operation:
+    hashed_password = pwd_context.hash(BENCH_PASSWORD)
+    return lambda: verify_password(BENCH_PASSWORD, hashed_password)
+
+@benchmark("auth.verify_password.cached")
+async def bench_verify_password_cached(context: Context) -> Operation:
+    hashed_password = pwd_context.hash(BENCH_PASSWORD)
+    cache_key = credential_key(uuid.UUID(int=0), user_email(0))
+    await verify_password(BENCH_PASSWORD, hashed_password, cache_key=cache_key)
+    return lambda: verify_password(BENCH_PASSWORD, hashed_password, cache_key=cache_key)
+
+@benchmark("auth.get_current_user")
+async def bench_get_current_user(context: Context) -> Operation:
+    # A returning client: its user and credentials are cached after the first call, as for every request but the first
+    tenant = await context.tenant()
+    request = Request({"type": "http", "method": "GET", "path": "/dishes", "headers": [], "client": ("127.0.0.1", 1234)})
+    credentials = HTTPBasicCredentials(username=user_email(0), password=BENCH_PASSWORD)
+    await get_current_user(request, tenant, credentials)
+    return lambda: get_current_user(request, tenant, credentials)
+
+# Serialization and validation
+
+@benchmark("model.dish.from_dict")
+async def bench_from_dict(context: Context) -> Operation:
+    data = sample_dish().to_dict()
+    return lambda: Dish.from_dict(data)
+
+@benchmark("model.dish.to_dict")
+async def bench_to_dict(context: Context) -> Operation:
+    dish = sample_dish()
+    return dish.to_dict
+
+@benchmark("model.dish_response.validate")
+async def bench_dish_response(context: Context) -> Operation:
+    dish = sample_dish()
+    return lambda: DishResponse.model_validate(dish)
+
+@benchmark("model.dish_summary.validate_page")
+async def bench_dish_summaries(context: Context) -> Operation:
+    # What response_model validation would cost a page of dishes, had the routes not skipped it
+    adapter = TypeAdapter(List[DishSummary])
+    page = [sample_dish(index).to_dict() for index in range(PAGE_SIZE)]
+    return lambda: adapter.validate_python(page)
+
+@benchmark("model.dish.encode_page")
+async def bench_encode_page(context: Context) -> Operation:
+    # What the routes do instead: to_dict and orjson
+    dishes = [sample_dish(index) for index in range(PAGE_SIZE)]
+    return lambda: dumps([dish.to_dict() for dish in dishes])
+
+# Repository, against the seeded tenant
+
+@benchmark("repository.get")
+async def bench_repository_get(context: Context) -> Operation:
+    tenant, dish = await context.tenant(), (await context.dishes())[0]
+    return lambda: context.repository.get(tenant.id, dish.id)
+
+@benchmark("repository.get_many")
+async def bench_repository_get_many(context: Context) -> Operation:
+    tenant, dish_ids = await context.tenant(), [dish.id for dish in await context.dishes()]
+    return lambda: context.repository.get_many(tenant.id, dish_ids)
+
+@benchmark("repository.version")
+async def bench_repository_version(context: Context) -> Operation:
+    tenant = await context.tenant()
+    await context.dishes()
+    return lambda: context.repository.version(tenant.id)
+
+@benchmark("repository.list")
+async def bench_repository_list(context: Context) -> Operation:
+    tenant = await context.tenant()
+    await context.dishes()
+    return lambda: context.repository.list(tenant.id, limit=PAGE_SIZE)
+
+@benchmark("repository.list.fields")
+async def bench_repository_list_fields(context: Context) -> Operation:
+    tenant = await context.tenant()
+    await context.dishes()
+    return lambda: context.repository.list(tenant.id, fields=["name", "price"], limit=PAGE_SIZE)
+
+@benchmark("repository.search")
+async def bench_repository_search(context: Context) -> Operation:
+    tenant, dish = await context.tenant(), (await context.dishes())[0]
+    query = dish.name.split()[0]
+    return lambda: context.repository.search(tenant.id, query, limit=PAGE_SIZE)
+
+# Request metrics
+
+@benchmark("metrics.middleware")
+async def bench_metrics_middleware(context: Context) -> Operation:
+    # The middleware's cost is this less that of the stub endpoint alone, see benchmarks/bench_metrics.py
+    app = MetricsMiddleware(endpoint)
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def request():
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+                 "path": "/dishes/00000000-0000-4000-8000-000000000000", "root_path": "", "query_string": b"",
+                 "headers": [], "client": ("127.0.0.1", 1234), "server": ("testserver", 80)}
+        return app(scope, receive, send)
+    return request
+
+async def call_time(operation: Operation, calls: int) -> float:
+    """
+    Seconds taken by calls calls of operation.
+    """
+    start = time.perf_counter()
+    for _ in range(calls):
+        result = operation()
+        if asyncio.iscoroutine(result):
+            await result
+    return time.perf_counter() - start
+
+async def measure(operation: Operation, rounds: int, min_time: float) -> Dict[str, Any]:
+    """
+    Times rounds rounds of operation, each of as many calls as fill min_time. The garbage collector is
+    held off during rounds, so one benchmark's garbage is not collected on another's time.
+    """
+    await call_time(operation, 1)
+    calls, elapsed = 1, await call_time(operation, 1)
+    while elapsed < min_time:
+        calls = max(calls * 2, int(calls * min_time / max(elapsed, 1e-9)))
+        elapsed = await call_time(operation, calls)
+    times = []
+    for _ in range(rounds):
+        gc.collect()
+        gc.disable()
+        try:
+            times.append(await call_time(operation, calls) / calls * 1e6)
+        finally:
+            gc.enable()
+    return {"median_us": statistics.median(times), "min_us": min(times),
+            "stdev_us": statistics.stdev(times) if len(times) > 1 else 0.0, "rounds": rounds, "calls": calls}
+
+def git_commit() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "--short", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    context = Context(args.tenant)
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        for bench in BENCHMARKS:
+            if args.only and not any(fnmatch.fnmatch(bench.name, pattern) for pattern in args.only):
+                continue
+            try:
+                operation = await bench.setup(context)
+            except Skip as e:
+                print(f"{bench.name:<36} skipped: {e}")
+                continue
+            results[bench.name] = result = await measure(operation, args.rounds, args.min_time)
+            print(f"{bench.name:<36} {result['median_us']:12.2f} us  (min {result['min_us']:.2f}, "
+                  f"stdev {result['stdev_us']:.2f}, {result['rounds']} x {result['calls']} calls)")
+    finally:
+        await engine.dispose()
+    return {"meta": {**git_commit(), "started_at": datetime.now(timezone.utc).isoformat(), "python": sys.version.split()[0]},
+            "config": {"rounds": args.rounds, "min_time": args.min_time, "tenant": args.tenant}, "benchmarks": results}
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], fail_above: Optional[float]) -> List[str]:
+    """
+    Prints each benchmark's change in median time from the baseline and returns those beyond fail_above.
+    """
+    print(f"baseline: {baseline['meta'].get('commit')} ({baseline['meta'].get('started_at')})")
+    regressions = []
+    for name, result in current["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            print(f"{name:<36} not in the baseline")
+            continue
+        change = (result["median_us"] - before["median_us"]) / before["median_us"] * 100
+        print(f"{name:<36} {before['median_us']:12.2f} -> {result['median_us']:12.2f} us  {change:+7.1f}%")
+        if fail_above is not None and change > fail_above:
+            regressions.append(f"{name}: {before['median_us']:.2f} -> {result['median_us']:.2f} us ({change:+.1f}%)")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", action="append", metavar="PATTERN", help="run only the benchmarks matching this glob, e.g. 'repository.*'; repeatable")
+    parser.add_argument("--rounds", type=int, default=10, help="timed rounds per benchmark (default 10)")
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds each round lasts at least (default 0.05)")
+    parser.add_argument("--tenant", default=BENCH_TENANT, help=f"seeded tenant slug (default {BENCH_TENANT})")
+    parser.add_argument("--save", metavar="PATH", help="store the results, e.g. as the baseline to compare later runs with")
+    parser.add_argument("--compare", metavar="PATH", help="baseline results to compare with")
+    parser.add_argument("--fail-above", type=float, help="with --compare, fail when a benchmark got more than this percentage slower")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    args = parser.parse_args()
+    if args.list:
+        print("\n".join(bench.name for bench in BENCHMARKS))
+        return 0
+    # Debug logging of every repository call would be measured along with it
+    logger.remove()
+    current = asyncio.run(run(args))
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as file:
+            json.dump(current, file, indent=2)
+        print(f"results saved to {args.save}")
+    if not args.compare:
+        return 0
+    with open(args.compare) as file:
+        regressions = compare(json.load(file), current, args.fail_above)
+    for regression in regressions:
+        print(f"regression: {regression}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
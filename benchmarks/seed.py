@@ -0,0 +1,114 @@
+"""
+Seeds a benchmark tenant with dishes scaled up from examples/dishes.json and a pool of users.
+
+The data is derived from --seed only, so every run (and every commit) is measured against the same menu.
+Run against the database in DATABASE_URL, e.g. the docker compose postgres after `alembic upgrade head`.
+
+    python benchmarks/seed.py --dishes 100000 --users 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from typing import Dict, Iterator, List
+from loguru import logger
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from app.blob_store import blob_store
+from app.database import engine
+from app.models import Dish, User
+from app.repositories import DishRepository
+from app.tenants import tenant_repository
+from app.user_manager import pwd_context
+from benchmarks.dataset import BENCH_PASSWORD, BENCH_TENANT, EXAMPLES, IMAGES, user_email
+
+COPY_BATCH_SIZE = 10000
+
+def load_examples() -> List[Dict]:
+    """
+    The example dishes, each with its image stored in the blob store (None if it has no image file).
+    """
+    with open(EXAMPLES) as file:
+        examples = json.load(file)
+    for example in examples:
+        path = os.path.join(IMAGES, f"{example['name'].replace(' ', '_')}.png")
+        example["image"] = blob_store.put_sync(open(path, "rb").read()) if os.path.exists(path) else None
+    return examples
+
+def generate_dishes(examples: List[Dict], count: int, seed: int) -> Iterator[Dish]:
+    """
+    Yields count dishes cycling through the examples, with numbered names and prices varied by up to 20%.
+    """
+    rng = random.Random(seed)
+    for index in range(count):
+        example = examples[index % len(examples)]
+        yield Dish.model_construct(id=uuid.UUID(int=rng.getrandbits(128), version=4), name=f"{example['name']} #{index}",
+                                   description=example["description"], price=round(example["price"] * rng.uniform(0.8, 1.2), 2),
+                                   image=example["image"])
+
+async def seed_dishes(tenant_id: uuid.UUID, count: int, seed: int) -> None:
+    repository = DishRepository()
+    batch: List[Dish] = []
+    async with repository.bulk_insert(tenant_id) as copy:
+        for dish in generate_dishes(load_examples(), count, seed):
+            batch.append(dish)
+            if len(batch) == COPY_BATCH_SIZE:
+                await copy(batch)
+                batch = []
+        if batch:
+            await copy(batch)
+
+async def seed_users(tenant_id: uuid.UUID, count: int, password: str) -> None:
+    # Every user shares one password, so it is hashed once instead of once per user
+    hashed_password = pwd_context.hash(password)
+    async with engine.begin() as conn:
+        await conn.execute(text(f'INSERT INTO "{User.__tablename__}" (tenant_id, email, hashed_password, name) '
+                                f'VALUES (:tenant_id, :email, :hashed_password, :name)'),
+                           [{"tenant_id": tenant_id, "email": user_email(index), "hashed_password": hashed_password,
+                             "name": f"Bench user {index}"} for index in range(count)])
+
+async def seed(args: argparse.Namespace) -> int:
+    tenant = await tenant_repository.get_by_slug(args.tenant) or await tenant_repository.add(args.tenant, "Benchmark")
+    # Pinned to the tenant, so its dishes are visible under row-level security
+    async with DishRepository().transaction(tenant.id) as conn:
+        dishes = (await conn.execute(text("SELECT count(*) FROM dish WHERE tenant_id = :tenant_id"), {"tenant_id": tenant.id})).scalar()
+        if dishes and not args.reset:
+            logger.critical(f"Tenant {tenant.slug} already has {dishes} dishes; pass --reset to replace them")
+            return 1
+        # Ratings go with their dishes and users
+        await conn.execute(text("DELETE FROM dish WHERE tenant_id = :tenant_id"), {"tenant_id": tenant.id})
+        await conn.execute(text(f'DELETE FROM "{User.__tablename__}" WHERE tenant_id = :tenant_id'), {"tenant_id": tenant.id})
+    start = time.perf_counter()
+    await seed_dishes(tenant.id, args.dishes, args.seed)
+    logger.success(f"{args.dishes} dishes seeded for {tenant.slug} in {time.perf_counter() - start:.1f}s")
+    await seed_users(tenant.id, args.users, args.password)
+    logger.success(f"{args.users} users seeded for {tenant.slug} ({user_email(0)} ... {user_email(args.users - 1)})")
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE dish"))
+    return 0
+
+async def run(args: argparse.Namespace) -> int:
+    try:
+        return await seed(args)
+    finally:
+        await engine.dispose()
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tenant", default=BENCH_TENANT, help=f"tenant slug, created if missing (default {BENCH_TENANT})")
+    parser.add_argument("--dishes", type=int, default=10000, help="dishes to seed (default 10000)")
+    parser.add_argument("--users", type=int, default=20, help="users to seed (default 20)")
+    parser.add_argument("--password", default=BENCH_PASSWORD, help="password of every seeded user")
+    parser.add_argument("--seed", type=int, default=42, help="random seed the dishes are derived from (default 42)")
+    parser.add_argument("--reset", action="store_true", help="replace the tenant's dishes and users if it has any")
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import os
+import sys
+from loguru import logger
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.bulk import BULK_FORMATS, BulkImportError, parse_rows
+from app.database import engine
+from app.services import DishService
+from app.tenants import DEFAULT_TENANT, tenant_repository
+
+CHUNK_SIZE = 64 * 1024
+
+async def read_chunks(path: str):
+    """
+    Read a file (or stdin for "-") in chunks without blocking the event loop.
+    """
+    stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        while chunk := await asyncio.to_thread(stream.read, CHUNK_SIZE):
+            yield chunk
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+async def resolve_tenant(slug: str):
+    tenant = await tenant_repository.get_by_slug(slug)
+    if tenant is None:
+        logger.critical(f"Unknown tenant {slug}; create it with: python db/cli.py tenant add {slug} NAME")
+    return tenant
+
+def guess_format(path: str, format: str) -> str:
+    if format:
+        return format
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+async def import_dishes(args: argparse.Namespace) -> int:
+    format = guess_format(args.file, args.format)
+    tenant = await resolve_tenant(args.tenant)
+    if tenant is None:
+        return 1
+    try:
+        imported, errors = await DishService(search_index=None).import_dishes(tenant.id, parse_rows(read_chunks(args.file), format), skip_invalid=args.skip_invalid)
+    except BulkImportError as e:
+        for error in e.errors:
+            logger.error(f"Line {error.line}: {error.error}")
+        logger.critical(f"Import rejected, {len(e.errors)} invalid rows; nothing was imported")
+        return 1
+    for error in errors:
+        logger.warning(f"Skipped line {error.line}: {error.error}")
+    logger.success(f"{imported} dishes imported for {tenant.slug}")
+    return 0
+
+async def export_dishes(args: argparse.Namespace) -> int:
+    format = guess_format(args.file, args.format)
+    tenant = await resolve_tenant(args.tenant)
+    if tenant is None:
+        return 1
+    output = sys.stdout.buffer if args.file == "-" else open(args.file, "wb")
+    try:
+        async for chunk in DishService(search_index=None).export_dishes(tenant.id, format):
+            output.write(chunk)
+    finally:
+        if output is sys.stdout.buffer:
+            output.flush()
+        else:
+            output.close()
+    logger.success(f"Dishes of {tenant.slug} exported to {args.file}")
+    return 0
+
+async def add_tenant(args: argparse.Namespace) -> int:
+    try:
+        tenant = await tenant_repository.add(args.slug, args.name)
+    except ValueError as e:
+        logger.critical(str(e))
+        return 1
+    logger.success(f"Tenant {tenant.slug} created with id {tenant.id}")
+    return 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Bulk import and export of dishes through Postgres COPY, and tenant management.")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT or "default", help="slug of the tenant whose dishes to import or export")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="import dishes from NDJSON or CSV in one transaction")
+    import_parser.add_argument("file", help="file to read, or - for stdin")
+    import_parser.add_argument("--format", choices=sorted(BULK_FORMATS), help="defaults to csv for .csv files, ndjson otherwise")
+    import_parser.add_argument("--skip-invalid", action="store_true", help="import the valid rows even if some are rejected")
+    import_parser.set_defaults(run=import_dishes)
+    export_parser = commands.add_parser("export", help="export every dish as NDJSON or CSV")
+    export_parser.add_argument("file", nargs="?", default="-", help="file to write, or - for stdout (default)")
+    export_parser.add_argument("--format", choices=sorted(BULK_FORMATS), help="defaults to csv for .csv files, ndjson otherwise")
+    export_parser.set_defaults(run=export_dishes)
+    tenant_parser = commands.add_parser("tenant", help="manage tenants")
+    tenant_commands = tenant_parser.add_subparsers(dest="tenant_command", required=True)
+    add_parser = tenant_commands.add_parser("add", help="create a tenant")
+    add_parser.add_argument("slug", help="lowercase letters, digits and hyphens; used in the X-Tenant header and subdomain")
+    add_parser.add_argument("name", help="display name of the restaurant")
+    add_parser.set_defaults(run=add_tenant)
+    args = parser.parse_args()
+    # SQL echo is printed to stdout, which may be carrying the export
+    engine.echo = False
+    return asyncio.run(args.run(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,51 @@
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
-CREATE TABLE dish (
+-- One row per restaurant; every dish and user belongs to exactly one
+CREATE TABLE tenant (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    slug VARCHAR(63) NOT NULL UNIQUE, -- resolved from the X-Tenant header or the request's subdomain
+    name VARCHAR(100) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO tenant (slug, name) VALUES ('default', 'The Dancing Pony');
+
+-- Hash partitioned on tenant_id (see db/partitions.py), so each tenant's dishes live in one partition
+-- and tenant-scoped queries only scan it. Dish ids are unique per tenant: the key includes the partition key.
+CREATE TABLE dish (
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    tenant_id UUID NOT NULL,
     name VARCHAR(100) NOT NULL,
     description TEXT,
     price DECIMAL(10, 2) NOT NULL,
-    image TEXT,
-    rating DECIMAL(2, 1) DEFAULT NULL, 
+    image VARCHAR(64), -- SHA-256 of the image in the blob store (BLOB_STORE_DIR)
+    rating DECIMAL(2, 1) DEFAULT NULL, -- mean of rating_sum / rating_count, maintained from rating_delta
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum DECIMAL(12, 1) NOT NULL DEFAULT 0,
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
-);
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    version INTEGER NOT NULL DEFAULT 1, -- bumped on every update, the strong ETag of a dish
+    search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED,
+    CONSTRAINT dish_pkey PRIMARY KEY (tenant_id, id),
+    CONSTRAINT dish_tenant_id_fkey FOREIGN KEY (tenant_id) REFERENCES tenant (id)
+) PARTITION BY HASH (tenant_id);
+
+DO $$
+BEGIN
+    FOR remainder IN 0..15 LOOP
+        EXECUTE format('CREATE TABLE dish_p16_%s PARTITION OF dish FOR VALUES WITH (MODULUS 16, REMAINDER %s)', remainder, remainder);
+    END LOOP;
+END $$;
 
 -- Create the user table
 CREATE TABLE "user" (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-    email VARCHAR(320) NOT NULL UNIQUE,
+    tenant_id UUID NOT NULL REFERENCES tenant (id),
+    email VARCHAR(320) NOT NULL, -- unique per tenant
     hashed_password VARCHAR(128) NOT NULL,
     is_active BOOLEAN NOT NULL DEFAULT TRUE,
     is_superuser BOOLEAN NOT NULL DEFAULT FALSE,
@@ -24,5 +55,139 @@ CREATE TABLE "user" (
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE INDEX idx_user_email ON "user" (email);
-CREATE INDEX idx_dish_name ON dish (name);
\ No newline at end of file
+-- One rating per user and dish; rating again replaces it
+CREATE TABLE rating (
+    tenant_id UUID NOT NULL,
+    dish_id UUID NOT NULL,
+    user_id UUID NOT NULL REFERENCES "user" (id) ON DELETE CASCADE,
+    rating DECIMAL(2, 1) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (dish_id, user_id),
+    CONSTRAINT rating_dish_fkey FOREIGN KEY (tenant_id, dish_id) REFERENCES dish (tenant_id, id) ON DELETE CASCADE
+);
+
+-- Append-only log of changes to the dish rating aggregates, folded into dish in batches
+CREATE TABLE rating_delta (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    tenant_id UUID NOT NULL,
+    dish_id UUID NOT NULL,
+    count_delta INTEGER NOT NULL,
+    sum_delta DECIMAL(12, 1) NOT NULL
+);
+
+-- One version per table and tenant, bumped by every statement writing the tenant's rows; validates list and search responses
+CREATE TABLE table_version (
+    table_name VARCHAR(63) NOT NULL,
+    tenant_id UUID NOT NULL REFERENCES tenant (id) ON DELETE CASCADE,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (table_name, tenant_id)
+);
+
+INSERT INTO table_version (table_name, tenant_id) SELECT 'dish', id FROM tenant;
+
+-- Every query is scoped to one tenant, so indexes lead with tenant_id
+CREATE UNIQUE INDEX idx_user_tenant_email ON "user" (tenant_id, email);
+CREATE INDEX idx_dish_tenant_name_id ON dish (tenant_id, name, id);
+CREATE INDEX idx_dish_search_vector ON dish USING GIN (search_vector);
+CREATE INDEX idx_dish_name_trgm ON dish USING GIN (name gin_trgm_ops);
+
+-- Publish every dish write so each worker can keep its in-memory search index current
+CREATE OR REPLACE FUNCTION notify_dish_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('dish_changes', json_build_object(
+        'op', TG_OP,
+        'tenant_id', CASE WHEN TG_OP = 'DELETE' THEN OLD.tenant_id ELSE NEW.tenant_id END,
+        'id', CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER dish_change_notify
+AFTER INSERT OR UPDATE OR DELETE ON dish
+FOR EACH ROW EXECUTE FUNCTION notify_dish_change();
+
+-- Bump the row version and updated_at on every dish update
+CREATE OR REPLACE FUNCTION touch_row() RETURNS trigger AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    NEW.updated_at := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER dish_touch
+BEFORE UPDATE ON dish
+FOR EACH ROW EXECUTE FUNCTION touch_row();
+
+-- Bump the dish table version of every tenant a statement wrote rows of; TRUNCATE bumps them all.
+-- Transition tables are limited to one event per trigger, so each event has its own trigger, all naming theirs "changed".
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE table_name = TG_TABLE_NAME;
+    ELSE
+        INSERT INTO table_version (table_name, tenant_id)
+        SELECT DISTINCT TG_TABLE_NAME, tenant_id FROM changed
+        ON CONFLICT (table_name, tenant_id)
+        DO UPDATE SET version = table_version.version + 1, updated_at = CURRENT_TIMESTAMP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER dish_version_bump_insert
+AFTER INSERT ON dish REFERENCING NEW TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+CREATE TRIGGER dish_version_bump_update
+AFTER UPDATE ON dish REFERENCING NEW TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+CREATE TRIGGER dish_version_bump_delete
+AFTER DELETE ON dish REFERENCING OLD TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+CREATE TRIGGER dish_version_bump_truncate
+AFTER TRUNCATE ON dish
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+-- Start every new tenant at version 1
+CREATE OR REPLACE FUNCTION create_tenant_versions() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO table_version (table_name, tenant_id) VALUES ('dish', NEW.id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tenant_versions_create
+AFTER INSERT ON tenant
+FOR EACH ROW EXECUTE FUNCTION create_tenant_versions();
+
+-- Optional row-level security (see DB_ROW_LEVEL_SECURITY): once enabled with
+--   ALTER TABLE dish ENABLE ROW LEVEL SECURITY; ALTER TABLE dish FORCE ROW LEVEL SECURITY;
+-- a connection pinned to a tenant through app.tenant_id only sees and writes that tenant's dishes.
+-- It fails closed: a statement on a connection pinned to no tenant is refused.
+CREATE POLICY dish_tenant_isolation ON dish
+USING (tenant_id = current_setting('app.tenant_id')::uuid);
+
+-- Log every rating change as a delta instead of updating the dish row
+CREATE OR REPLACE FUNCTION record_rating_delta() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO rating_delta (tenant_id, dish_id, count_delta, sum_delta) VALUES (NEW.tenant_id, NEW.dish_id, 1, NEW.rating);
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO rating_delta (tenant_id, dish_id, count_delta, sum_delta) VALUES (NEW.tenant_id, NEW.dish_id, 0, NEW.rating - OLD.rating);
+    ELSE
+        INSERT INTO rating_delta (tenant_id, dish_id, count_delta, sum_delta) VALUES (OLD.tenant_id, OLD.dish_id, -1, -OLD.rating);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rating_delta_record
+AFTER INSERT OR UPDATE OR DELETE ON rating
+FOR EACH ROW EXECUTE FUNCTION record_rating_delta();
@@ -1,9 +1,15 @@
 import psycopg2
+import csv
+import io
 import json
 import os
-import base64
+import sys
 from loguru import logger
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.blob_store import blob_store
+
 
 
 json_file_path = ('examples/dishes.json')
@@ -24,12 +30,12 @@ with open(json_file_path, 'r') as file:
         
 for dish in dishes:
     image_path = os.path.join(img_dir, f"{dish['name'].replace(' ', '_')}.png")
+    dish['image'] = None
     try:
-        logger.info(f"Encoding image for {image_path}...")
+        logger.info(f"Storing image for {image_path}...")
         with open(image_path, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-            dish['image'] = encoded_string
-            logger.success(f"Image for {dish['name']} encoded successfully.")
+            dish['image'] = blob_store.put_sync(image_file.read())
+            logger.success(f"Image for {dish['name']} stored as {dish['image']}.")
     except Exception as e:
         logger.warning(f"Warning: Image for {dish['name']} not found: {e}")
 
@@ -43,13 +49,19 @@ try:
     )
     cur = conn.cursor()
 
-    insert_query = """
-    INSERT INTO dish (name, description, price, image, rating)
-    VALUES (%s, %s, %s, %s, %s)
-    """
+    # The examples belong to the default tenant
+    cur.execute("SELECT id FROM tenant WHERE slug = %s", (os.getenv("DEFAULT_TENANT") or "default",))
+    tenant_id = cur.fetchone()[0]
 
+    # Load every dish with a single COPY instead of one INSERT per dish; empty CSV values are NULL
+    rows = io.StringIO()
+    writer = csv.writer(rows)
     for dish in dishes:
-        cur.execute(insert_query, (dish['name'], dish['description'], dish['price'], dish['image'], dish['rating']))
+        # Seed ratings count as a single anonymous vote
+        rating_count = 0 if dish['rating'] is None else 1
+        writer.writerow((tenant_id, dish['name'], dish['description'], dish['price'], dish['image'], dish['rating'], rating_count, dish['rating'] or 0))
+    rows.seek(0)
+    cur.copy_expert("COPY dish (tenant_id, name, description, price, image, rating, rating_count, rating_sum) FROM STDIN WITH (FORMAT csv)", rows)
 
     conn.commit()
 
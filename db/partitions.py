@@ -0,0 +1,292 @@
+"""
+Hash partitioning of the dish table by tenant.
+
+dish is split into DISH_PARTITIONS partitions on hash(tenant_id), so all of a tenant's dishes live in one
+partition and every tenant-scoped query is pruned down to it. Moving dish to a new layout (off the original
+single table, or to another partition count) happens online, while the app keeps serving:
+
+    python db/partitions.py prepare --partitions 32  # create dish_next and mirror every write on dish into it
+    python db/partitions.py backfill                 # copy the existing rows, a few heap pages per transaction
+    python db/partitions.py swap                     # brief exclusive lock: drop dish, rename dish_next to dish
+
+The Alembic revision that partitions dish runs the same statements, preparing and copying inside its own
+transaction when dish_next does not exist yet, so small databases only need `alembic upgrade head`.
+Privileges granted on dish to roles other than its owner have to be granted again after a swap. Copying rows
+needs a role that row-level security does not restrict (see ROW_SECURITY_EXEMPT_SQL); the tool refuses to
+copy otherwise rather than swap in an empty table.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from typing import List, Sequence, Tuple
+from loguru import logger
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from app.database import engine
+
+# Partition count of a new layout; a hash partition holds the tenants whose tenant_id hashes to its remainder
+DISH_PARTITIONS = int(os.getenv("DISH_PARTITIONS", 16))
+# Heap pages (8 kB) of dish copied per backfill transaction, so no transaction holds row locks for long
+PARTITION_BACKFILL_PAGES = int(os.getenv("PARTITION_BACKFILL_PAGES", 128))
+BACKFILL_RETRIES = 3
+
+NEXT_TABLE = "dish_next"
+BACKFILLED = "backfilled"
+
+# Columns written to the new table, in order; search_vector is generated from them
+COLUMNS_SQL = """
+    SELECT column_name FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = 'dish' AND is_generated = 'NEVER'
+    ORDER BY ordinal_position
+"""
+ROW_SECURITY_SQL = "SELECT relrowsecurity, relforcerowsecurity FROM pg_class WHERE oid = 'dish'::regclass"
+# Whether the current role reads every row of dish, as copying it requires: the dish_tenant_isolation policy
+# shows a role pinned to no tenant nothing, unless the role is exempt from row-level security
+ROW_SECURITY_EXEMPT_SQL = """
+    SELECT NOT c.relrowsecurity OR r.rolsuper OR r.rolbypassrls OR (pg_has_role(c.relowner, 'USAGE') AND NOT c.relforcerowsecurity)
+    FROM pg_class c JOIN pg_roles r ON r.rolname = current_user
+    WHERE c.oid = 'dish'::regclass
+"""
+ROW_SECURITY_MESSAGE = ("Row-level security is on for dish and this role is not exempt from it, so it would copy no rows; "
+                        "run as the table owner (with row-level security not forced), a superuser or a role with BYPASSRLS")
+NEXT_STATE_SQL = f"SELECT to_regclass('{NEXT_TABLE}') IS NOT NULL, obj_description(to_regclass('{NEXT_TABLE}'), 'pg_class') = '{BACKFILLED}'"
+# Heap files to copy: the partitions of a partitioned table, or the table itself
+HEAPS_SQL = """
+    SELECT relid::regclass::text, pg_relation_size(relid) / current_setting('block_size')::int
+    FROM pg_partition_tree('dish') WHERE isleaf
+    ORDER BY relid
+"""
+LAYOUT_SQL = """
+    SELECT c.relname, COALESCE(pg_get_expr(c.relpartbound, c.oid), 'unpartitioned'), c.reltuples::bigint, pg_total_relation_size(c.oid)
+    FROM pg_partition_tree(:table) t JOIN pg_class c ON c.oid = t.relid
+    WHERE t.isleaf
+    ORDER BY length(c.relname), c.relname
+"""
+
+# Indexes of dish beyond its primary key, as (suffix, definition); created as idx_dish_<suffix>
+INDEXES = (
+    ("tenant_name_id", "(tenant_id, name, id)"),
+    ("search_vector", "USING GIN (search_vector)"),
+    ("name_trgm", "USING GIN (name gin_trgm_ops)"),
+)
+
+# Triggers of dish, recreated on the new table when it replaces dish
+TRIGGERS = (
+    "CREATE TRIGGER dish_change_notify AFTER INSERT OR UPDATE OR DELETE ON dish FOR EACH ROW EXECUTE FUNCTION notify_dish_change()",
+    "CREATE TRIGGER dish_touch BEFORE UPDATE ON dish FOR EACH ROW EXECUTE FUNCTION touch_row()",
+    "CREATE TRIGGER dish_version_bump_insert AFTER INSERT ON dish REFERENCING NEW TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()",
+    "CREATE TRIGGER dish_version_bump_update AFTER UPDATE ON dish REFERENCING NEW TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()",
+    "CREATE TRIGGER dish_version_bump_delete AFTER DELETE ON dish REFERENCING OLD TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()",
+    "CREATE TRIGGER dish_version_bump_truncate AFTER TRUNCATE ON dish FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()",
+    "CREATE POLICY dish_tenant_isolation ON dish USING (tenant_id = current_setting('app.tenant_id')::uuid)",
+)
+
+def partition_name(partitions: int, remainder: int) -> str:
+    return f"dish_p{partitions}_{remainder}"
+
+def prepare_statements(columns: Sequence[str], partitions: int = DISH_PARTITIONS) -> List[str]:
+    """
+    Creates dish_next with the columns and indexes of dish, hash partitioned on tenant_id into the given
+    number of partitions (0 for a single table), and mirrors every later write on dish into it.
+    """
+    layout = " PARTITION BY HASH (tenant_id)" if partitions else ""
+    statements = [
+        f"CREATE TABLE {NEXT_TABLE} (LIKE dish INCLUDING DEFAULTS INCLUDING GENERATED){layout}",
+        # The partition key has to be part of every unique constraint, so ids are unique per tenant
+        f"ALTER TABLE {NEXT_TABLE} ADD CONSTRAINT {NEXT_TABLE}_pkey PRIMARY KEY (tenant_id, id)",
+        f"ALTER TABLE {NEXT_TABLE} ADD CONSTRAINT {NEXT_TABLE}_tenant_id_fkey FOREIGN KEY (tenant_id) REFERENCES tenant (id)",
+    ]
+    statements += [
+        f"CREATE TABLE {partition_name(partitions, remainder)} PARTITION OF {NEXT_TABLE} "
+        f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        for remainder in range(partitions)
+    ]
+    for suffix, definition in INDEXES:
+        create = f"CREATE INDEX idx_{NEXT_TABLE}_{suffix} ON {NEXT_TABLE} {definition}"
+        if "gin_trgm_ops" in definition:
+            create = f"DO $$ BEGIN IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN EXECUTE '{create}'; END IF; END $$"
+        statements.append(create)
+    column_list = ", ".join(columns)
+    values = ", ".join(f"NEW.{column}" for column in columns)
+    statements += [
+        f"""
+        CREATE OR REPLACE FUNCTION mirror_dish_row() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM {NEXT_TABLE} WHERE tenant_id = OLD.tenant_id AND id = OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO {NEXT_TABLE} ({column_list}) VALUES ({values});
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "CREATE TRIGGER dish_mirror AFTER INSERT OR UPDATE OR DELETE ON dish FOR EACH ROW EXECUTE FUNCTION mirror_dish_row()",
+    ]
+    return statements
+
+def backfill_statement(columns: Sequence[str], heap: str, start: int, end: int) -> str:
+    """
+    Copies the rows stored in heap pages [start, end) of dish, or of one of its partitions, into dish_next.
+
+    The rows are locked FOR SHARE while they are copied, so a concurrent update or delete waits and then
+    mirrors over the copy. Rows dish_next already has were mirrored there by a later write and are kept.
+    """
+    column_list = ", ".join(columns)
+    return f"""
+        INSERT INTO {NEXT_TABLE} ({column_list})
+        SELECT {column_list} FROM {heap}
+        WHERE ctid >= '({start},0)'::tid AND ctid < '({end},0)'::tid
+        FOR SHARE
+        ON CONFLICT (tenant_id, id) DO NOTHING
+    """
+
+def swap_statements(columns: Sequence[str], row_security: Tuple[bool, bool], backfilled: bool) -> List[str]:
+    """
+    Replaces dish with dish_next under an exclusive lock, copying the rows first unless a backfill already did.
+
+    Recreates the triggers, the row-level security policy and its enabled/forced state, and the composite
+    foreign key ratings hold on (tenant_id, dish_id).
+    """
+    column_list = ", ".join(columns)
+    statements = ["LOCK TABLE dish, rating IN ACCESS EXCLUSIVE MODE"]
+    if not backfilled:
+        statements.append(f"INSERT INTO {NEXT_TABLE} ({column_list}) SELECT {column_list} FROM dish ON CONFLICT (tenant_id, id) DO NOTHING")
+    statements += [
+        "ALTER TABLE rating DROP CONSTRAINT IF EXISTS rating_dish_id_fkey",
+        "ALTER TABLE rating DROP CONSTRAINT IF EXISTS rating_dish_fkey",
+        "DROP TABLE dish",
+        "DROP FUNCTION IF EXISTS mirror_dish_row()",
+        f"ALTER TABLE {NEXT_TABLE} RENAME TO dish",
+        f"ALTER TABLE dish RENAME CONSTRAINT {NEXT_TABLE}_pkey TO dish_pkey",
+        f"ALTER TABLE dish RENAME CONSTRAINT {NEXT_TABLE}_tenant_id_fkey TO dish_tenant_id_fkey",
+        "COMMENT ON TABLE dish IS NULL",
+    ]
+    statements += [f"ALTER INDEX IF EXISTS idx_{NEXT_TABLE}_{suffix} RENAME TO idx_dish_{suffix}" for suffix, _ in INDEXES]
+    statements += list(TRIGGERS)
+    enabled, forced = row_security
+    if enabled:
+        statements.append("ALTER TABLE dish ENABLE ROW LEVEL SECURITY")
+    if forced:
+        statements.append("ALTER TABLE dish FORCE ROW LEVEL SECURITY")
+    statements.append("ALTER TABLE rating ADD CONSTRAINT rating_dish_fkey FOREIGN KEY (tenant_id, dish_id) REFERENCES dish (tenant_id, id) ON DELETE CASCADE")
+    return statements
+
+async def _columns(conn) -> List[str]:
+    return list((await conn.execute(text(COLUMNS_SQL))).scalars().all())
+
+async def _exempt_from_row_security(conn) -> bool:
+    return bool((await conn.execute(text(ROW_SECURITY_EXEMPT_SQL))).scalar())
+
+async def _next_state(conn) -> Tuple[bool, bool]:
+    exists, backfilled = (await conn.execute(text(NEXT_STATE_SQL))).one()
+    return exists, bool(backfilled)
+
+async def show_status(args: argparse.Namespace) -> int:
+    async with engine.connect() as conn:
+        exists, backfilled = await _next_state(conn)
+        for table in ("dish", NEXT_TABLE) if exists else ("dish",):
+            rows = (await conn.execute(text(LAYOUT_SQL), {"table": table})).all()
+            print(f"{table}: {len(rows) if rows[0][1] != 'unpartitioned' else 0} partitions")
+            for name, bound, estimate, size in rows:
+                rows_text = f"~{estimate} rows" if estimate >= 0 else "not analyzed"
+                print(f"  {name:<16} {bound:<48} {rows_text:<14} {size // 1024} kB")
+    if exists:
+        print(f"{NEXT_TABLE} is {'backfilled, ready to swap' if backfilled else 'mirroring writes, not backfilled yet'}")
+    return 0
+
+async def prepare(args: argparse.Namespace) -> int:
+    async with engine.begin() as conn:
+        exists, _ = await _next_state(conn)
+        if exists:
+            logger.critical(f"{NEXT_TABLE} already exists; backfill and swap it, or drop it and its dish_mirror trigger to start over")
+            return 1
+        current = (await conn.execute(text(LAYOUT_SQL), {"table": "dish"})).all()
+        if args.partitions and len(current) == args.partitions and current[0][1] != "unpartitioned":
+            logger.critical(f"dish is already split into {args.partitions} partitions")
+            return 1
+        for statement in prepare_statements(await _columns(conn), args.partitions):
+            await conn.execute(text(statement))
+    logger.success(f"{NEXT_TABLE} created with {args.partitions} partitions, writes on dish are mirrored into it; run backfill next")
+    return 0
+
+async def backfill(args: argparse.Namespace) -> int:
+    async with engine.connect() as conn:
+        exists, _ = await _next_state(conn)
+        if not exists:
+            logger.critical(f"No {NEXT_TABLE} to backfill; run prepare first")
+            return 1
+        if not await _exempt_from_row_security(conn):
+            logger.critical(ROW_SECURITY_MESSAGE)
+            return 1
+        columns = await _columns(conn)
+        heaps = (await conn.execute(text(HEAPS_SQL))).all()
+    copied = 0
+    # Pages added after this point only hold rows written since prepare, which were mirrored already
+    for heap, pages in heaps:
+        for start in range(0, pages, args.pages):
+            end = min(start + args.pages, pages)
+            for attempt in range(1, BACKFILL_RETRIES + 1):
+                try:
+                    async with engine.begin() as conn:
+                        copied += (await conn.execute(text(backfill_statement(columns, heap, start, end)))).rowcount
+                    break
+                except DBAPIError as e:
+                    # Deadlocks with concurrent writers are resolved by retrying the batch
+                    if attempt == BACKFILL_RETRIES:
+                        raise
+                    logger.warning(f"Copying pages {start}-{end} of {heap} failed, retrying: {e}")
+            logger.info(f"{heap}: copied pages {end}/{pages}, {copied} rows so far")
+            if args.pause:
+                await asyncio.sleep(args.pause)
+    async with engine.begin() as conn:
+        await conn.execute(text(f"COMMENT ON TABLE {NEXT_TABLE} IS '{BACKFILLED}'"))
+    logger.success(f"{copied} rows copied into {NEXT_TABLE}; run swap next")
+    return 0
+
+async def swap(args: argparse.Namespace) -> int:
+    async with engine.begin() as conn:
+        exists, backfilled = await _next_state(conn)
+        if not exists:
+            logger.critical(f"No {NEXT_TABLE} to swap in; run prepare and backfill first")
+            return 1
+        if not backfilled and not args.copy:
+            logger.critical(f"{NEXT_TABLE} is not backfilled; run backfill, or pass --copy to copy the rows under the lock")
+            return 1
+        if not backfilled and not await _exempt_from_row_security(conn):
+            logger.critical(ROW_SECURITY_MESSAGE)
+            return 1
+        # Give up rather than queue behind a long transaction while blocking every query on dish
+        await conn.execute(text(f"SET LOCAL lock_timeout = '{int(args.lock_timeout * 1000)}ms'"))
+        row_security = tuple((await conn.execute(text(ROW_SECURITY_SQL))).one())
+        for statement in swap_statements(await _columns(conn), row_security, backfilled):
+            await conn.execute(text(statement))
+    logger.success(f"dish replaced by {NEXT_TABLE}")
+    return 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Partitioning of the dish table by tenant, moved online.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="show the partitions of dish, and of dish_next during a move").set_defaults(run=show_status)
+    prepare_parser = commands.add_parser("prepare", help="create dish_next with a new layout and mirror writes into it")
+    prepare_parser.add_argument("--partitions", type=int, default=DISH_PARTITIONS, help=f"hash partitions, 0 for a single table (default {DISH_PARTITIONS})")
+    prepare_parser.set_defaults(run=prepare)
+    backfill_parser = commands.add_parser("backfill", help="copy the existing rows of dish into dish_next in small transactions")
+    backfill_parser.add_argument("--pages", type=int, default=PARTITION_BACKFILL_PAGES, help=f"8 kB heap pages per transaction (default {PARTITION_BACKFILL_PAGES})")
+    backfill_parser.add_argument("--pause", type=float, default=0, help="seconds to sleep between transactions, to throttle the copy")
+    backfill_parser.set_defaults(run=backfill)
+    swap_parser = commands.add_parser("swap", help="replace dish with dish_next")
+    swap_parser.add_argument("--lock-timeout", type=float, default=5, help="seconds to wait for the exclusive lock before giving up (default 5)")
+    swap_parser.add_argument("--copy", action="store_true", help="copy the rows while holding the lock instead of requiring a backfill")
+    swap_parser.set_defaults(run=swap)
+    args = parser.parse_args()
+    engine.echo = False
+    return asyncio.run(args.run(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Gunicorn settings for production, read from the environment; gunicorn loads this file from the working directory.
+
+    gunicorn main:app
+
+Every worker imports the app itself after the fork (unless PRELOAD_APP is set), then opens its own database
+pool, Redis connections, caches and background threads in the app's lifespan, so no socket is shared
+between processes.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', 8000)}")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "app.workers.UvicornWorker"
+
+# Worker recycling - each worker is restarted after about this many requests, so slow leaks and
+# fragmentation are bounded; the jitter keeps the workers from restarting all at once. 0 disables it.
+max_requests = int(os.getenv("MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", 1000))
+
+# Seconds a worker is given on SIGTERM (or when recycled) to finish its requests before it is killed
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+# A worker that has not checked in for this many seconds is killed and replaced
+timeout = int(os.getenv("WORKER_TIMEOUT", 60))
+keepalive = int(os.getenv("KEEPALIVE", 5))
+
+# Importing the app once in the master shares its memory between workers and speeds up their start;
+# the database engine and the log and span writers reset themselves in forked children
+preload_app = os.getenv("PRELOAD_APP", "false").lower() in ("1", "true", "yes")
+
+# Behind a reverse proxy, so client addresses (lockouts, rate limits, logs) are the real ones
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+# Every worker keeps its own metrics; with several, they write them to a shared directory (see app/metrics.py).
+# Set here, before a preloaded app imports prometheus_client, and kept across configuration reloads.
+if workers > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="dancingpony-metrics-")
+
+def on_starting(server):
+    # Samples left by a previous run would be added to this one's
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+    # Each worker has a pool of its own, so the database must accept this many connections from the service
+    per_worker = int(os.getenv("DB_POOL_SIZE", 20)) + int(os.getenv("DB_MAX_OVERFLOW", 0))
+    server.log.info(f"{workers} workers, up to {workers * per_worker} database connections ({per_worker} per worker)")
+
+def child_exit(server, worker):
+    # Drop the in-progress gauge of a worker that exited, or it would be counted until the next restart
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,15 +1,47 @@
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.routes import router as app_router
+from fastapi.responses import ORJSONResponse
+from app.routes import router as app_router, controller
 from app.metrics import init_metrics  # Import the init_metrics function
+from app.rate_limit import init_rate_limit
+from app.log import configure_logging, init_logging
+from app.tracing import init_tracing, shutdown_tracing
+from app.database import engine, warm_pool
 
-app = FastAPI()
+# Configure the log pipeline (levels, format, sampling, background writer) from the LOG_* settings
+configure_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in every worker process once it has started, so each opens its own database connections
+    await warm_pool()
+    # Build the in-memory search index (if enabled) and start following dish changes before serving
+    await controller.service.start()
+    yield
+    # Requests have drained by now: close this worker's pooled connections rather than leaving them to the server to drop
+    await controller.service.stop()
+    await engine.dispose()
+    shutdown_tracing()
+
+# Encode every JSON response with orjson; dish routes also bypass response_model validation (see app/responses.py)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Initialize metrics
 init_metrics(app)
 
+# Add RateLimit-* headers to rate limited responses
+init_rate_limit(app)
+
+# Time every SQL statement, and open the root span of traced requests (TRACING_EXPORTER)
+init_tracing(app)
+
+# Tag every log record with the request id; added last so it wraps the other middleware
+init_logging(app)
+
 # Include your application routes
 app.include_router(app_router)
 
 if __name__ == '__main__':
+    # A single process for development; in production run gunicorn, see gunicorn.conf.py
     uvicorn.run(app, host="0.0.0.0", port=8000)
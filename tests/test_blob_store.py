@@ -0,0 +1,43 @@
+import pytest
+from app.blob_store import BlobStore
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 16
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.mark.anyio
+async def test_media_type_is_known_from_the_store(tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path))
+    digest = await store.put(PNG)
+    monkeypatch.setattr(store, "media_type_sync", lambda digest: pytest.fail("the blob was read again"))
+    assert await store.media_type(digest) == "image/png"
+
+@pytest.mark.anyio
+async def test_media_type_of_a_blob_stored_elsewhere_is_sniffed_once(tmp_path):
+    digest = await BlobStore(str(tmp_path)).put(b"RIFF\x00\x00\x00\x00WEBPVP8 ")
+    other = BlobStore(str(tmp_path))
+    assert await other.media_type(digest) == "image/webp"
+    other.path(digest).unlink()
+    assert await other.media_type(digest) == "image/webp"
+
+@pytest.mark.anyio
+async def test_unknown_content_is_octet_stream(tmp_path):
+    store = BlobStore(str(tmp_path))
+    assert await store.media_type(await store.put(b"plain text")) == "application/octet-stream"
+
+def test_staged_blob_is_only_visible_once_published(tmp_path):
+    store = BlobStore(str(tmp_path))
+    staged = store.stage_sync(PNG)
+    assert not store.exists(staged.digest)
+    store.publish_sync(staged)
+    assert store.read_sync(staged.digest) == PNG
+    assert store.stage_sync(PNG).tmp_path is None
+
+def test_discarded_blob_leaves_nothing_behind(tmp_path):
+    store = BlobStore(str(tmp_path))
+    staged = store.stage_sync(PNG)
+    store.discard_sync(staged)
+    assert not store.exists(staged.digest)
+    assert [path for path in tmp_path.rglob("*") if path.is_file()] == []
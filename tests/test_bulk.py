@@ -0,0 +1,141 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List
+import pytest
+from app.blob_store import BlobStore
+from app.bulk import MAX_REPORTED_ERRORS, BulkImportError, RowError, error_report, parse_csv, parse_rows, read_lines, validate_row
+from app.services import DishService
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+async def chunks(data: bytes, size: int = 7) -> AsyncIterator[bytes]:
+    # Small chunks, so rows and quoted values are split across them
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+async def parse(data: bytes, format: str) -> list:
+    return [row async for row in parse_rows(chunks(data), format)]
+
+class FakeRepository:
+    """
+    Collects the batches an import COPYs, as the transaction would.
+    """
+    def __init__(self):
+        self.copied: List[str] = []
+
+    @asynccontextmanager
+    async def bulk_insert(self, tenant_id):
+        batches = []
+
+        async def copy(dishes):
+            batches.append([dish.name for dish in dishes])
+
+        yield copy
+        for batch in batches:
+            self.copied.extend(batch)
+
+@pytest.mark.anyio
+async def test_parse_csv():
+    data = (b'name,description,price,image\r\n'
+            b'Lembas Bread,"Elven waybread, long-lasting",4.99,\r\n'
+            b'\r\n'
+            b'Beef Stew,"A hearty stew,\nslow-cooked ""to perfection""",12.5,\r\n')
+    assert await parse(data, "csv") == [
+        (2, {"name": "Lembas Bread", "description": "Elven waybread, long-lasting", "price": "4.99"}),
+        (4, {"name": "Beef Stew", "description": 'A hearty stew,\nslow-cooked "to perfection"', "price": "12.5"}),
+    ]
+
+@pytest.mark.anyio
+async def test_parse_csv_reports_bad_rows_by_line():
+    data = b'name,description,price\nPie,Savory,8.75,extra\nAle,"never closed,3\n'
+    rows = await parse(data, "csv")
+    assert [line for line, _ in rows] == [2, 3]
+    assert str(rows[0][1]) == "expected 3 values, got 4"
+    assert str(rows[1][1]) == "unterminated quoted value"
+
+@pytest.mark.anyio
+async def test_parse_ndjson():
+    data = b'{"name": "Pie"}\n\n{not json\n{"name": "Ale"}'
+    rows = await parse(data, "ndjson")
+    assert [line for line, _ in rows] == [1, 3, 4]
+    assert rows[0][1] == {"name": "Pie"}
+    assert isinstance(rows[1][1], ValueError)
+    assert rows[2][1] == {"name": "Ale"}
+
+@pytest.mark.anyio
+async def test_invalid_utf8_is_that_rows_error():
+    ndjson = await parse(b'{"name": "Pie"}\n{"name": "\xff"}\n{"name": "Ale"}\n', "ndjson")
+    assert [line for line, _ in ndjson] == [1, 2, 3]
+    assert str(ndjson[1][1]).startswith("not valid UTF-8")
+    rows = await parse(b'name,price\nPie,1\n\xc3,2\nAle,3\n', "csv")
+    assert [line for line, _ in rows] == [2, 3, 4]
+    assert isinstance(rows[1][1], ValueError)
+    assert rows[2][1] == {"name": "Ale", "price": "3"}
+
+@pytest.mark.anyio
+async def test_long_lines_are_reported_and_skipped():
+    data = b"short\n" + b"x" * 100 + b"\nnext\n" + b"y" * 40
+    lines = [(line, text) async for line, text in read_lines(chunks(data), max_line_size=32)]
+    assert [line for line, _ in lines] == [1, 2, 3, 4]
+    assert lines[0][1] == "short" and lines[2][1] == "next"
+    assert str(lines[1][1]) == str(lines[3][1]) == "line longer than 32 bytes"
+
+@pytest.mark.anyio
+async def test_unterminated_csv_record_is_capped():
+    data = b'name,description\nPie,"' + b"never closed\n" * 10 + b"Ale,Frothy\n"
+    rows = [row async for row in parse_csv(chunks(data), max_record_size=64)]
+    assert rows[0] == (2, rows[0][1])
+    assert str(rows[0][1]) == "record longer than 64 characters"
+
+def test_validate_row():
+    assert validate_row({"name": "Pie", "description": "Savory", "price": "8.75"}).price == 8.75
+    with pytest.raises(ValueError, match="^price: Input should be greater than or equal to 0$"):
+        validate_row({"name": "Pie", "description": "Savory", "price": -1})
+    with pytest.raises(ValueError, match="^description: Field required$"):
+        validate_row({"name": "Pie", "price": 1})
+    with pytest.raises(ValueError, match="^unreadable row"):
+        validate_row(ValueError("Expecting value"))
+    with pytest.raises(ValueError, match="^expected an object$"):
+        validate_row([1, 2])
+
+def test_error_report_is_capped():
+    errors = [RowError(line, "bad") for line in range(MAX_REPORTED_ERRORS + 5)]
+    assert error_report(errors)[:1] == [{"line": 0, "error": "bad"}]
+    assert len(error_report(errors)) == MAX_REPORTED_ERRORS
+
+@pytest.mark.anyio
+async def test_import_rejects_the_file_with_every_row_error():
+    repository = FakeRepository()
+    service = DishService(repository=repository, search_index=None, cache=None)
+    data = b'{"name": "Pie", "description": "Savory", "price": 8.75}\n{"name": "", "description": "x", "price": 1}\n{oops\n'
+    with pytest.raises(BulkImportError) as rejected:
+        await service.import_dishes(None, parse_rows(chunks(data), "ndjson"))
+    assert [error.line for error in rejected.value.errors] == [2, 3]
+    assert rejected.value.errors[0].error == "name: String should have at least 1 character"
+    assert repository.copied == []
+
+@pytest.mark.anyio
+async def test_import_skips_invalid_rows():
+    repository = FakeRepository()
+    service = DishService(repository=repository, search_index=None, cache=None)
+    data = b'name,description,price\nPie,Savory,8.75\nAle,Frothy,-2\nStew,Hearty,12.5\n'
+    imported, errors = await service.import_dishes(None, parse_rows(chunks(data), "csv"), skip_invalid=True)
+    assert imported == 2
+    assert errors == [RowError(3, "price: Input should be greater than or equal to 0")]
+    assert repository.copied == ["Pie", "Stew"]
+
+@pytest.mark.anyio
+async def test_import_refuses_unknown_image_digests(tmp_path):
+    repository = FakeRepository()
+    service = DishService(repository=repository, images=BlobStore(str(tmp_path)), search_index=None, cache=None)
+    stored = await service.images.put(b"GIF89a")
+    unknown = "ab" * 32
+    data = (f'{{"name": "Pie", "description": "Savory", "price": 1, "image": "{stored}"}}\n'
+            f'{{"name": "Ale", "description": "Frothy", "price": 2, "image": "{unknown}"}}\n').encode()
+    imported, errors = await service.import_dishes(None, parse_rows(chunks(data), "ndjson"), skip_invalid=True)
+    assert imported == 1
+    assert [error.line for error in errors] == [2]
+    assert errors[0].error.startswith(f"image: unknown image digest {unknown}")
+    # Nothing decoded from the digest was stored
+    assert [path.name for path in tmp_path.rglob("*") if path.is_file()] == [stored]
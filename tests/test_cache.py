@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from app import cache
+from app.cache import SingleFlight, TTLCache
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+def test_ttl_cache_evicts_least_recently_used():
+    lru = TTLCache("test_lru", ttl=60, max_size=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1  # b is now the least recently used
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c")) == (1, 3)
+    assert len(lru) == 2
+
+def test_ttl_cache_expires_entries(clock):
+    ttl = TTLCache("test_ttl", ttl=10, max_size=10)
+    ttl.set("a", 1)
+    clock[0] += 10
+    assert ttl.get("a") == 1
+    clock[0] += 0.5
+    assert ttl.get("a") is None
+    assert len(ttl) == 0
+
+def test_ttl_cache_invalidates():
+    invalidated = TTLCache("test_invalidate", ttl=60, max_size=10)
+    invalidated.set("a", 1)
+    invalidated.set("b", 2)
+    invalidated.invalidate("a")
+    assert (invalidated.get("a"), invalidated.get("b")) == (None, 2)
+    invalidated.invalidate()
+    assert len(invalidated) == 0
+
+def test_ttl_cache_of_size_zero_stores_nothing():
+    disabled = TTLCache("test_disabled", ttl=60, max_size=0)
+    disabled.set("a", 1)
+    assert disabled.get("a") is None
+
+@pytest.mark.anyio
+async def test_single_flight_coalesces_concurrent_loads():
+    flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return calls
+
+    waiters = [asyncio.ensure_future(flight.do("key", loader)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(*waiters) == [1] * 5
+    assert calls == 1
+    # Once the load is over, the next call runs the loader again
+    assert await flight.do("key", loader) == 2
+
+@pytest.mark.anyio
+async def test_single_flight_shares_the_loader_error():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def loader():
+        await release.wait()
+        raise ValueError("boom")
+
+    waiters = [asyncio.ensure_future(flight.do("key", loader)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+
+@pytest.mark.anyio
+async def test_single_flight_keeps_keys_apart():
+    flight = SingleFlight()
+
+    async def load(value):
+        await asyncio.sleep(0)
+        return value
+
+    assert await asyncio.gather(flight.do("a", lambda: load(1)), flight.do("b", lambda: load(2))) == [1, 2]
@@ -0,0 +1,44 @@
+import base64
+import json
+import uuid
+import pytest
+from fastapi import HTTPException
+from app.routes import decode_cursor, encode_cursor
+
+def raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+@pytest.mark.parametrize("key, key_type", [("Lembas Bread", str), ("Crème brûlée ☕", str), (1.2345678, float), (0.1 + 0.2, float), (3, float)])
+def test_round_trip(key, key_type):
+    dish_id = uuid.uuid4()
+    cursor = encode_cursor(key, dish_id)
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+    assert decode_cursor(cursor, key_type) == (key, dish_id)
+
+def test_first_page():
+    assert decode_cursor(None, str) is None
+    assert decode_cursor("", str) is None
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    encode_cursor("Pie", uuid.uuid4())[:-3],
+    raw_cursor(["Pie"]),
+    raw_cursor(["Pie", str(uuid.uuid4()), "extra"]),
+    raw_cursor(["Pie", "not-a-uuid"]),
+    raw_cursor(["Pie", 42]),
+    raw_cursor([None, str(uuid.uuid4())]),
+    raw_cursor([True, str(uuid.uuid4())]),
+    raw_cursor([["Pie"], str(uuid.uuid4())]),
+    raw_cursor({"key": "Pie"}),
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+])
+def test_tampered_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as rejected:
+        decode_cursor(cursor, str)
+    assert rejected.value.status_code == 400
+
+@pytest.mark.parametrize("key", ["high", "NaN", "Infinity"])
+def test_score_cursor_needs_a_finite_number(key):
+    cursor = base64.urlsafe_b64encode(f'[{json.dumps(key) if key == "high" else key}, "{uuid.uuid4()}"]'.encode()).decode()
+    with pytest.raises(HTTPException):
+        decode_cursor(cursor, float)
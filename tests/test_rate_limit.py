@@ -0,0 +1,78 @@
+import uuid
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from app import rate_limit
+from app.models import User
+from app.rate_limit import MemoryRateLimiter, RateLimit, rate_limit_headers
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+def test_burst_then_refill(clock):
+    limiter = MemoryRateLimiter(rate=10, burst=5)
+    assert [limiter.check("alice")[0] for _ in range(6)] == [True] * 5 + [False]
+    # One token comes back every 1 / rate seconds
+    clock[0] += 0.1
+    assert limiter.check("alice")[0]
+    assert not limiter.check("alice")[0]
+    # Buckets are per key
+    assert limiter.check("bob")[0]
+
+def test_wait_until_full(clock):
+    limiter = MemoryRateLimiter(rate=10, burst=5)
+    assert limiter.check("alice") == (True, pytest.approx(0.1))
+    assert limiter.check("alice", cost=3) == (True, pytest.approx(0.4))
+    # Refused requests take nothing from the bucket
+    assert limiter.check("alice", cost=2) == (False, pytest.approx(0.4))
+    clock[0] += 0.4
+    assert limiter.check("alice", cost=5) == (True, pytest.approx(0.5))
+
+def test_full_buckets_are_swept(clock):
+    limiter = MemoryRateLimiter(rate=10, burst=5, max_size=2)
+    limiter.check("a")
+    limiter.check("b")
+    clock[0] += 1
+    limiter.check("c")
+    assert len(limiter) == 1
+
+def test_headers(clock):
+    limiter = MemoryRateLimiter(rate=10, burst=50)
+    assert rate_limit_headers(limiter, 0.0) == {
+        "RateLimit-Limit": "50", "RateLimit-Remaining": "50", "RateLimit-Reset": "0", "RateLimit-Policy": "50;w=5"}
+    assert rate_limit_headers(limiter, 0.25)["RateLimit-Remaining"] == "47"
+    assert rate_limit_headers(limiter, 0.25)["RateLimit-Reset"] == "1"
+    assert rate_limit_headers(limiter, 5.0)["RateLimit-Remaining"] == "0"
+
+@pytest.mark.anyio
+async def test_dependency_sets_headers_and_retry_after(clock):
+    limiter = MemoryRateLimiter(rate=1, burst=2)
+    dependency = RateLimit(cost=1, limiter=limiter)
+    user = User(id=uuid.uuid4(), email="frodo@shire.me")
+    request = SimpleNamespace(state=SimpleNamespace())
+    assert await dependency(request, user) is user
+    assert request.state.rate_limit["RateLimit-Remaining"] == "1"
+    await dependency(request, user)
+    with pytest.raises(HTTPException) as refused:
+        await dependency(request, user)
+    assert refused.value.status_code == 429
+    assert refused.value.headers["Retry-After"] == "1"
+    assert refused.value.headers["RateLimit-Remaining"] == "0"
+
+@pytest.mark.anyio
+async def test_cost_above_burst_is_capped(clock):
+    limiter = MemoryRateLimiter(rate=1, burst=2)
+    user = User(id=uuid.uuid4(), email="frodo@shire.me")
+    request = SimpleNamespace(state=SimpleNamespace())
+    await RateLimit(cost=25, limiter=limiter)(request, user)
+    with pytest.raises(HTTPException) as refused:
+        await RateLimit(cost=25, limiter=limiter)(request, user)
+    # The capped cost of 2 needs the whole bucket back
+    assert refused.value.headers["Retry-After"] == "2"
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+import uuid
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.database import DATABASE_URL
+from app.models import Dish
+from app.repositories import DishRepository
+from app.search_index import DISH_CHANNEL, DishChangeListener, DishSearchIndex, Term, float4, parse_tsquery, parse_tsvector, query_terms, tokenize, trigrams, word_similarity
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples", "dishes.json")
+QUERIES = ["stew", "bread", "lembas", "mushroom pie", "pie", "potato", "po", "beef stew", "elven waybread",
+           "hobbit favorite", "sauce", "lembs", "mushrom", "the", "ale & pork", "crème-brûlée", "o'brien", "stews"]
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def dish(name: str, description: str = "") -> Dish:
+    return Dish(name=name, description=description, price=1.0)
+
+def test_parse_tsvector():
+    assert parse_tsvector("'bread':2A,5B 'lemba':1A 'o''brien':3 'x':7") == {
+        "bread": [(2, 3), (5, 2)], "lemba": [(1, 3)], "o'brien": [(3, 0)], "x": [(7, 0)]}
+
+def test_parse_tsquery():
+    assert parse_tsquery("'beef':* & 'stew':*") == (Term("beef", True), Term("stew", True))
+    assert parse_tsquery("'o''brien'") == (Term("o'brien", False),)
+    assert parse_tsquery("") == ()
+    # Phrases and disjunctions are left to Postgres
+    assert parse_tsquery("'crème':* <-> 'brûlée':*") is None
+    assert parse_tsquery("'ale' | 'pork'") is None
+
+def test_query_terms():
+    pytest.importorskip("snowballstemmer")
+    assert query_terms("The Beef Stews") == (Term("beef", True), Term("stew", True))
+    assert query_terms("the") == ()
+    assert query_terms("crème-brûlée") is None
+    assert query_terms("o'brien") == (Term("o", True), Term("brien", True))
+    assert query_terms("2 pies") is None
+
+@pytest.mark.anyio
+async def test_query_terms_agree_with_postgres():
+    pytest.importorskip("snowballstemmer")
+    db_engine = create_async_engine(DATABASE_URL)
+    repository = DishRepository(db_engine)
+    with open(EXAMPLES) as f:
+        words = {word for example in json.load(f) for word in tokenize(f"{example['name']} {example['description']}")}
+    try:
+        for query in QUERIES + sorted(words):
+            terms = query_terms(query)
+            if terms is not None:
+                assert terms == parse_tsquery(await repository.search_terms(query)), query
+    except (OSError, ConnectionError) as e:
+        pytest.skip(f"Postgres is not reachable: {e}")
+    finally:
+        await db_engine.dispose()
+
+def test_word_similarity():
+    # The example of the pg_trgm documentation
+    assert word_similarity(set(trigrams("word")), trigrams("two words")) == float4(0.8)
+    assert word_similarity(set(trigrams("stew")), trigrams("Hobbiton Beef Stew")) == 1.0
+    assert word_similarity(set(trigrams("stew")), trigrams("Lembas Bread")) == 0.0
+
+def test_search_ranks_and_pages():
+    index = DishSearchIndex()
+    tenant_id = uuid.uuid4()
+    stew, bread = dish("Beef Stew"), dish("Lembas Bread")
+    index.build([(stew.model_copy(update={"tenant_id": tenant_id}), "'beef':1A 'stew':2A"),
+                 (bread.model_copy(update={"tenant_id": tenant_id}), "'bread':2A 'lemba':1A")])
+    results = index.search(tenant_id, "stew", (Term("stew", True),))
+    assert [result.id for result in results] == [stew.id]
+    # ts_rank_cd of one A lexeme plus a whole-word trigram match
+    assert results[0].score == float4(1.0 + 1.0)
+    assert index.search(tenant_id, "stew", (Term("stew", True),), after=(results[0].score, results[0].id)) == []
+    assert index.search(tenant_id, "the", ()) == []
+
+def test_oversized_tenant_does_not_disable_others():
+    index = DishSearchIndex(max_dishes=1)
+    small, large = uuid.uuid4(), uuid.uuid4()
+    index.build([(dish("Stew").model_copy(update={"tenant_id": small}), "'stew':1A")] +
+                [(dish(f"Pie {i}").model_copy(update={"tenant_id": large}), "'pie':1A") for i in range(2)])
+    assert index.covers(small)
+    assert not index.covers(large)
+    index.upsert(small, dish("Bread"), "'bread':1A")
+    assert not index.covers(small)
+
+@pytest.mark.anyio
+async def test_index_agrees_with_sql_search():
+    db_engine = create_async_engine(DATABASE_URL)
+    try:
+        async with db_engine.connect() as conn:
+            if not (await conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))).first():
+                pytest.skip("pg_trgm is not installed")
+    except (OSError, ConnectionError) as e:
+        await db_engine.dispose()
+        pytest.skip(f"Postgres is not reachable: {e}")
+    repository = DishRepository(db_engine)
+    async with db_engine.begin() as conn:
+        tenant_id = (await conn.execute(text("INSERT INTO tenant (slug, name) VALUES (:slug, 'Search test') RETURNING id"),
+                                        {"slug": f"search-test-{uuid.uuid4().hex[:12]}"})).scalar()
+    try:
+        with open(EXAMPLES) as f:
+            examples = json.load(f)
+        for example in examples + [{**example, "name": f"{example['name']} {i}"} for i, example in enumerate(examples)]:
+            await repository.add(tenant_id, Dish(**{**example, "image": None}))
+        index = DishSearchIndex()
+        index.build(document for document in await repository.search_documents() if document[0].tenant_id == tenant_id)
+        for query in QUERIES:
+            terms = parse_tsquery(await repository.search_terms(query))
+            if terms is None:
+                continue
+            expected = await repository.search(tenant_id, query)
+            actual = index.search(tenant_id, query, terms)
+            assert [(d.id, d.score) for d in actual] == [(d.id, d.score) for d in expected], query
+            # A cursor issued by either path continues on the other
+            if len(expected) > 2:
+                after = (expected[1].score, expected[1].id)
+                assert [d.id for d in index.search(tenant_id, query, terms, limit=3, after=after)] == \
+                       [d.id for d in await repository.search(tenant_id, query, limit=3, after=after)], query
+    finally:
+        async with db_engine.begin() as conn:
+            await conn.execute(text("DELETE FROM dish WHERE tenant_id = :id"), {"id": tenant_id})
+            await conn.execute(text("DELETE FROM tenant WHERE id = :id"), {"id": tenant_id})
+        await db_engine.dispose()
+
+@pytest.mark.anyio
+async def test_listener_coalesces_changes_per_tenant():
+    batches = []
+
+    async def on_change(tenant_id, changes):
+        batches.append((tenant_id, changes))
+
+    async def on_reconnect():
+        pass
+
+    listener = DishChangeListener("postgresql://unused", on_change=on_change, on_reconnect=on_reconnect, coalesce_delay=0.01)
+    tenant, other = uuid.uuid4(), uuid.uuid4()
+    dishes = [uuid.uuid4() for _ in range(3)]
+    for op, tenant_id, dish_id in [("INSERT", tenant, dishes[0]), ("UPDATE", tenant, dishes[1]), ("INSERT", other, dishes[2]),
+                                   ("DELETE", tenant, dishes[0])]:
+        listener._notify(None, 0, DISH_CHANNEL, json.dumps({"op": op, "tenant_id": str(tenant_id), "id": str(dish_id)}))
+    listener._notify(None, 0, DISH_CHANNEL, "not json")
+    await asyncio.sleep(0.05)
+    assert sorted(batches, key=lambda batch: batch[0] != tenant) == [
+        (tenant, {dishes[0]: "DELETE", dishes[1]: "UPDATE"}), (other, {dishes[2]: "INSERT"})]
+    await listener.stop()